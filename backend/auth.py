@@ -1,15 +1,22 @@
+import asyncio
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
 import models
 import schemas
-from database import SessionLocal
+from database import get_async_db
+from ttl_cache import TTLCache
 
 # to get a string like this run:
 # openssl rand -hex 32
@@ -17,15 +24,35 @@ SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Bearer token for /metrics and the /internal endpoints; unset disables them
+OPS_TOKEN = os.getenv("OPS_TOKEN")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt releases the GIL, so a small dedicated thread pool keeps hashing
+# off the event loop and caps how many CPUs a login storm can take
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# Seconds a hashing job may take, waiting for a worker included, before it is rejected
+PASSWORD_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", 5))
+
+password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password"
+)
+
+class PasswordQueueTimeout(Exception):
+    """A hashing job did not finish within PASSWORD_QUEUE_TIMEOUT"""
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Resolved principals keyed by (username, token iat), so authenticated
+# requests do not look the user up on every call
+principal_cache = TTLCache(
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+)
+
+# The password hash stays out of the cache, no request needs it
+_PRINCIPAL_FIELDS = ("id", "username", "email", "is_active", "created_at")
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -33,17 +60,39 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def _run_on_password_pool(function, *args):
+    """
+    function(*args) on the password pool. A job still waiting for a worker
+    after PASSWORD_QUEUE_TIMEOUT is cancelled, so a saturated pool sheds
+    new work instead of queueing it without bound.
+    """
+    job = password_executor.submit(function, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(job), PASSWORD_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        job.cancel()
+        raise PasswordQueueTimeout()
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the password pool, without blocking the event loop"""
+    return await _run_on_password_pool(verify_password, plain_password, hashed_password)
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_password_hash_async(password):
+    """get_password_hash on the password pool, without blocking the event loop"""
+    return await _run_on_password_pool(get_password_hash, password)
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    return await db.scalar(select(models.User).where(models.User.username == username))
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    """
+    The user with these credentials, or False. The lookup goes through the
+    async session and the bcrypt check runs on the password pool.
+    """
+    user = await get_user_by_username_async(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
@@ -53,11 +102,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def user_from_token(db: AsyncSession, token: str):
+    """
+    The user a bearer token belongs to, as a fresh detached instance.
+    Raises a 401 HTTPException for invalid tokens and unknown users.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -72,12 +125,59 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+    cache_key = (token_data.username, payload.get("iat"))
+    principal = principal_cache.get(cache_key)
+    if principal is None:
+        user = await get_user_by_username_async(db, token_data.username)
+        if user is None:
+            raise credentials_exception
+        principal = {field: getattr(user, field) for field in _PRINCIPAL_FIELDS}
+        principal_cache.put(cache_key, principal)
+
+    # A fresh detached instance per request: never expired by another
+    # request's commit and never shared between sessions
+    return models.User(**principal)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await user_from_token(db, token)
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+def require_ops_token(authorization: Optional[str] = Header(None)):
+    """
+    Admit operators and scrapers presenting OPS_TOKEN as a bearer token.
+    A user's access token is not enough, the data is about the whole server.
+    """
+    if not OPS_TOKEN or not hmac.compare_digest(
+        (authorization or "").encode(), f"Bearer {OPS_TOKEN}".encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operator token required")
+
+def invalidate_principal(username: str):
+    """Forget every cached principal of a user, whatever token it came from"""
+    principal_cache.discard_matching(lambda key: key[0] == username)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _queue_principal_invalidation(mapper, connection, user):
+    # Old and new username, applied once the change is committed
+    history = inspect(user).attrs.username.history
+    usernames = {user.username, *history.deleted}
+    session = object_session(user)
+    if session is not None:
+        session.info.setdefault("changed_principals", set()).update(usernames)
+    else:
+        for username in usernames:
+            invalidate_principal(username)
+
+@event.listens_for(Session, "after_commit")
+def _apply_principal_invalidation(session):
+    for username in session.info.pop("changed_principals", ()):
+        invalidate_principal(username)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_principal_invalidation(session):
+    session.info.pop("changed_principals", None)
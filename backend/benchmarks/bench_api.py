@@ -0,0 +1,256 @@
+"""
+API benchmark suite: latency percentiles and throughput of the main
+endpoints against diagrams of 10, 1k and 10k tables.
+
+    python benchmarks/bench_api.py --output results.json
+    python benchmarks/bench_api.py --database-url postgresql://user:pw@localhost/bench
+    python benchmarks/bench_api.py --baseline results.json --max-regression 0.25
+
+Seeds synthetic users, a collaborator list and one diagram per size (tables
+of 5-50 columns, fixed seed), then drives the app in-process through
+httpx's ASGI transport. Without --database-url a scratch SQLite file is
+used. With a URL, rows are added under a fresh run prefix and nothing is
+dropped.
+
+Writes one JSON document (stdout, or --output). With --baseline, p95
+latencies are compared against an earlier document and the exit status is
+1 if any endpoint got slower by more than --max-regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PASSWORD = "bench-password"
+TYPES = ["integer", "bigint", "text", "boolean", "numeric(12, 2)", "varchar(255)", "timestamptz", "jsonb"]
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summary(samples, errors, elapsed):
+    if not samples:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def seed(prefix, sizes, collaborators, rng):
+    """Owner, collaborators and one diagram per size. Returns (owner name, {size: diagram id})."""
+    import auth
+    import bulk
+    import history
+    import models
+    from database import SessionLocal
+    from sql_import import ParsedColumn, ParsedTable
+
+    hashed = auth.get_password_hash(PASSWORD)
+    with SessionLocal() as db:
+        owner = models.User(username=f"{prefix}owner", email=f"{prefix}owner@example.com", hashed_password=hashed)
+        db.add(owner)
+        db.flush()
+
+        diagram_ids = {}
+        for size in sizes:
+            diagram = models.Diagram(name=f"{prefix}{size}", owner_id=owner.id)
+            db.add(diagram)
+            db.flush()
+            tables = [
+                ParsedTable(
+                    name=f"tabel_{t}",
+                    x_position=(t % 20) * 300,
+                    y_position=(t // 20) * 300,
+                    columns=[ParsedColumn("id", "bigint", True, False)] + [
+                        ParsedColumn(f"kolom_{c}", rng.choice(TYPES), False, rng.random() < 0.7)
+                        for c in range(rng.randint(4, 49))
+                    ]
+                ) for t in range(size)
+            ]
+            bulk.insert_tables(db, diagram.id, tables)
+            # Seeded state is revision 1; without a snapshot the first write
+            # would pay for a baseline one
+            db.add(models.DiagramSnapshot(
+                diagram_id=diagram.id, revision=1, payload=history.snapshot_payload(db, diagram.id)
+            ))
+
+            for c in range(collaborators):
+                user = models.User(
+                    username=f"{prefix}c{size}_{c}", email=f"{prefix}c{size}_{c}@example.com", hashed_password=hashed
+                )
+                db.add(user)
+                db.flush()
+                db.add(models.DiagramCollaboration(
+                    diagram_id=diagram.id, user_id=user.id, permission_level=models.PermissionLevel.VIEW
+                ))
+            diagram_ids[size] = diagram.id
+        db.commit()
+    return f"{prefix}owner", diagram_ids
+
+async def measure(make_request, count, concurrency):
+    """Run make_request(i) count times, at most concurrency at once"""
+    samples = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await make_request(i)
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return summary(samples, errors, time.perf_counter() - started)
+
+async def run(args):
+    import httpx
+
+    from database import Base, engine
+    from export_cache import cache as export_cache
+    from main import app
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(args.seed)
+    prefix = f"b{int(time.time())}_"
+    seed_started = time.perf_counter()
+    owner, diagram_ids = seed(prefix, args.sizes, args.collaborators, rng)
+    seed_seconds = time.perf_counter() - seed_started
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        login = await measure(
+            lambda i: client.post("/token", data={"username": owner, "password": PASSWORD}),
+            args.login_requests, args.concurrency
+        )
+        token = (await client.post("/token", data={"username": owner, "password": PASSWORD})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        # Login cost does not depend on diagram size
+        results = [{"tables": None, "endpoints": {"login": login}}]
+
+        for size in args.sizes:
+            diagram_id = diagram_ids[size]
+            endpoints = {}
+            endpoints["list"] = await measure(
+                lambda i: client.get("/diagrams/?view=summary&limit=20", headers=headers),
+                args.requests, args.concurrency
+            )
+            endpoints["collaborators"] = await measure(
+                lambda i: client.get(f"/diagrams/{diagram_id}/collaborators", headers=headers),
+                args.requests, args.concurrency
+            )
+
+            async def export(i):
+                # Cold: the export cache would otherwise answer every repeat
+                export_cache.clear()
+                return await client.get(f"/diagrams/{diagram_id}/export", headers=headers)
+
+            export_requests = max(1, args.requests // 10) if size >= 10000 else args.requests
+            endpoints["export"] = await measure(export, export_requests, 1)
+            endpoints["export_cached"] = await measure(
+                lambda i: client.get(f"/diagrams/{diagram_id}/export", headers=headers),
+                args.requests, args.concurrency
+            )
+            endpoints["create_table"] = await measure(
+                lambda i: client.post(
+                    f"/diagrams/{diagram_id}/tables/",
+                    json={
+                        "name": f"bench_{i}",
+                        "columns": [{"name": f"kolom_{c}", "data_type": "text"} for c in range(10)]
+                    },
+                    headers=headers
+                ),
+                args.requests, args.concurrency
+            )
+            results.append({"tables": size, "endpoints": endpoints})
+
+    return {
+        "benchmark": "api",
+        "database": engine.dialect.name,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "concurrency": args.concurrency,
+        "seed_seconds": round(seed_seconds, 2),
+        "results": results,
+    }
+
+def regressions(current, baseline, max_regression):
+    """(tables, endpoint, baseline p95, current p95) for every p95 that got too much slower"""
+    previous = {
+        (result["tables"], name): stats.get("p95_ms")
+        for result in baseline["results"] for name, stats in result["endpoints"].items()
+    }
+    found = []
+    for result in current["results"]:
+        for name, stats in result["endpoints"].items():
+            before = previous.get((result["tables"], name))
+            after = stats.get("p95_ms")
+            if before and after and after > before * (1 + max_regression):
+                found.append((result["tables"], name, before, after))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,10000", help="comma separated table counts")
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint and size")
+    parser.add_argument("--login-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--collaborators", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix="bench-api-")
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("OUTBOX_WORKER", "0")
+
+    report = asyncio.run(run(args))
+    document = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(document + "\n")
+    else:
+        print(document)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            slower = regressions(report, json.load(baseline), args.max_regression)
+        for tables, name, before, after in slower:
+            print(f"REGRESSION {name} @ {tables} tables: p95 {before} ms -> {after} ms", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
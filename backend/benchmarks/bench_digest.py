@@ -0,0 +1,105 @@
+"""
+Benchmark notification digest coalescing at a sustained event rate.
+
+    python benchmarks/bench_digest.py --events 10000 --minutes 1
+
+Replays the events on a simulated clock spread evenly over the given
+minutes, flushing like the background thread does, and delivers digests to
+the email outbox of a scratch SQLite database. Prints one JSON object with
+throughput, the number of emails that came out and peak traced memory.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ACTIONS = ["table_changed", "table_moved", "column_added", "column_changed"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--minutes", type=float, default=1)
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--diagrams", type=int, default=20)
+    parser.add_argument("--actors", type=int, default=8)
+    parser.add_argument("--window", type=float, default=60)
+    parser.add_argument("--flush-every", type=float, default=5)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-digest-")
+    os.environ.setdefault(
+        "DATABASE_URL", args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    )
+    os.environ.setdefault("OUTBOX_WORKER", "0")
+
+    import digest
+    import models
+    from database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+
+    rng = random.Random(0)
+    events = [
+        (
+            f"user{rng.randrange(args.recipients)}@example.com",
+            rng.randrange(args.diagrams),
+            f"actor{rng.randrange(args.actors)}",
+            rng.choice(ACTIONS)
+        ) for _ in range(args.events)
+    ]
+
+    now = [0.0]
+    aggregator = digest.NotificationDigest(window=args.window, clock=lambda: now[0])
+    step = args.minutes * 60 / max(args.events, 1)
+    next_flush = args.flush_every
+    record_seconds = 0.0
+    flush_seconds = 0.0
+    digests = 0
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for recipient, diagram_id, actor, action in events:
+        now[0] += step
+        t = time.perf_counter()
+        aggregator.record(recipient, diagram_id, f"Diagram {diagram_id}", actor, action)
+        record_seconds += time.perf_counter() - t
+        if now[0] >= next_flush:
+            t = time.perf_counter()
+            digests += aggregator.flush()
+            flush_seconds += time.perf_counter() - t
+            next_flush += args.flush_every
+    t = time.perf_counter()
+    digests += aggregator.flush(force=True)
+    flush_seconds += time.perf_counter() - t
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with SessionLocal() as db:
+        emails = db.query(models.EmailOutbox).count()
+
+    print(json.dumps({
+        "benchmark": "notification_digest",
+        "database": engine.dialect.name,
+        "events": args.events,
+        "simulated_minutes": args.minutes,
+        "digests": digests,
+        "outbox_emails": emails,
+        "events_per_email": round(args.events / max(emails, 1), 1),
+        "record_us_per_event": round(record_seconds / max(args.events, 1) * 1e6, 2),
+        "flush_seconds": round(flush_seconds, 3),
+        "seconds": round(elapsed, 3),
+        "max_events_per_second": round(args.events / max(elapsed, 1e-9)),
+        "peak_traced_mb": round(peak / 2 ** 20, 2),
+    }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark the streaming SQL importer on a generated pg_dump-style file.
+
+    python benchmarks/bench_sql_import.py --tables 10000
+
+Prints one JSON object with the dump size, elapsed time and peak RSS.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TYPES = [
+    "integer", "bigint", "text", "boolean", "numeric(12, 2)",
+    "character varying(255)", "timestamp with time zone", "jsonb", "uuid"
+]
+
+def write_dump(path, tables, seed=0):
+    """Write a --schema-only style dump with tables of 5-50 columns"""
+    rng = random.Random(seed)
+    with open(path, "w") as dump:
+        dump.write("--\n-- PostgreSQL database dump\n--\n\nSET statement_timeout = 0;\n\n")
+        for t in range(tables):
+            columns = ["    id bigint NOT NULL"] + [
+                f"    kolom_{c} {rng.choice(TYPES)}{' NOT NULL' if rng.random() < 0.3 else ''}"
+                for c in range(rng.randint(4, 49))
+            ]
+            dump.write(f"--\n-- Name: tabel_{t}; Type: TABLE; Schema: public\n--\n\n")
+            dump.write(f"CREATE TABLE public.tabel_{t} (\n" + ",\n".join(columns) + "\n);\n\n")
+        for t in range(tables):
+            dump.write(
+                f"ALTER TABLE ONLY public.tabel_{t}\n"
+                f"    ADD CONSTRAINT tabel_{t}_pkey PRIMARY KEY (id);\n\n"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tables", type=int, default=10000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-import-")
+    os.environ.setdefault(
+        "DATABASE_URL", args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    )
+
+    import models
+    import sql_import
+    from database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    dump_path = os.path.join(workdir, "dump.sql")
+    write_dump(dump_path, args.tables)
+
+    db = SessionLocal()
+    owner = models.User(username="bench", email="bench@example.com", hashed_password="-")
+    db.add(owner)
+    db.flush()
+    diagram = models.Diagram(name="bench", owner_id=owner.id)
+    db.add(diagram)
+    db.commit()
+
+    started = time.perf_counter()
+    with open(dump_path, "rb") as dump:
+        table_count, column_count = sql_import.import_sql_dump(db, diagram.id, dump)
+    db.commit()
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "benchmark": "sql_import",
+        "database": engine.dialect.name,
+        "dump_bytes": os.path.getsize(dump_path),
+        "tables": table_count,
+        "columns": column_count,
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+if __name__ == "__main__":
+    main()
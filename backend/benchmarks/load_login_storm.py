@@ -0,0 +1,123 @@
+"""
+Load test: latency of a cheap authenticated endpoint during a login storm.
+
+    python benchmarks/load_login_storm.py --logins 200 --concurrency 50
+
+Drives the app in-process through httpx's ASGI transport, so anything that
+blocks the event loop shows up directly in the probe latencies. Pass
+--inline-bcrypt to verify passwords on the event loop as the API used to,
+for comparison. Prints one JSON object with p50/p99 before and during the
+storm.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PASSWORD = "storm-password"
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summary(samples):
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+    }
+
+async def probe(client, headers, stop, samples, interval):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/users/me", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+async def run(args):
+    import httpx
+
+    import auth
+    import models
+    from database import Base, SessionLocal, engine
+    from main import app
+
+    if args.inline_bcrypt:
+        async def verify_inline(plain_password, hashed_password):
+            return auth.verify_password(plain_password, hashed_password)
+        auth.verify_password_async = verify_inline
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(
+        username="storm", email="storm@example.com",
+        hashed_password=auth.get_password_hash(PASSWORD)
+    )
+    db.add(user)
+    db.commit()
+    db.close()
+    headers = {"Authorization": f"Bearer {auth.create_access_token(data={'sub': 'storm'})}"}
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        # Warm the principal cache
+        await client.get("/users/me", headers=headers)
+
+        baseline = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, headers, stop, baseline, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await prober
+
+        during = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, headers, stop, during, args.interval))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        statuses = {}
+
+        async def login():
+            async with semaphore:
+                response = await client.post(
+                    "/token", data={"username": "storm", "password": PASSWORD}
+                )
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        storm_seconds = time.perf_counter() - started
+        stop.set()
+        await prober
+
+    print(json.dumps({
+        "benchmark": "login_storm",
+        "inline_bcrypt": args.inline_bcrypt,
+        "password_workers": auth.PASSWORD_HASH_WORKERS,
+        "logins": args.logins,
+        "login_statuses": statuses,
+        "storm_seconds": round(storm_seconds, 3),
+        "baseline": summary(baseline),
+        "during_storm": summary(during),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.005)
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    parser.add_argument("--inline-bcrypt", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-login-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Load test of one collaboration room: many WebSocket clients on a single
+diagram while an editor drags tables around.
+
+    python benchmarks/load_ws_room.py --clients 500 --moves 2000
+
+Starts the app under uvicorn on a free local port (scratch SQLite database
+unless --database-url is given), seeds an owner, one viewer per client and
+a diagram, connects every client and has the owner drag tables one after
+another at --rate moves per second. Prints one JSON object with connect
+time, fan-out latency percentiles (send to receipt by every client) and how
+many position rows the hub actually wrote for the moves it got. The clients
+run in this process, so at high rates the numbers include the load
+generator's own CPU time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def seed(clients, tables):
+    """Owner, viewers and a diagram. Returns (diagram id, table ids, owner token, viewer tokens)."""
+    import auth
+    import models
+    from database import SessionLocal
+
+    prefix = f"ws{int(time.time())}_"
+    # Nobody logs in with these, so one hash does for everyone
+    hashed = auth.get_password_hash("load-test")
+    with SessionLocal() as db:
+        owner = models.User(username=f"{prefix}owner", email=f"{prefix}owner@example.com", hashed_password=hashed)
+        viewers = [
+            models.User(username=f"{prefix}v{i}", email=f"{prefix}v{i}@example.com", hashed_password=hashed)
+            for i in range(clients)
+        ]
+        db.add_all([owner, *viewers])
+        db.flush()
+        diagram = models.Diagram(name=f"{prefix}room", owner_id=owner.id)
+        db.add(diagram)
+        db.flush()
+        rows = [models.Table(name=f"tabel_{t}", diagram_id=diagram.id, x_position=0, y_position=0) for t in range(tables)]
+        db.add_all(rows)
+        db.add_all([
+            models.DiagramCollaboration(
+                diagram_id=diagram.id, user_id=viewer.id, permission_level=models.PermissionLevel.VIEW
+            ) for viewer in viewers
+        ])
+        db.commit()
+        return (
+            diagram.id,
+            [row.id for row in rows],
+            auth.create_access_token({"sub": owner.username}),
+            [auth.create_access_token({"sub": viewer.username}) for viewer in viewers],
+        )
+
+def serve(port):
+    import uvicorn
+
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, ws="websockets", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+async def run(args, url, diagram_id, table_ids, owner_token, viewer_tokens):
+    import websockets
+
+    sent_at = {}
+    latencies = []
+    received = 0
+    expected = args.moves * len(viewer_tokens)
+    done = asyncio.Event()
+
+    async def listen(connection):
+        nonlocal received
+        async for text in connection:
+            message = json.loads(text)
+            if message["type"] != "move":
+                continue
+            latencies.append(time.perf_counter() - sent_at[message["x"]])
+            received += 1
+            if received == expected:
+                done.set()
+
+    # Joins are ramped; a real room fills up over seconds, not in one burst
+    joining = asyncio.Semaphore(args.connect_concurrency)
+
+    async def join(token):
+        async with joining:
+            connection = await websockets.connect(f"{url}?token={token}", max_queue=None, open_timeout=60)
+            json.loads(await connection.recv())
+            return connection
+
+    connect_started = time.perf_counter()
+    viewers = await asyncio.gather(*(join(token) for token in viewer_tokens))
+    connect_seconds = time.perf_counter() - connect_started
+    listeners = [asyncio.create_task(listen(connection)) for connection in viewers]
+
+    async with websockets.connect(f"{url}?token={owner_token}") as owner:
+        send_started = time.perf_counter()
+        for move in range(args.moves):
+            sent_at[move] = time.perf_counter()
+            await owner.send(json.dumps({
+                "type": "move", "table_id": table_ids[move // args.drag_length % len(table_ids)], "x": move, "y": move
+            }))
+            await asyncio.sleep(1 / args.rate)
+        try:
+            await asyncio.wait_for(done.wait(), args.drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - send_started
+
+    for connection in viewers:
+        await connection.close()
+    for listener in listeners:
+        listener.cancel()
+
+    return {
+        "connect_seconds": round(connect_seconds, 3),
+        "messages_expected": expected,
+        "messages_received": received,
+        "delivered_per_second": round(received / elapsed),
+        "fanout_p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "fanout_p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "fanout_p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--moves", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=30, help="moves per second sent by the owner")
+    parser.add_argument("--drag-length", type=int, default=30, help="consecutive moves of one table")
+    parser.add_argument("--connect-concurrency", type=int, default=50)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load-ws-")
+    os.environ.setdefault(
+        "DATABASE_URL", args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    )
+    os.environ.setdefault("OUTBOX_WORKER", "0")
+
+    from collab_hub import hub
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    diagram_id, table_ids, owner_token, viewer_tokens = seed(args.clients, args.tables)
+    port = free_port()
+    server, thread = serve(port)
+    try:
+        report = asyncio.run(run(
+            args, f"ws://127.0.0.1:{port}/ws/diagrams/{diagram_id}",
+            diagram_id, table_ids, owner_token, viewer_tokens
+        ))
+    finally:
+        # Rooms flush their last positions when the final client leaves
+        deadline = time.monotonic() + 10
+        while hub.rooms and time.monotonic() < deadline:
+            time.sleep(0.05)
+        server.should_exit = True
+        thread.join()
+
+    print(json.dumps({
+        "benchmark": "websocket_room",
+        "database": engine.dialect.name,
+        "clients": args.clients,
+        "moves": args.moves,
+        **report,
+        "position_flushes": hub.stats["position_flushes"],
+        "position_rows": hub.stats["position_rows"],
+        "moves_per_position_row": round(hub.stats["moves"] / max(hub.stats["position_rows"], 1), 1),
+        "dropped_clients": hub.stats["dropped_clients"],
+    }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+from fingerprints import table_create_fingerprints
+
+# Upper bound on column rows written per INSERT round
+BATCH_CHUNK_ROWS = 5000
+# Upper bound on table rows per INSERT round; tables without columns
+# never fill BATCH_CHUNK_ROWS
+BATCH_CHUNK_TABLES = 1000
+
+# Keeps IN lists below SQLite's bound parameter limit
+ID_CHUNK = 500
+
+def chunk_tables(tables, max_rows, max_tables):
+    """
+    Split tables into chunks holding at most max_rows columns and
+    max_tables tables each. A table with more columns than max_rows gets
+    a chunk of its own.
+    """
+    chunk = []
+    rows = 0
+    for table in tables:
+        if chunk and (rows + len(table.columns) > max_rows or len(chunk) >= max_tables):
+            yield chunk
+            chunk = []
+            rows = 0
+        chunk.append(table)
+        rows += len(table.columns)
+    if chunk:
+        yield chunk
+
+def insert_tables(db: Session, diagram_id: int, tables, log=None):
+    """
+    Insert tables and their columns with set-based statements, chunked by
+    BATCH_CHUNK_ROWS and BATCH_CHUNK_TABLES. Does not commit. Every chunk
+    is added to log, a history.OperationLog, when given.
+    Returns (table ids in payload order, number of columns written).
+    """
+    table_ids = []
+    column_count = 0
+    for chunk in chunk_tables(tables, BATCH_CHUNK_ROWS, BATCH_CHUNK_TABLES):
+        hashes = [table_create_fingerprints(table) for table in chunk]
+
+        # Multi-row INSERT ... RETURNING; the ids are put in payload order
+        # by the backend-specific branch below. Core statements skip the
+        # ORM's per-row bulk bookkeeping.
+        tables_table = models.Table.__table__
+        rows = [
+            {
+                "name": table.name,
+                "diagram_id": diagram_id,
+                "x_position": table.x_position,
+                "y_position": table.y_position,
+                "fingerprint": table_hash
+            } for table, (table_hash, _) in zip(chunk, hashes)
+        ]
+        if db.get_bind().dialect.name == "sqlite":
+            # SQLAlchemy can only keep RETURNING in parameter order on SQLite
+            # by inserting row by row; rowids of one multi-row INSERT ascend
+            # in VALUES order, so sorting the returned ids restores it
+            ids = sorted(db.scalars(insert(tables_table).returning(tables_table.c.id), rows).all())
+        else:
+            # PostgreSQL matches the ids to parameter rows in one statement
+            ids = db.scalars(
+                insert(tables_table).returning(tables_table.c.id, sort_by_parameter_order=True), rows
+            ).all()
+
+        column_rows = [
+            {
+                "name": column.name,
+                "data_type": column.data_type,
+                "is_primary_key": column.is_primary_key,
+                "is_nullable": column.is_nullable,
+                "table_id": table_id,
+                "fingerprint": column_hash
+            }
+            for table_id, table, (_, column_hashes) in zip(ids, chunk, hashes)
+            for column, column_hash in zip(table.columns, column_hashes)
+        ]
+        if column_rows:
+            db.execute(insert(models.Column.__table__), column_rows)
+
+        if log is not None:
+            log.tables_created(ids, chunk)
+        table_ids.extend(ids)
+        column_count += len(column_rows)
+
+    return table_ids, column_count
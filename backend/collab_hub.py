@@ -0,0 +1,289 @@
+import asyncio
+import json
+import logging
+import os
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, status
+
+import auth
+import collaboration
+import models
+import spatial
+from database import async_session
+from positions import record_positions, update_positions
+
+logger = logging.getLogger(__name__)
+
+# Table positions dragged over a socket are written to the database at
+# most this often; every move is still relayed to the room immediately
+POSITION_FLUSH_MS = int(os.getenv("POSITION_FLUSH_MS", 500))
+# Outgoing messages buffered per client; a client this far behind is dropped
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", 1000))
+
+# Closed because the client could not keep up with the room
+SLOW_CONSUMER_CLOSE = 1013
+# Seconds a dropped client's writer gets to send that close before it is cancelled
+DROP_CLOSE_TIMEOUT = float(os.getenv("WS_DROP_CLOSE_TIMEOUT", 1))
+
+class Client:
+    """One socket in a room, with its own outgoing queue so a slow reader never stalls the others"""
+
+    def __init__(self, websocket: WebSocket, user, permission):
+        self.websocket = websocket
+        self.user = user
+        self.permission = permission
+        self.queue = asyncio.Queue(WS_CLIENT_QUEUE_SIZE)
+        self.writer = None
+        self.dropped = False
+
+    @property
+    def can_edit(self):
+        return collaboration.allows(self.permission, models.PermissionLevel.EDIT)
+
+    async def write_loop(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                if text is None:
+                    await self.websocket.close(code=SLOW_CONSUMER_CLOSE)
+                    return
+                await self.websocket.send_text(text)
+        except Exception:
+            # The socket is gone; the reader side cleans up
+            return
+
+class Room:
+    def __init__(self, diagram_id: int):
+        self.diagram_id = diagram_id
+        self.clients = set()
+        # table id -> latest (x, y) not yet written
+        self.positions = {}
+        # user id -> (user, ids of the tables they moved) since the last write
+        self.movers = {}
+        self.flusher = None
+        # Flushes run one at a time so an older write never lands last
+        self.flush_lock = asyncio.Lock()
+
+class DiagramHub:
+    """
+    Per-diagram rooms of WebSocket clients. Rooms live in this process, so
+    a multi-worker deployment needs clients of one diagram routed to the
+    same worker.
+
+    Messages from clients:
+        {"type": "move", "table_id": 1, "x": 10, "y": 20}
+        {"type": "op", "op": {...}}    relayed as is to the rest of the room
+    Messages to clients:
+        {"type": "joined", "permission": "edit", "members": 3}
+        {"type": "presence", "user_id": 2, "joined": true, "members": 3}
+        {"type": "move" | "op", "user_id": 1, ...}
+        {"type": "table.created" | "tables.created" | "tables.moved", ...}  from REST writes
+        {"type": "relationship.created" | "relationship.deleted", ...}
+        {"type": "error", "detail": "..."}
+    """
+
+    def __init__(self, flush_interval_ms=None, session_factory=async_session):
+        self.flush_interval = (POSITION_FLUSH_MS if flush_interval_ms is None else flush_interval_ms) / 1000
+        self.session_factory = session_factory
+        self.rooms = {}
+        self.loop = None
+        self.stats = {"moves": 0, "position_flushes": 0, "position_rows": 0, "dropped_clients": 0}
+
+    def broadcast(self, diagram_id: int, message: dict, exclude: Client = None):
+        """Queue a message for every client in a room. Call on the hub's event loop."""
+        room = self.rooms.get(diagram_id)
+        if not room:
+            return
+        # Serialized once for the whole room
+        text = json.dumps(message, separators=(",", ":"))
+        for client in list(room.clients):
+            if client is exclude:
+                continue
+            try:
+                client.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self._drop(room, client)
+
+    def publish(self, diagram_id: int, message: dict):
+        """broadcast() from anywhere, including sync routes on the threadpool"""
+        loop = self.loop
+        if loop is None or diagram_id not in self.rooms:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.broadcast(diagram_id, message)
+        else:
+            loop.call_soon_threadsafe(self.broadcast, diagram_id, message)
+
+    def positions_written(self, diagram_id: int, user_id: int, positions):
+        """
+        Announce positions written outside the hub and forget older socket
+        moves of the same tables, so a later flush does not undo them
+        """
+        room = self.rooms.get(diagram_id)
+        if not room:
+            return
+        for table_id in positions:
+            room.positions.pop(table_id, None)
+        self.broadcast(diagram_id, {
+            "type": "tables.moved",
+            "user_id": user_id,
+            "positions": [{"table_id": table_id, "x": x, "y": y} for table_id, (x, y) in positions.items()]
+        })
+
+    def _drop(self, room: Room, client: Client):
+        room.clients.discard(client)
+        client.dropped = True
+        self.stats["dropped_clients"] += 1
+        # The backlog is stale once the client has to rejoin; only the close marker goes out
+        while not client.queue.empty():
+            client.queue.get_nowait()
+        client.queue.put_nowait(None)
+
+    async def flush_positions(self, room: Room):
+        """Write the latest position of every table moved since the last flush"""
+        async with room.flush_lock:
+            await self._write_positions(room)
+
+    async def _write_positions(self, room: Room):
+        pending, room.positions = room.positions, {}
+        movers, room.movers = room.movers, {}
+        if not pending:
+            return
+        try:
+            async with self.session_factory() as db:
+                if await update_positions(db, room.diagram_id, pending):
+                    # One revision per flush; several movers leave it unattributed
+                    user_id = next(iter(movers)) if len(movers) == 1 else None
+                    await record_positions(db, room.diagram_id, user_id, pending)
+                await db.commit()
+        except Exception:
+            logger.exception("Writing table positions of diagram %s failed", room.diagram_id)
+            # Keep them for the next round unless newer moves arrived
+            room.positions = {**pending, **room.positions}
+            for user_id, (user, table_ids) in movers.items():
+                room.movers.setdefault(user_id, (user, set()))[1].update(table_ids)
+            return
+        spatial.positions_changed(room.diagram_id)
+        self.stats["position_flushes"] += 1
+        self.stats["position_rows"] += len(pending)
+        await self._notify_moves(room.diagram_id, movers)
+
+    async def _notify_moves(self, diagram_id: int, movers):
+        """Count the written moves toward the collaborators' digest emails"""
+        if not movers:
+            return
+        try:
+            async with self.session_factory() as db:
+                diagram = await db.get(models.Diagram, diagram_id)
+                for user, table_ids in movers.values():
+                    await collaboration.notify_moves_async(db, diagram, user, table_ids)
+        except Exception:
+            logger.exception("Recording moves of diagram %s for digests failed", diagram_id)
+
+    async def _flush_loop(self, room: Room):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # Leaving the room cancels this loop, but not a write in progress
+            await asyncio.shield(self.flush_positions(room))
+
+    async def _authorize(self, websocket: WebSocket, diagram_id: int, token: str):
+        async with self.session_factory() as db:
+            try:
+                user = await auth.user_from_token(db, token)
+            except HTTPException:
+                return None, None
+            if not user.is_active:
+                return None, None
+            return user, await collaboration.diagram_permission_async(db, diagram_id, user.id)
+
+    async def serve(self, websocket: WebSocket, diagram_id: int, token: str):
+        """Run one client connection from join to disconnect"""
+        user, permission = await self._authorize(websocket, diagram_id, token)
+        if permission is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        await websocket.accept()
+
+        self.loop = asyncio.get_running_loop()
+        room = self.rooms.get(diagram_id)
+        if room is None:
+            room = self.rooms[diagram_id] = Room(diagram_id)
+            room.flusher = asyncio.create_task(self._flush_loop(room))
+        client = Client(websocket, user, permission)
+        client.writer = asyncio.create_task(client.write_loop())
+        room.clients.add(client)
+
+        client.queue.put_nowait(json.dumps(
+            {"type": "joined", "permission": permission.value, "members": len(room.clients)}
+        ))
+        self.broadcast(diagram_id, {
+            "type": "presence", "user_id": user.id, "joined": True, "members": len(room.clients)
+        }, exclude=client)
+
+        try:
+            while True:
+                text = await websocket.receive_text()
+                if client not in room.clients:
+                    break
+                self.handle(room, client, text)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await self._leave(room, client)
+
+    def handle(self, room: Room, client: Client, text: str):
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, TypeError, KeyError):
+            return self._error(client, "Invalid message")
+
+        if kind not in ("move", "op"):
+            return self._error(client, f"Unknown message type {kind!r}")
+        if not client.can_edit:
+            return self._error(client, "Read-only access to this diagram")
+
+        if kind == "move":
+            try:
+                table_id, x, y = int(message["table_id"]), int(message["x"]), int(message["y"])
+            except (KeyError, TypeError, ValueError):
+                return self._error(client, "move needs integer table_id, x and y")
+            self.stats["moves"] += 1
+            room.positions[table_id] = (x, y)
+            room.movers.setdefault(client.user.id, (client.user, set()))[1].add(table_id)
+            self.broadcast(room.diagram_id, {
+                "type": "move", "user_id": client.user.id, "table_id": table_id, "x": x, "y": y
+            }, exclude=client)
+        else:
+            self.broadcast(room.diagram_id, {
+                "type": "op", "user_id": client.user.id, "op": message.get("op")
+            }, exclude=client)
+
+    def _error(self, client: Client, detail: str):
+        try:
+            client.queue.put_nowait(json.dumps({"type": "error", "detail": detail}))
+        except asyncio.QueueFull:
+            pass
+
+    async def _leave(self, room: Room, client: Client):
+        room.clients.discard(client)
+        if client.dropped:
+            # Let the writer reach the close marker _drop queued
+            await asyncio.wait({client.writer}, timeout=DROP_CLOSE_TIMEOUT)
+        client.writer.cancel()
+        if room.clients:
+            self.broadcast(room.diagram_id, {
+                "type": "presence", "user_id": client.user.id, "joined": False, "members": len(room.clients)
+            })
+            return
+        # Last one out writes the remaining positions
+        if self.rooms.get(room.diagram_id) is room:
+            del self.rooms[room.diagram_id]
+        room.flusher.cancel()
+        await self.flush_positions(room)
+
+hub = DiagramHub()
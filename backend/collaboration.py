@@ -1,13 +1,226 @@
-from sqlalchemy.orm import Session
+"""
+Diagram sharing: effective permissions, collaborator management and
+change notifications.
+
+Permissions are cached per process. A commit in this process drops the
+entries it affects, but a collaboration or diagram change committed by
+another process is only seen once the entry expires, so a revoked user
+keeps access there for up to PERMISSION_CACHE_TTL seconds.
+"""
+from sqlalchemy import event, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 from fastapi import HTTPException, Depends
 import models
 import schemas
 import auth
-from email_service import EmailService
+import outbox
+import digest
+from email_service import invitation_message
+from ttl_cache import TTLCache
+from bulk import ID_CHUNK
 import os
 
-def invite_user_to_diagram(
-    db: Session, 
+# Each level includes the ones below it
+PERMISSION_RANK = {
+    models.PermissionLevel.VIEW: 1,
+    models.PermissionLevel.EDIT: 2,
+    models.PermissionLevel.ADMIN: 3,
+}
+
+# Effective permissions keyed by (user id, diagram id), so access checks
+# do not query the diagram and its collaborations on every request.
+# Collaboration and diagram writes drop the affected entries on commit;
+# the TTL bounds staleness from other processes, see the module docstring.
+permission_cache = TTLCache(
+    max_entries=int(os.getenv("PERMISSION_CACHE_SIZE", 50000)),
+    ttl=float(os.getenv("PERMISSION_CACHE_TTL", 30))
+)
+
+# Cached in place of None, which TTLCache.get returns for a miss
+_NO_ACCESS = "none"
+
+def allows(permission, minimum) -> bool:
+    """Whether permission (possibly None) is at least minimum"""
+    return permission is not None and PERMISSION_RANK[permission] >= PERMISSION_RANK[minimum]
+
+def permission_query(diagram_id: int, user_id: int):
+    """Owner, public flag and the user's collaboration level in one joined row"""
+    return select(
+        models.Diagram.owner_id,
+        models.Diagram.is_public,
+        models.DiagramCollaboration.permission_level
+    ).outerjoin(
+        models.DiagramCollaboration,
+        (models.DiagramCollaboration.diagram_id == models.Diagram.id)
+        & (models.DiagramCollaboration.user_id == user_id)
+    ).where(models.Diagram.id == diagram_id)
+
+def effective_permission(rows, user_id: int):
+    """
+    The owner has ADMIN, collaborators their highest level, and anyone
+    else VIEW on a public diagram. None without access or diagram.
+    """
+    if not rows:
+        return None
+    if rows[0].owner_id == user_id:
+        return models.PermissionLevel.ADMIN
+    levels = [row.permission_level for row in rows if row.permission_level is not None]
+    if levels:
+        return max(levels, key=PERMISSION_RANK.get)
+    if rows[0].is_public:
+        return models.PermissionLevel.VIEW
+    return None
+
+def visible_to(user_id: int):
+    """
+    WHERE clause for diagrams a user can at least VIEW, the set-wise
+    counterpart of effective_permission for queries over many diagrams
+    """
+    shared = select(models.DiagramCollaboration.diagram_id).where(
+        models.DiagramCollaboration.user_id == user_id
+    )
+    return or_(
+        models.Diagram.owner_id == user_id,
+        models.Diagram.is_public == True,
+        models.Diagram.id.in_(shared)
+    )
+
+def _remember_permission(key, rows, user_id: int):
+    permission = effective_permission(rows, user_id)
+    # A missing diagram is not cached, so creating it takes effect at once
+    if rows:
+        permission_cache.put(key, permission or _NO_ACCESS)
+    return permission
+
+def diagram_permission(db: Session, diagram_id: int, user_id: int):
+    """Effective permission of a user on a diagram, or None without access"""
+    key = (user_id, diagram_id)
+    cached = permission_cache.get(key)
+    if cached is None:
+        return _remember_permission(key, db.execute(permission_query(diagram_id, user_id)).all(), user_id)
+    return None if cached == _NO_ACCESS else cached
+
+async def diagram_permission_async(db: AsyncSession, diagram_id: int, user_id: int):
+    """diagram_permission for an AsyncSession"""
+    key = (user_id, diagram_id)
+    cached = permission_cache.get(key)
+    if cached is None:
+        rows = (await db.execute(permission_query(diagram_id, user_id))).all()
+        return _remember_permission(key, rows, user_id)
+    return None if cached == _NO_ACCESS else cached
+
+def check_permission(permission, minimum=models.PermissionLevel.VIEW):
+    """404 without access, so private diagrams stay hidden; 403 below minimum"""
+    if permission is None:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    if not allows(permission, minimum):
+        raise HTTPException(status_code=403, detail="Not enough permission on this diagram")
+    return permission
+
+def require_permission(db: Session, diagram_id: int, user_id: int, minimum=models.PermissionLevel.VIEW):
+    return check_permission(diagram_permission(db, diagram_id, user_id), minimum)
+
+async def require_permission_async(
+    db: AsyncSession, diagram_id: int, user_id: int, minimum=models.PermissionLevel.VIEW
+):
+    return check_permission(await diagram_permission_async(db, diagram_id, user_id), minimum)
+
+def invalidate_permission(user_id: int, diagram_id: int):
+    permission_cache.discard((user_id, diagram_id))
+
+def invalidate_diagram_permissions(diagram_id: int):
+    """Forget the cached permission of every user on a diagram"""
+    permission_cache.discard_matching(lambda key: key[1] == diagram_id)
+
+def _queue_invalidation(target, key):
+    # Applied once the change is committed, like principal invalidation
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_permissions", set()).add(key)
+    elif key[0] is None:
+        invalidate_diagram_permissions(key[1])
+    else:
+        invalidate_permission(*key)
+
+def queue_permission_invalidation(db, user_id: int, diagram_id: int):
+    """Drop a cached permission when db commits, for writes that bypass the ORM"""
+    db.sync_session.info.setdefault("changed_permissions", set()).add((user_id, diagram_id))
+
+@event.listens_for(models.DiagramCollaboration, "after_insert")
+@event.listens_for(models.DiagramCollaboration, "after_update")
+@event.listens_for(models.DiagramCollaboration, "after_delete")
+def _queue_collaboration_invalidation(mapper, connection, collaboration):
+    _queue_invalidation(collaboration, (collaboration.user_id, collaboration.diagram_id))
+
+@event.listens_for(models.Diagram, "after_insert")
+@event.listens_for(models.Diagram, "after_update")
+@event.listens_for(models.Diagram, "after_delete")
+def _queue_diagram_invalidation(mapper, connection, diagram):
+    # Created, or owner or visibility changed: every user of the diagram
+    _queue_invalidation(diagram, (None, diagram.id))
+
+@event.listens_for(Session, "after_commit")
+def _apply_permission_invalidation(session):
+    for user_id, diagram_id in session.info.pop("changed_permissions", ()):
+        if user_id is None:
+            invalidate_diagram_permissions(diagram_id)
+        else:
+            invalidate_permission(user_id, diagram_id)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_permission_invalidation(session):
+    session.info.pop("changed_permissions", None)
+
+async def get_managed_diagram(db: AsyncSession, diagram_id: int, user_id: int):
+    """The diagram if user_id may manage its collaborators (ADMIN), else 404/403"""
+    await require_permission_async(db, diagram_id, user_id, models.PermissionLevel.ADMIN)
+    return await db.get(models.Diagram, diagram_id)
+
+async def get_collaboration(db: AsyncSession, diagram_id: int, collaborator_id: int):
+    collaboration = await db.scalar(select(models.DiagramCollaboration).where(
+        models.DiagramCollaboration.diagram_id == diagram_id,
+        models.DiagramCollaboration.user_id == collaborator_id
+    ))
+    
+    if not collaboration:
+        raise HTTPException(status_code=404, detail="Collaborator not found")
+    return collaboration
+
+def collaborator_emails(diagram_id: int, exclude_user_id: int):
+    """
+    Query for the emails of everyone on a diagram, its owner and its
+    collaborators, other than one user
+    """
+    owner = select(models.Diagram.owner_id).where(models.Diagram.id == diagram_id).scalar_subquery()
+    collaborators = select(models.DiagramCollaboration.user_id).where(
+        models.DiagramCollaboration.diagram_id == diagram_id
+    )
+    return select(models.User.email).where(
+        or_(models.User.id == owner, models.User.id.in_(collaborators)),
+        models.User.id != exclude_user_id
+    )
+
+def notify_collaborators(db: Session, diagram, actor, changes: dict):
+    """
+    Count {action: count} changes by actor toward the digest email of the
+    owner and every other collaborator, see digest.py
+    """
+    recipients = db.scalars(collaborator_emails(diagram.id, actor.id)).all()
+    digest.notifications.record_changes(recipients, diagram.id, diagram.name, actor.username, changes)
+
+async def notify_collaborators_async(db: AsyncSession, diagram, actor, changes: dict):
+    """notify_collaborators for an AsyncSession"""
+    recipients = (await db.scalars(collaborator_emails(diagram.id, actor.id))).all()
+    digest.notifications.record_changes(recipients, diagram.id, diagram.name, actor.username, changes)
+
+async def notify_moves_async(db: AsyncSession, diagram, actor, table_ids):
+    """Count the tables actor moved toward the same digests, each table once per digest"""
+    recipients = (await db.scalars(collaborator_emails(diagram.id, actor.id))).all()
+    digest.notifications.record_moves(recipients, diagram.id, diagram.name, actor.username, table_ids)
+
+async def invite_user_to_diagram(
+    db: AsyncSession, 
     diagram_id: int, 
     inviter_user_id: int, 
     invited_email: str, 
@@ -18,14 +231,12 @@ def invite_user_to_diagram(
     Permission levels: 'view', 'edit', 'admin'
     """
     # Ambil informasi diagram dan pengguna yang mengundang
-    diagram = db.query(models.Diagram).filter(models.Diagram.id == diagram_id).first()
-    inviter = db.query(models.User).filter(models.User.id == inviter_user_id).first()
-    
-    if not diagram:
-        raise HTTPException(status_code=404, detail="Diagram tidak ditemukan")
+    diagram = await get_managed_diagram(db, diagram_id, inviter_user_id)
+    inviter = await db.get(models.User, inviter_user_id)
+    permission = models.PermissionLevel(permission_level)
     
     # Cek apakah pengguna sudah terdaftar
-    invited_user = db.query(models.User).filter(models.User.email == invited_email).first()
+    invited_user = await db.scalar(select(models.User).where(models.User.email == invited_email))
     
     if not invited_user:
         # Buat undangan
@@ -33,24 +244,23 @@ def invite_user_to_diagram(
             diagram_id=diagram_id,
             inviter_id=inviter_user_id,
             invited_email=invited_email,
-            permission_level=permission_level,
-            status='pending'
+            permission_level=permission,
+            status=models.InvitationStatus.PENDING
         )
         
         db.add(invitation)
-        db.commit()
-        db.refresh(invitation)
+        await db.flush()
         
         # Kirim email undangan
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
         invitation_link = f"{frontend_url}/invitations/{invitation.id}"
         
-        EmailService.send_invitation_email(
-            to_email=invited_email, 
-            diagram_name=diagram.name, 
-            inviter_name=inviter.username,
-            invitation_link=invitation_link
-        )
+        # Queued in the invitation's transaction and sent by the outbox
+        # worker, so a slow or down SMTP server never holds up the request
+        subject, body = invitation_message(diagram.name, inviter.username, invitation_link)
+        outbox.enqueue_email(db, invited_email, subject, body)
+        await db.commit()
+        outbox.sender.wake()
         
         return {
             "message": "Undangan terkirim", 
@@ -61,38 +271,129 @@ def invite_user_to_diagram(
     collaboration = models.DiagramCollaboration(
         diagram_id=diagram_id,
         user_id=invited_user.id,
-        permission_level=permission_level
+        permission_level=permission
     )
     
     db.add(collaboration)
-    db.commit()
-    db.refresh(collaboration)
+    await db.commit()
     
     return {"message": "User added to diagram"}
 
-def get_diagram_collaborators(
-    db: Session, 
+def chunked(items, size=ID_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def invite_users_to_diagram(
+    db: AsyncSession,
+    diagram_id: int,
+    inviter_user_id: int,
+    invited_emails,
+    permission_level: str = 'view'
+):
+    """
+    invite_user_to_diagram for many emails in one transaction. Existing
+    users, collaborators and pending invitations are looked up with IN
+    queries, and each kind of row is written with one multi-row INSERT.
+    """
+    diagram = await get_managed_diagram(db, diagram_id, inviter_user_id)
+    inviter = await db.get(models.User, inviter_user_id)
+    permission = models.PermissionLevel(permission_level)
+    emails = list(dict.fromkeys(invited_emails))
+
+    users = {}
+    pending = set()
+    for chunk in chunked(emails):
+        users.update((await db.execute(
+            select(models.User.email, models.User.id).where(models.User.email.in_(chunk))
+        )).all())
+        pending.update((await db.scalars(select(models.DiagramInvitation.invited_email).where(
+            models.DiagramInvitation.invited_email.in_(chunk),
+            models.DiagramInvitation.status == models.InvitationStatus.PENDING,
+            models.DiagramInvitation.diagram_id == diagram_id
+        ))).all())
+    members = {diagram.owner_id}
+    user_ids = list(users.values())
+    for chunk in chunked(user_ids):
+        members.update((await db.scalars(select(models.DiagramCollaboration.user_id).where(
+            models.DiagramCollaboration.diagram_id == diagram_id,
+            models.DiagramCollaboration.user_id.in_(chunk)
+        ))).all())
+
+    added, skipped, collaborations, invited = [], [], [], []
+    for email in emails:
+        if email in users:
+            if users[email] in members:
+                skipped.append(email)
+                continue
+            added.append(email)
+            collaborations.append({
+                "diagram_id": diagram_id, "user_id": users[email], "permission_level": permission
+            })
+        elif email in pending:
+            skipped.append(email)
+        else:
+            invited.append(email)
+
+    # Core multi-row inserts; the ORM would send one INSERT per object
+    if collaborations:
+        await db.execute(insert(models.DiagramCollaboration.__table__), collaborations)
+        for row in collaborations:
+            queue_permission_invalidation(db, row["user_id"], diagram_id)
+    invitation_ids = {}
+    if invited:
+        invitations = models.DiagramInvitation.__table__
+        # Matched up by email, which is unique within the batch; asking for
+        # rows in parameter order would make SQLite insert row by row
+        invitation_ids = dict((await db.execute(
+            insert(invitations).returning(invitations.c.invited_email, invitations.c.id),
+            [
+                {
+                    "diagram_id": diagram_id,
+                    "inviter_id": inviter_user_id,
+                    "invited_email": email,
+                    "permission_level": permission,
+                    "status": models.InvitationStatus.PENDING
+                } for email in invited
+            ]
+        )).all())
+
+        frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
+        await outbox.enqueue_emails(db, [
+            (email, *invitation_message(
+                diagram.name, inviter.username, f"{frontend_url}/invitations/{invitation_ids[email]}"
+            )) for email in invited
+        ])
+    await db.commit()
+    if invited:
+        outbox.sender.wake()
+
+    return {
+        "added": added,
+        "invited": [
+            {"invited_email": email, "invitation_id": invitation_ids[email]} for email in invited
+        ],
+        "skipped": skipped
+    }
+
+async def get_diagram_collaborators(
+    db: AsyncSession, 
     diagram_id: int, 
     current_user_id: int
 ):
     """
     Get all collaborators for a specific diagram
     """
-    # Check if user has access to the diagram
-    diagram = db.query(models.Diagram).filter(
-        models.Diagram.id == diagram_id,
-        (models.Diagram.owner_id == current_user_id)
-    ).first()
-    
-    if not diagram:
-        raise HTTPException(status_code=404, detail="Diagram not found")
+    # Members who can edit the diagram see who else can
+    await require_permission_async(db, diagram_id, current_user_id, models.PermissionLevel.EDIT)
     
     # Fetch collaborators
-    collaborators = db.query(models.DiagramCollaboration, models.User).join(
-        models.User, models.DiagramCollaboration.user_id == models.User.id
-    ).filter(
-        models.DiagramCollaboration.diagram_id == diagram_id
-    ).all()
+    collaborators = await db.execute(
+        select(models.DiagramCollaboration, models.User).join(
+            models.User, models.DiagramCollaboration.user_id == models.User.id
+        ).where(
+            models.DiagramCollaboration.diagram_id == diagram_id
+        )
+    )
     
     return [
         {
@@ -103,8 +404,8 @@ def get_diagram_collaborators(
         } for collab, user in collaborators
     ]
 
-def remove_collaborator(
-    db: Session, 
+async def remove_collaborator(
+    db: AsyncSession, 
     diagram_id: int, 
     current_user_id: int, 
     collaborator_id: int
@@ -112,31 +413,19 @@ def remove_collaborator(
     """
     Remove a collaborator from a diagram
     """
-    # Check if current user is the diagram owner
-    diagram = db.query(models.Diagram).filter(
-        models.Diagram.id == diagram_id, 
-        models.Diagram.owner_id == current_user_id
-    ).first()
-    
-    if not diagram:
-        raise HTTPException(status_code=404, detail="Diagram not found")
+    # Check if current user may manage the diagram's collaborators
+    await require_permission_async(db, diagram_id, current_user_id, models.PermissionLevel.ADMIN)
     
     # Remove collaboration entry
-    collaboration = db.query(models.DiagramCollaboration).filter(
-        models.DiagramCollaboration.diagram_id == diagram_id,
-        models.DiagramCollaboration.user_id == collaborator_id
-    ).first()
+    collaboration = await get_collaboration(db, diagram_id, collaborator_id)
     
-    if not collaboration:
-        raise HTTPException(status_code=404, detail="Collaborator not found")
-    
-    db.delete(collaboration)
-    db.commit()
+    await db.delete(collaboration)
+    await db.commit()
     
     return {"message": "Collaborator removed successfully"}
 
-def update_collaborator_permission(
-    db: Session, 
+async def update_collaborator_permission(
+    db: AsyncSession, 
     diagram_id: int, 
     current_user_id: int, 
     collaborator_id: int, 
@@ -145,26 +434,14 @@ def update_collaborator_permission(
     """
     Update a collaborator's permission level
     """
-    # Check if current user is the diagram owner
-    diagram = db.query(models.Diagram).filter(
-        models.Diagram.id == diagram_id, 
-        models.Diagram.owner_id == current_user_id
-    ).first()
-    
-    if not diagram:
-        raise HTTPException(status_code=404, detail="Diagram not found")
+    # Check if current user may manage the diagram's collaborators
+    await require_permission_async(db, diagram_id, current_user_id, models.PermissionLevel.ADMIN)
     
     # Update collaboration entry
-    collaboration = db.query(models.DiagramCollaboration).filter(
-        models.DiagramCollaboration.diagram_id == diagram_id,
-        models.DiagramCollaboration.user_id == collaborator_id
-    ).first()
-    
-    if not collaboration:
-        raise HTTPException(status_code=404, detail="Collaborator not found")
+    collaboration = await get_collaboration(db, diagram_id, collaborator_id)
     
-    collaboration.permission_level = new_permission_level
-    db.commit()
+    collaboration.permission_level = models.PermissionLevel(new_permission_level)
+    await db.commit()
     
     return {
         "message": "Collaborator permission updated",
@@ -0,0 +1,105 @@
+def generate_sql_ddl(diagram, graph=None):
+    """
+    Generate SQL DDL for a diagram. With its graph.SchemaGraph, tables come
+    after the tables they reference and carry their foreign keys.
+    """
+    if graph is None or not graph.edges:
+        return "\n\n".join(
+            generate_table_ddl(table.name, table.columns) for table in diagram.tables
+        )
+    tables = {table.id: table for table in diagram.tables}
+    order, _ = graph.creation_order()
+    # Tables written after the graph was built go last
+    order = [table_id for table_id in order if table_id in tables]
+    order += [table_id for table_id in tables if table_id not in graph.table_names]
+    return "\n\n".join(generate_ordered_ddl(
+        graph, ((table_id, tables[table_id].name, tables[table_id].columns) for table_id in order)
+    ))
+
+def generate_ordered_ddl(graph, tables):
+    """
+    Yield the statements of a diagram with relationships: CREATE TABLE in
+    graph.creation_order() with the foreign keys that fit that order, then
+    an ALTER TABLE for each one closing a cycle. tables yields
+    (table_id, table_name, columns) in creation order.
+    """
+    _, deferred = graph.creation_order()
+    for table_id, table_name, columns in tables:
+        foreign_keys = [
+            foreign_key_clause(graph, edge) for edge in graph.outgoing.get(table_id, ()) if edge.id not in deferred
+        ]
+        yield generate_table_ddl(table_name, columns, foreign_keys)
+    for edge in graph.edges:
+        if edge.id in deferred:
+            yield f"ALTER TABLE {graph.table_names[edge.source_table]} ADD {foreign_key_clause(graph, edge)};"
+
+def foreign_key_clause(graph, edge):
+    """The CONSTRAINT ... FOREIGN KEY clause of one graph.Edge"""
+    return foreign_key_constraint(
+        graph.table_names[edge.source_table], edge.source_column,
+        graph.table_names[edge.target_table], edge.target_column
+    )
+
+def foreign_key_name(table_name, column_name):
+    return f"fk_{table_name}_{column_name}"
+
+def foreign_key_constraint(table_name, column_name, target_table_name, target_column_name):
+    """CONSTRAINT ... FOREIGN KEY clause from table and column names"""
+    return (
+        f"CONSTRAINT {foreign_key_name(table_name, column_name)} FOREIGN KEY ({column_name}) "
+        f"REFERENCES {target_table_name} ({target_column_name})"
+    )
+
+def generate_table_ddl(table_name, table_columns, foreign_keys=()):
+    """Generate the CREATE TABLE statement for one table"""
+    table_ddl = f"CREATE TABLE {table_name} (\n"
+    columns = []
+    primary_keys = []
+    
+    for column in table_columns:
+        column_def = f"    {column.name} {column.data_type}"
+        
+        if not column.is_nullable:
+            column_def += " NOT NULL"
+        
+        if column.is_primary_key:
+            primary_keys.append(column.name)
+        
+        columns.append(column_def)
+    
+    # Add columns to table definition
+    table_ddl += ",\n".join(columns)
+    
+    # Add primary key constraint if exists
+    if primary_keys:
+        table_ddl += f",\n    PRIMARY KEY ({', '.join(primary_keys)})"
+
+    for foreign_key in foreign_keys:
+        table_ddl += f",\n    {foreign_key}"
+    
+    table_ddl += "\n);"
+    return table_ddl
+
+def generate_json_schema(diagram):
+    """Generate JSON schema representation of a diagram"""
+    return {
+        "name": diagram.name,
+        "tables": [
+            generate_table_json_schema(table.name, table.columns)
+            for table in diagram.tables
+        ]
+    }
+
+def generate_table_json_schema(table_name, table_columns):
+    """Generate the JSON schema entry for one table"""
+    return {
+        "name": table_name,
+        "columns": [
+            {
+                "name": column.name,
+                "type": column.data_type,
+                "nullable": column.is_nullable,
+                "primary_key": column.is_primary_key
+            } for column in table_columns
+        ]
+    }
@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import outbox
+from database import SessionLocal
+from email_service import digest_message
+
+logger = logging.getLogger(__name__)
+
+# Seconds that changes to one diagram are collected for one recipient
+# before they go out as a single summary email
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", 300))
+# Digests held in memory at once; past this the oldest is sent early
+DIGEST_MAX_PENDING = int(os.getenv("DIGEST_MAX_PENDING", 10000))
+# Actors named in one digest; changes by anyone else are counted together
+DIGEST_MAX_ACTORS = int(os.getenv("DIGEST_MAX_ACTORS", 5))
+# Moved table ids remembered across all buffered digests, so dragging a
+# table around counts it once; moves past this are counted without that check
+DIGEST_MAX_MOVED = int(os.getenv("DIGEST_MAX_MOVED", 100000))
+
+class _Pending:
+    __slots__ = ("deadline", "diagram_name", "changes", "moved")
+
+    def __init__(self, deadline, diagram_name):
+        self.deadline = deadline
+        self.diagram_name = diagram_name
+        # actor name, or None for "everyone else" -> Counter of actions
+        self.changes = {}
+        # actor -> ids of the tables it moved, counted as table_moved when sent
+        self.moved = {}
+
+def enqueue_digests(digests):
+    """Write finished digests to the email outbox in one transaction"""
+    with SessionLocal() as db:
+        for recipient, diagram_name, changes in digests:
+            subject, body = digest_message(diagram_name, changes)
+            outbox.enqueue_email(db, recipient, subject, body)
+        db.commit()
+    outbox.sender.wake()
+
+class NotificationDigest:
+    """
+    Coalesces collaboration change events per (recipient, diagram) into one
+    summary email per window. record() only updates counters in memory; a
+    background thread hands finished digests to the email outbox.
+
+    Memory is bounded: at most max_pending digests are buffered, each
+    holding counters for at most max_actors + 1 actors and the fixed set of
+    actions, and at most max_moved moved table ids are remembered across
+    all of them. Buffered events are lost if the process dies; they are
+    durable once flushed to the outbox.
+    """
+
+    def __init__(self, window=None, max_pending=None, max_actors=None, max_moved=None,
+                 clock=time.monotonic, deliver=enqueue_digests):
+        self.window = DIGEST_WINDOW if window is None else window
+        self.max_pending = max_pending or DIGEST_MAX_PENDING
+        self.max_actors = max_actors or DIGEST_MAX_ACTORS
+        self.max_moved = max_moved or DIGEST_MAX_MOVED
+        # Moved table ids held by all buffered digests together
+        self.moved_count = 0
+        self.clock = clock
+        self.deliver = deliver
+        # Insertion order is deadline order, so due digests are at the front
+        self._pending = OrderedDict()
+        # Digests evicted early, waiting for the next flush
+        self._ready = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def _changes(self, recipient, diagram_id, diagram_name, actor):
+        """(pending digest, actor key) for an event; call with the lock held"""
+        key = (recipient, diagram_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = _Pending(self.clock() + self.window, diagram_name)
+            self._pending[key] = pending
+            if len(self._pending) > self.max_pending:
+                self._ready.append(self._finish(*self._pending.popitem(last=False)))
+                self._wake.set()
+        if actor not in pending.changes and len(pending.changes) >= self.max_actors:
+            actor = None
+        pending.changes.setdefault(actor, Counter())
+        return pending, actor
+
+    def record(self, recipient, diagram_id, diagram_name, actor, action, count=1):
+        """Count `count` occurrences of an action by actor on a diagram"""
+        with self._lock:
+            pending, actor = self._changes(recipient, diagram_id, diagram_name, actor)
+            pending.changes[actor][action] += count
+
+    def record_changes(self, recipients, diagram_id, diagram_name, actor, changes):
+        """record() every non-zero {action: count} for each recipient"""
+        for recipient in recipients:
+            for action, count in changes.items():
+                if count:
+                    self.record(recipient, diagram_id, diagram_name, actor, action, count)
+
+    def record_moves(self, recipients, diagram_id, diagram_name, actor, table_ids):
+        """Count tables moved by actor as table_moved, each table once per digest"""
+        for recipient in recipients:
+            with self._lock:
+                pending, actor_key = self._changes(recipient, diagram_id, diagram_name, actor)
+                moved = pending.moved.setdefault(actor_key, set())
+                for table_id in table_ids:
+                    if table_id in moved:
+                        continue
+                    if self.moved_count < self.max_moved:
+                        moved.add(table_id)
+                        self.moved_count += 1
+                    else:
+                        pending.changes[actor_key]["table_moved"] += 1
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending) + len(self._ready)
+
+    def _finish(self, key, pending):
+        """Close a removed digest; call with the lock held"""
+        for actor, moved in pending.moved.items():
+            pending.changes[actor]["table_moved"] += len(moved)
+            self.moved_count -= len(moved)
+        return key[0], pending.diagram_name, pending.changes
+
+    def take_due(self, force=False):
+        """Remove and return (recipient, diagram name, changes) for every finished digest"""
+        now = self.clock()
+        with self._lock:
+            due, self._ready = self._ready, []
+            while self._pending:
+                key, pending = next(iter(self._pending.items()))
+                if not force and pending.deadline > now:
+                    break
+                del self._pending[key]
+                due.append(self._finish(key, pending))
+        return due
+
+    def flush(self, force=False):
+        """Deliver finished digests, or all of them with force. Returns how many."""
+        due = self.take_due(force)
+        if due:
+            self.deliver(due)
+        return len(due)
+
+    def _run(self):
+        interval = min(max(self.window / 4, 0.1), 5)
+        while not self._stopping.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Notification digest flush failed")
+        # Whatever is still buffered goes out early rather than being lost
+        self.flush(force=True)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="notification-digest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+notifications = NotificationDigest()
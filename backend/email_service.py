@@ -7,6 +7,147 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+def invitation_message(diagram_name: str, inviter_name: str, invitation_link: str):
+    """Subject and plain-text body of a collaboration invitation"""
+    subject = f'Undangan Kolaborasi Diagram: {diagram_name}'
+    body = f"""
+        Halo,
+
+        {inviter_name} mengundang Anda untuk berkolaborasi pada diagram '{diagram_name}' di Schema Designer.
+
+        Untuk menerima undangan, klik tautan berikut:
+        {invitation_link}
+
+        Atau salin tautan ini ke browser Anda.
+
+        Salam,
+        Tim Schema Designer
+        """
+    return subject, body
+
+def collaboration_message(diagram_name: str, action: str, actor_name: str):
+    """Subject and plain-text body of a collaboration change notification"""
+    subject = f'Perubahan Kolaborasi Diagram: {diagram_name}'
+    body = f"""
+        Halo,
+
+        {actor_name} telah {action} pada diagram '{diagram_name}'.
+
+        Silakan periksa diagram untuk melihat detail perubahan.
+
+        Salam,
+        Tim Schema Designer
+        """
+    return subject, body
+
+# Verb and noun for each kind of change counted in a digest, in display order
+DIGEST_ACTIONS = {
+    "table_added": ("menambahkan", "tabel"),
+    "table_changed": ("mengubah", "tabel"),
+    "table_moved": ("memindahkan", "tabel"),
+    "table_removed": ("menghapus", "tabel"),
+    "column_added": ("menambahkan", "kolom"),
+    "column_changed": ("mengubah", "kolom"),
+    "column_removed": ("menghapus", "kolom"),
+    "relationship_added": ("menambahkan", "relasi"),
+    "relationship_removed": ("menghapus", "relasi"),
+}
+
+def digest_message(diagram_name: str, changes):
+    """
+    Subject and body summarizing many changes to one diagram.
+    changes maps an actor name (None for everyone else) to {action: count}.
+    """
+    lines = []
+    for actor, counts in changes.items():
+        parts = [
+            f"{verb} {counts[action]} {noun}"
+            for action, (verb, noun) in DIGEST_ACTIONS.items() if counts.get(action)
+        ]
+        if parts:
+            lines.append(f"{actor or 'Kolaborator lain'} {', '.join(parts)}.")
+
+    subject = f'Ringkasan Perubahan Diagram: {diagram_name}'
+    summary = "\n        ".join(lines)
+    body = f"""
+        Halo,
+
+        Perubahan terbaru pada diagram '{diagram_name}':
+
+        {summary}
+
+        Silakan periksa diagram untuk melihat detail perubahan.
+
+        Salam,
+        Tim Schema Designer
+        """
+    return subject, body
+
+class SMTPConnection:
+    """
+    One SMTP session kept open across messages. Connects, runs STARTTLS and
+    logs in on first use, and again after the server drops the connection.
+    """
+
+    def __init__(self, host: str, port: int, username: str = None, password: str = None,
+                 starttls: bool = True, sender: str = None, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender or username or 'noreply@localhost'
+        self.timeout = timeout
+        self.server = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
+            port=int(os.getenv('SMTP_PORT', 587)),
+            username=os.getenv('SMTP_USERNAME'),
+            password=os.getenv('SMTP_PASSWORD'),
+            starttls=os.getenv('SMTP_STARTTLS', '1').lower() not in ('0', 'false', 'no'),
+            sender=os.getenv('SMTP_FROM')
+        )
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def send(self, to_email: str, subject: str, body: str):
+        """Send one plain-text message, reconnecting once if the session went stale"""
+        msg = MIMEText(body, 'plain')
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.close()
+            self._connect()
+            self.server.send_message(msg)
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
 class EmailService:
     @staticmethod
     def send_invitation_email(to_email: str, diagram_name: str, inviter_name: str, invitation_link: str):
@@ -18,31 +159,18 @@ class EmailService:
         smtp_port = int(os.getenv('SMTP_PORT', 587))
         smtp_username = os.getenv('SMTP_USERNAME')
         smtp_password = os.getenv('SMTP_PASSWORD')
-        
+
         if not all([smtp_username, smtp_password]):
             print("SMTP credentials not configured")
             return False
 
+        subject, body = invitation_message(diagram_name, inviter_name, invitation_link)
+
         # Create message
         msg = MIMEMultipart()
         msg['From'] = smtp_username
         msg['To'] = to_email
-        msg['Subject'] = f'Undangan Kolaborasi Diagram: {diagram_name}'
-
-        # Email body
-        body = f"""
-        Halo,
-
-        {inviter_name} mengundang Anda untuk berkolaborasi pada diagram '{diagram_name}' di Schema Designer.
-
-        Untuk menerima undangan, klik tautan berikut:
-        {invitation_link}
-
-        Atau salin tautan ini ke browser Anda.
-
-        Salam,
-        Tim Schema Designer
-        """
+        msg['Subject'] = subject
 
         msg.attach(MIMEText(body, 'plain'))
 
@@ -67,26 +195,17 @@ class EmailService:
         smtp_port = int(os.getenv('SMTP_PORT', 587))
         smtp_username = os.getenv('SMTP_USERNAME')
         smtp_password = os.getenv('SMTP_PASSWORD')
-        
+
         if not all([smtp_username, smtp_password]):
             print("SMTP credentials not configured")
             return False
 
+        subject, body = collaboration_message(diagram_name, action, actor_name)
+
         msg = MIMEMultipart()
         msg['From'] = smtp_username
         msg['To'] = to_email
-        msg['Subject'] = f'Perubahan Kolaborasi Diagram: {diagram_name}'
-
-        body = f"""
-        Halo,
-
-        {actor_name} telah {action} pada diagram '{diagram_name}'.
-
-        Silakan periksa diagram untuk melihat detail perubahan.
-
-        Salam,
-        Tim Schema Designer
-        """
+        msg['Subject'] = subject
 
         msg.attach(MIMEText(body, 'plain'))
 
@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Bump when the export payload format changes so old ETags stop matching
+EXPORT_FORMAT_VERSION = 1
+
+def export_etag(diagram_id: int, revision: int, variant: Optional[str] = None) -> str:
+    """
+    Strong ETag for the export of a diagram at a given revision.
+    Each representation (e.g. a streamed format) gets its own variant.
+    """
+    suffix = f"-{variant}" if variant else ""
+    return f'"{diagram_id}-{revision}-{EXPORT_FORMAT_VERSION}{suffix}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(
+        tag[2:] == etag if tag.startswith("W/") else tag == etag
+        for tag in candidates
+    )
+
+class ExportCache:
+    """
+    Bounded LRU of serialized exports keyed by (diagram_id, revision).
+    Entries evicted from memory are written to spill_dir when one is
+    configured and promoted back on the next hit.
+    """
+
+    def __init__(self, max_entries: int = 256, spill_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, diagram_id: int, revision: int) -> str:
+        return os.path.join(self.spill_dir, str(diagram_id), f"{revision}.json")
+
+    def get(self, diagram_id: int, revision: int) -> Optional[bytes]:
+        key = (diagram_id, revision)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(diagram_id, revision), "rb") as spilled:
+                content = spilled.read()
+        except FileNotFoundError:
+            return None
+        self.put(diagram_id, revision, content)
+        return content
+
+    def put(self, diagram_id: int, revision: int, content: bytes):
+        evicted = []
+        with self._lock:
+            # Older revisions of the same diagram can never be served again
+            for key in [k for k in self._entries if k[0] == diagram_id and k[1] != revision]:
+                del self._entries[key]
+            self._entries[(diagram_id, revision)] = content
+            self._entries.move_to_end((diagram_id, revision))
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+
+        if self.spill_dir:
+            self._discard_spilled(diagram_id, keep=revision)
+            for (evicted_id, evicted_revision), evicted_content in evicted:
+                path = self._spill_path(evicted_id, evicted_revision)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + ".tmp", "wb") as spilled:
+                    spilled.write(evicted_content)
+                os.replace(path + ".tmp", path)
+
+    def _discard_spilled(self, diagram_id: int, keep: int):
+        directory = os.path.join(self.spill_dir, str(diagram_id))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name != f"{keep}.json":
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+cache = ExportCache(
+    max_entries=int(os.getenv("EXPORT_CACHE_SIZE", 256)),
+    spill_dir=os.getenv("EXPORT_CACHE_DIR") or None
+)
@@ -0,0 +1,65 @@
+import gzip
+import os
+
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional, gzip is always there
+    brotli = None
+
+# Responses smaller than this go out uncompressed; below ~1 KB the
+# compression framing and CPU cost outweigh the bytes saved
+JSON_COMPRESS_MIN_BYTES = int(os.getenv("JSON_COMPRESS_MIN_BYTES", 1024))
+# Fast settings: these bodies are built per request, never cached compressed
+JSON_GZIP_LEVEL = int(os.getenv("JSON_GZIP_LEVEL", 5))
+JSON_BROTLI_QUALITY = int(os.getenv("JSON_BROTLI_QUALITY", 4))
+
+def dumps(content) -> bytes:
+    """
+    The bytes FastAPI's JSONResponse would produce for content made of
+    dicts, lists, strings, numbers, booleans and None. Datetimes must be
+    converted with isoformat() first, as jsonable_encoder does.
+    """
+    return orjson.dumps(content)
+
+def accepted_encodings(accept_encoding: str):
+    """Content codings of an Accept-Encoding header with a non-zero q-value"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def compress(body: bytes, accept_encoding: str):
+    """(body, content coding or None): brotli, else gzip, when accepted and worth it"""
+    if len(body) < JSON_COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return brotli.compress(body, quality=JSON_BROTLI_QUALITY), "br"
+    if "gzip" in accepted or "*" in accepted:
+        return gzip.compress(body, compresslevel=JSON_GZIP_LEVEL, mtime=0), "gzip"
+    return body, None
+
+def json_response(request: Request, content, headers=None) -> Response:
+    """
+    Encode plain data with orjson and compress it as the client accepts.
+    Returning a Response skips the route's response_model validation, so
+    content must already have the response model's shape and key order.
+    """
+    body, coding = compress(dumps(content), request.headers.get("accept-encoding", ""))
+    response = Response(content=body, media_type="application/json", headers=headers)
+    response.headers["Vary"] = "Accept-Encoding"
+    if coding:
+        response.headers["Content-Encoding"] = coding
+    return response
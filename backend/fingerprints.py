@@ -0,0 +1,31 @@
+import hashlib
+
+def _digest(*parts) -> str:
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+def column_fingerprint(name: str, data_type: str, is_primary_key: bool, is_nullable: bool) -> str:
+    """Structural hash of one column definition"""
+    return _digest(
+        name or "",
+        data_type or "",
+        "1" if is_primary_key else "0",
+        "1" if is_nullable else "0"
+    )
+
+def table_fingerprint(name: str, column_fingerprints) -> str:
+    """
+    Structural hash of a table: its name plus the hashes of its columns.
+    Column order does not change the result.
+    """
+    return _digest(name or "", *sorted(column_fingerprints))
+
+def table_create_fingerprints(table):
+    """
+    Hashes for a table payload that is about to be inserted.
+    Returns (table fingerprint, list of column fingerprints in payload order).
+    """
+    column_fingerprints = [
+        column_fingerprint(column.name, column.data_type, column.is_primary_key, column.is_nullable)
+        for column in table.columns
+    ]
+    return table_fingerprint(table.name, column_fingerprints), column_fingerprints
@@ -0,0 +1,180 @@
+import os
+from collections import deque, namedtuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+import models
+from ttl_cache import TTLCache
+
+# Diagram graphs kept in memory; an entry is rebuilt once its diagram's
+# revision moves on, the TTL only bounds memory held by idle diagrams
+GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", 64))
+GRAPH_CACHE_TTL = float(os.getenv("GRAPH_CACHE_TTL", 600))
+
+# One relationship, from the referencing (source) table to the referenced (target) one
+Edge = namedtuple("Edge", "id source_table source_column target_table target_column cardinality")
+
+class SchemaGraph:
+    """
+    Adjacency index of the relationships between a diagram's tables.
+    Built once per revision and read-only afterwards; every query runs in
+    O(V + E) or less.
+    """
+
+    def __init__(self, table_names: dict, edges):
+        # Table id -> name, in table id order
+        self.table_names = table_names
+        self.edges = [edge for edge in edges if edge.source_table in table_names and edge.target_table in table_names]
+        # Table id -> its edges; read with .get, the graph is shared between threads
+        self.outgoing = {}
+        self.incoming = {}
+        for edge in self.edges:
+            self.outgoing.setdefault(edge.source_table, []).append(edge)
+            self.incoming.setdefault(edge.target_table, []).append(edge)
+        self._components = None
+        self._cycles = None
+        self._creation_order = None
+
+    def references(self, table_id: int):
+        """Tables this table has foreign keys to"""
+        return sorted({edge.target_table for edge in self.outgoing.get(table_id, ())})
+
+    def referenced_by(self, table_id: int):
+        """Tables with foreign keys to this table"""
+        return sorted({edge.source_table for edge in self.incoming.get(table_id, ())})
+
+    def reachable(self, table_id: int):
+        """Every table this one depends on, directly or through others"""
+        seen = {table_id}
+        queue = deque([table_id])
+        while queue:
+            for edge in self.outgoing.get(queue.popleft(), ()):
+                if edge.target_table not in seen:
+                    seen.add(edge.target_table)
+                    queue.append(edge.target_table)
+        # Itself only when it is part of a cycle
+        if not self.in_cycle(table_id):
+            seen.discard(table_id)
+        return sorted(seen)
+
+    def components(self):
+        """
+        Strongly connected components (iterative Tarjan), each listed after
+        every component it references, so the list is a creation order
+        """
+        if self._components is not None:
+            return self._components
+        index, low = {}, {}
+        stack, on_stack = [], set()
+        components = []
+
+        def visit(table_id):
+            index[table_id] = low[table_id] = len(index)
+            stack.append(table_id)
+            on_stack.add(table_id)
+            work.append((table_id, iter(self.outgoing.get(table_id, ()))))
+
+        for root in self.table_names:
+            if root in index:
+                continue
+            work = []
+            visit(root)
+            while work:
+                table_id, edges = work[-1]
+                for edge in edges:
+                    if edge.target_table not in index:
+                        visit(edge.target_table)
+                        break
+                    if edge.target_table in on_stack:
+                        low[table_id] = min(low[table_id], index[edge.target_table])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[table_id])
+                    if low[table_id] == index[table_id]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == table_id:
+                                break
+                        components.append(sorted(component))
+        self._components = components
+        return components
+
+    def cycles(self):
+        """Groups of tables that reference each other in a loop, self references included"""
+        if self._cycles is None:
+            self._cycles = [
+                component for component in self.components()
+                if len(component) > 1
+                or any(edge.target_table == component[0] for edge in self.outgoing.get(component[0], ()))
+            ]
+            self._cyclic = {table_id for component in self._cycles for table_id in component}
+        return self._cycles
+
+    def in_cycle(self, table_id: int) -> bool:
+        self.cycles()
+        return table_id in self._cyclic
+
+    def creation_order(self):
+        """
+        (table ids, deferred relationship ids): an order where each table
+        comes after the tables it references, and the relationships that
+        cannot follow that rule because they close a cycle. Those become
+        ALTER TABLE statements once every table exists.
+        """
+        if self._creation_order is not None:
+            return self._creation_order
+        order = [table_id for component in self.components() for table_id in component]
+        position = {table_id: number for number, table_id in enumerate(order)}
+        deferred = {
+            edge.id for edge in self.edges
+            if position[edge.target_table] > position[edge.source_table]
+        }
+        self._creation_order = order, deferred
+        return self._creation_order
+
+def relationship_edges(diagram_id: int):
+    """Query for the Edge rows of a diagram, in relationship id order"""
+    source, target = aliased(models.Column), aliased(models.Column)
+    return (
+        select(
+            models.Relationship.id,
+            source.table_id.label("source_table"),
+            source.name.label("source_column"),
+            target.table_id.label("target_table"),
+            target.name.label("target_column"),
+            models.Relationship.cardinality
+        )
+        .join(source, source.id == models.Relationship.source_column_id)
+        .join(target, target.id == models.Relationship.target_column_id)
+        .where(models.Relationship.diagram_id == diagram_id)
+        .order_by(models.Relationship.id)
+    )
+
+def build_graph(db: Session, diagram_id: int) -> SchemaGraph:
+    table_names = dict(db.execute(
+        select(models.Table.id, models.Table.name)
+        .where(models.Table.diagram_id == diagram_id)
+        .order_by(models.Table.id)
+    ).all())
+    return SchemaGraph(table_names, [Edge(*row) for row in db.execute(relationship_edges(diagram_id))])
+
+graph_cache = TTLCache(max_entries=GRAPH_CACHE_SIZE, ttl=GRAPH_CACHE_TTL)
+
+def diagram_graph(db: Session, diagram_id: int, revision: int) -> SchemaGraph:
+    """
+    The graph of a diagram at revision, built on the first call for that
+    revision. Pass a revision read before this call: a graph loaded after
+    a concurrent write is then newer than its key, never older.
+    """
+    cached = graph_cache.get(diagram_id)
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+    graph = build_graph(db, diagram_id)
+    graph_cache.put(diagram_id, (revision, graph))
+    return graph
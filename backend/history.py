@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session, aliased
+
+import models
+from database import SessionLocal
+from graph import relationship_edges
+
+logger = logging.getLogger(__name__)
+
+# A full snapshot is written once this many operations were logged since
+# the previous one, so loading a revision replays fewer than that
+HISTORY_SNAPSHOT_OPS = int(os.getenv("HISTORY_SNAPSHOT_OPS", 200))
+# History older than this is compacted down to its newest snapshot; 0 keeps all
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", 90))
+# Seconds between runs of the background compaction job
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", 3600))
+
+def _line(value) -> bytes:
+    return (json.dumps(value, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def decode(payload: bytes):
+    """The entries of an operation or snapshot payload"""
+    return [json.loads(line) for line in zlib.decompress(payload).splitlines()]
+
+def table_entry(table_id: int, name: str, columns, foreign_keys=None, x=None, y=None):
+    """
+    A table as history stores it; columns are [name, type, primary key,
+    nullable] and foreign_keys, left out when there are none,
+    [relationship id, column, target table id, target column, cardinality].
+    Entries written before positions were recorded have no x and y.
+    """
+    entry = {
+        "id": table_id,
+        "name": name,
+        "x": x,
+        "y": y,
+        "columns": [[c.name, c.data_type, c.is_primary_key, c.is_nullable] for c in columns],
+    }
+    if foreign_keys:
+        entry["foreign_keys"] = foreign_keys
+    return entry
+
+def foreign_key_entry(edge):
+    """A graph.Edge as table_entry lists it"""
+    return [edge.id, edge.source_column, edge.target_table, edge.target_column, edge.cardinality.value]
+
+class OperationLog:
+    """
+    The operations of one revision, compressed as they are added so a large
+    import never holds them all in memory. payload() finishes the log.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._compressor = zlib.compressobj()
+        self._chunks = []
+
+    def add(self, operation: dict):
+        self._chunks.append(self._compressor.compress(_line(operation)))
+        self.count += 1
+
+    def table_created(self, table_id: int, name: str, columns, x=None, y=None):
+        self.add({"op": "table.create", **table_entry(table_id, name, columns, x=x, y=y)})
+
+    def tables_created(self, table_ids, tables):
+        for table_id, table in zip(table_ids, tables):
+            self.table_created(table_id, table.name, table.columns, table.x_position, table.y_position)
+
+    def tables_moved(self, positions):
+        """One operation for a whole position write; positions maps table id to (x, y)"""
+        self.add({"op": "tables.move", "positions": [[table_id, x, y] for table_id, (x, y) in positions.items()]})
+
+    def relationship_created(self, edge):
+        self.add({"op": "relationship.create", "table_id": edge.source_table, "key": foreign_key_entry(edge)})
+
+    def relationship_deleted(self, relationship_id: int, table_id: int):
+        self.add({"op": "relationship.delete", "table_id": table_id, "id": relationship_id})
+
+    def payload(self) -> bytes:
+        return b"".join(self._chunks) + self._compressor.flush()
+
+def _create_table(tables, operation):
+    tables[operation["id"]] = {key: operation.get(key) for key in ("id", "name", "x", "y", "columns")}
+
+def _move_tables(tables, operation):
+    # Ids of other diagrams are logged as sent but were never written
+    for table_id, x, y in operation["positions"]:
+        if table_id in tables:
+            tables[table_id].update(x=x, y=y)
+
+def _create_relationship(tables, operation):
+    tables[operation["table_id"]].setdefault("foreign_keys", []).append(operation["key"])
+
+def _delete_relationship(tables, operation):
+    table = tables[operation["table_id"]]
+    remaining = [key for key in table.get("foreign_keys", ()) if key[0] != operation["id"]]
+    if remaining:
+        table["foreign_keys"] = remaining
+    else:
+        table.pop("foreign_keys", None)
+
+# Operation name -> function(tables by id, operation) applying it in place
+APPLY = {
+    "table.create": _create_table,
+    "relationship.create": _create_relationship,
+    "relationship.delete": _delete_relationship,
+    "tables.move": _move_tables,
+}
+
+def apply_operations(tables: dict, operations):
+    for operation in operations:
+        APPLY[operation["op"]](tables, operation)
+
+def snapshot_payload(db: Session, diagram_id: int) -> bytes:
+    """The current tables of a diagram, compressed one table per line"""
+    foreign_keys = {}
+    for edge in db.execute(relationship_edges(diagram_id)):
+        foreign_keys.setdefault(edge.source_table, []).append(foreign_key_entry(edge))
+
+    rows = db.execute(
+        select(
+            models.Table.id.label("table_id"),
+            models.Table.name.label("table_name"),
+            models.Table.x_position,
+            models.Table.y_position,
+            models.Column.id.label("column_id"),
+            models.Column.name,
+            models.Column.data_type,
+            models.Column.is_primary_key,
+            models.Column.is_nullable
+        )
+        .outerjoin(models.Column, models.Column.table_id == models.Table.id)
+        .where(models.Table.diagram_id == diagram_id)
+        .order_by(models.Table.id, models.Column.id)
+    )
+    compressor = zlib.compressobj()
+    chunks = []
+    for table_id, table_rows in groupby(rows, key=lambda row: row.table_id):
+        table_rows = list(table_rows)
+        columns = [row for row in table_rows if row.column_id is not None]
+        first = table_rows[0]
+        entry = table_entry(
+            table_id, first.table_name, columns, foreign_keys.get(table_id), first.x_position, first.y_position
+        )
+        chunks.append(compressor.compress(_line(entry)))
+    chunks.append(compressor.flush())
+    return b"".join(chunks)
+
+def initial_snapshot(diagram_id: int, revision: int = 1):
+    """The empty snapshot a new diagram starts its history with"""
+    return models.DiagramSnapshot(diagram_id=diagram_id, revision=revision, payload=zlib.compress(b""))
+
+def record(db: Session, diagram_id: int, revision: int, user_id, log: OperationLog):
+    """
+    Append the operations that produced revision, and a snapshot of the
+    diagram when HISTORY_SNAPSHOT_OPS operations piled up since the last
+    one or the log since then is incomplete. A diagram created before
+    history was recorded gets its first snapshot on its first write.
+    Does not commit.
+    """
+    base = db.scalar(
+        select(func.max(models.DiagramSnapshot.revision))
+        .where(models.DiagramSnapshot.diagram_id == diagram_id)
+    ) or 0
+    logged, operations = db.execute(
+        select(func.count(), func.coalesce(func.sum(models.DiagramOperation.operation_count), 0))
+        .where(models.DiagramOperation.diagram_id == diagram_id, models.DiagramOperation.revision > base)
+    ).one()
+
+    db.add(models.DiagramOperation(
+        diagram_id=diagram_id,
+        revision=revision,
+        user_id=user_id,
+        operation_count=log.count,
+        payload=log.payload()
+    ))
+    complete = base and logged == revision - 1 - base
+    if not complete or operations + log.count >= HISTORY_SNAPSHOT_OPS:
+        db.add(models.DiagramSnapshot(
+            diagram_id=diagram_id,
+            revision=revision,
+            payload=snapshot_payload(db, diagram_id)
+        ))
+
+def load_revision(db: Session, diagram_id: int, revision: int):
+    """
+    The tables of a diagram at revision as {table id: table}, rebuilt from
+    the nearest snapshot at or before it. None when the revision is not
+    covered by the recorded history.
+    """
+    snapshot = db.execute(
+        select(models.DiagramSnapshot.revision, models.DiagramSnapshot.payload)
+        .where(models.DiagramSnapshot.diagram_id == diagram_id, models.DiagramSnapshot.revision <= revision)
+        .order_by(models.DiagramSnapshot.revision.desc())
+        .limit(1)
+    ).first()
+    if snapshot is None:
+        return None
+    base, tables = snapshot.revision, {table["id"]: table for table in decode(snapshot.payload)}
+
+    operations = db.scalars(
+        select(models.DiagramOperation.payload)
+        .where(
+            models.DiagramOperation.diagram_id == diagram_id,
+            models.DiagramOperation.revision > base,
+            models.DiagramOperation.revision <= revision
+        )
+        .order_by(models.DiagramOperation.revision)
+    ).all()
+    if len(operations) != revision - base:
+        return None
+    for payload in operations:
+        apply_operations(tables, decode(payload))
+    return tables
+
+def compact(db: Session, older_than: datetime) -> int:
+    """
+    Per diagram, drop the history before the newest snapshot written before
+    older_than; that snapshot becomes the oldest loadable revision.
+    Commits. Returns the number of rows removed.
+    """
+    def newest_old_snapshot(outer):
+        anchor = aliased(models.DiagramSnapshot)
+        return select(func.max(anchor.revision)).where(
+            anchor.diagram_id == outer.diagram_id,
+            anchor.created_at < older_than
+        ).scalar_subquery()
+
+    removed = db.execute(
+        delete(models.DiagramOperation)
+        .where(models.DiagramOperation.revision <= newest_old_snapshot(models.DiagramOperation))
+    ).rowcount
+    removed += db.execute(
+        delete(models.DiagramSnapshot)
+        .where(models.DiagramSnapshot.revision < newest_old_snapshot(models.DiagramSnapshot))
+    ).rowcount
+    db.commit()
+    return removed
+
+class HistoryCompactor:
+    """Background thread running compact() every HISTORY_COMPACT_INTERVAL seconds"""
+
+    def __init__(self, retention_days=None, interval=None, session_factory=SessionLocal):
+        self.retention = timedelta(days=HISTORY_RETENTION_DAYS if retention_days is None else retention_days)
+        self.interval = interval or HISTORY_COMPACT_INTERVAL
+        self.session_factory = session_factory
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def run_once(self) -> int:
+        with self.session_factory() as db:
+            return compact(db, datetime.now(timezone.utc) - self.retention)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                removed = self.run_once()
+                if removed:
+                    logger.info("Compacted %s diagram history rows", removed)
+            except Exception:
+                logger.exception("Diagram history compaction failed")
+
+    def start(self):
+        if not self.retention or (self._thread and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+compactor = HistoryCompactor()
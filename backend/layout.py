@@ -0,0 +1,182 @@
+import asyncio
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+# Force-directed iterations per layout
+LAYOUT_ITERATIONS = int(os.getenv("LAYOUT_ITERATIONS", 60))
+# Preferred distance between related tables, in canvas pixels
+LAYOUT_SPACING = float(os.getenv("LAYOUT_SPACING", 320))
+# Processes laying out diagrams in parallel; 0 runs layouts on the threadpool
+LAYOUT_WORKERS = int(os.getenv("LAYOUT_WORKERS", 0))
+
+# Near-field pairs computed per block, bounding temporary arrays
+_PAIR_BLOCK = 1 << 21
+# Empty canvas kept above and left of the layout
+_MARGIN = 40
+# Pull of every table towards the centre, per pixel away from it
+_GRAVITY = 0.02
+
+def _grid_repulsion(positions, k):
+    """
+    Fruchterman-Reingold repulsion in its grid variant: only tables closer
+    than 2k push each other apart. Tables are bucketed into cells at least
+    2k wide and compared with the tables of their own and adjacent cells,
+    so a step costs O(N * tables per cell) instead of O(N^2).
+    """
+    count = len(positions)
+    cutoff2 = (2 * k) ** 2
+    low = positions.min(axis=0)
+    extent = positions.max(axis=0) - low
+    # Cells get wider than 2k when the layout is spread far apart
+    side = int(max(1, min(math.ceil(extent.max() / (2 * k)), math.ceil(2 * math.sqrt(count)))))
+    cell_size = max(extent.max() / side, 2 * k) * (1 + 1e-9)
+    cells_xy = np.minimum(((positions - low) / cell_size).astype(np.int64), side - 1)
+    cell = cells_xy[:, 1] * side + cells_xy[:, 0]
+
+    # Members of every cell, padded with -1 to the fullest cell
+    population = np.bincount(cell, minlength=side * side)
+    order = np.argsort(cell, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(population)])
+    members = np.full((side * side, int(population.max())), -1)
+    members[cell[order], np.arange(count) - starts[cell[order]]] = order
+
+    neighbours = []
+    for step_x in (-1, 0, 1):
+        for step_y in (-1, 0, 1):
+            x, y = cells_xy[:, 0] + step_x, cells_xy[:, 1] + step_y
+            valid = (x >= 0) & (x < side) & (y >= 0) & (y < side)
+            neighbours.append(np.where(valid, y * side + x, -1))
+    neighbours = np.stack(neighbours, axis=1)
+
+    force = np.zeros((count, 2))
+    k2 = k * k
+    width = neighbours.shape[1] * members.shape[1]
+    block = max(1, _PAIR_BLOCK // width)
+    for start in range(0, count, block):
+        rows = np.arange(start, min(start + block, count))
+        cells = neighbours[rows]
+        others = np.where(cells[:, :, None] >= 0, members[np.maximum(cells, 0)], -1).reshape(len(rows), -1)
+        present = (others >= 0) & (others != rows[:, None])
+        others = np.maximum(others, 0)
+        delta_x = positions[rows, 0, None] - positions[others, 0]
+        delta_y = positions[rows, 1, None] - positions[others, 1]
+        distance2 = np.maximum(delta_x * delta_x + delta_y * delta_y, 1.0)
+        scale = np.where(present & (distance2 < cutoff2), k2 / distance2, 0.0)
+        force[rows, 0] += (delta_x * scale).sum(axis=1)
+        force[rows, 1] += (delta_y * scale).sum(axis=1)
+    return force
+
+def _hilbert_points(count):
+    """The first count cells of a Hilbert curve, as (x, y) grid coordinates"""
+    order = 1
+    while order * order < count:
+        order *= 2
+    index = np.arange(count)
+    x = np.zeros(count, dtype=np.int64)
+    y = np.zeros(count, dtype=np.int64)
+    scale = 1
+    while scale < order:
+        rx = (index // 2) & 1
+        ry = (index ^ rx) & 1
+        flip = (ry == 0) & (rx == 1)
+        x, y = np.where(flip, scale - 1 - x, x), np.where(flip, scale - 1 - y, y)
+        x, y = np.where(ry == 0, y, x), np.where(ry == 0, x, y)
+        x += scale * rx
+        y += scale * ry
+        index //= 4
+        scale *= 2
+    return np.stack([x, y], axis=1)
+
+def _initial_positions(count, sources, targets, k):
+    """
+    Tables in depth-first order along a Hilbert curve, so related tables
+    start out close together and the forces only refine the layout
+    """
+    neighbours = [[] for _ in range(count)]
+    for source, target in zip(sources.tolist(), targets.tolist()):
+        neighbours[source].append(target)
+        neighbours[target].append(source)
+    # Best connected tables first, each unvisited one starting a new group
+    seen = np.zeros(count, dtype=bool)
+    order = []
+    for root in np.argsort([-len(linked) for linked in neighbours], kind="stable").tolist():
+        if seen[root]:
+            continue
+        stack = [root]
+        while stack:
+            table = stack.pop()
+            if seen[table]:
+                continue
+            seen[table] = True
+            order.append(table)
+            stack.extend(other for other in reversed(neighbours[table]) if not seen[other])
+    positions = np.empty((count, 2))
+    positions[order] = _hilbert_points(count) * k
+    return positions
+
+def force_layout(count: int, sources, targets, iterations=None, spacing=None, seed: int = 0):
+    """
+    Positions for count tables connected by the (source, target) index
+    pairs, as a list of (x, y) top-left corners starting at the margin.
+    Deterministic for a given seed.
+    """
+    iterations = LAYOUT_ITERATIONS if iterations is None else iterations
+    k = LAYOUT_SPACING if spacing is None else spacing
+    if count == 0:
+        return []
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    # A little jitter so tables on one line do not only push along it
+    rng = np.random.default_rng(seed)
+    positions = _initial_positions(count, sources, targets, k) + rng.uniform(-k / 4, k / 4, (count, 2))
+
+    # Small steps: the initial placement is already close, forces only refine it
+    temperature = k / 4
+    for step in range(iterations):
+        force = _grid_repulsion(positions, k)
+        if len(sources):
+            delta = positions[sources] - positions[targets]
+            distance = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), 1.0)
+            # Logarithmic spring: long edges do not drag whole groups across the canvas
+            pull = delta * (k * np.log(distance / k) / distance)[:, None]
+            for axis in (0, 1):
+                force[:, axis] += np.bincount(targets, weights=pull[:, axis], minlength=count)
+                force[:, axis] -= np.bincount(sources, weights=pull[:, axis], minlength=count)
+        # Gravity keeps unrelated groups from drifting apart
+        force += (positions.mean(axis=0) - positions) * _GRAVITY
+
+        length = np.maximum(np.sqrt((force ** 2).sum(axis=1)), 1e-9)
+        step_size = temperature * (1 - step / iterations)
+        positions += force / length[:, None] * np.minimum(length, step_size)[:, None]
+
+    positions = np.rint(positions - positions.min(axis=0) + _MARGIN).astype(np.int64)
+    return [(int(x), int(y)) for x, y in positions]
+
+_pool = None
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=LAYOUT_WORKERS)
+    return _pool
+
+async def run_layout(count: int, sources, targets, seed: int = 0):
+    """
+    force_layout off the event loop: in the layout process pool when
+    LAYOUT_WORKERS is set, so several diagrams use several cores, and on
+    the threadpool otherwise
+    """
+    if LAYOUT_WORKERS:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor(), force_layout, count, sources, targets, None, None, seed)
+    return await run_in_threadpool(force_layout, count, sources, targets, seed=seed)
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,17 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, File, Header, HTTPException, Request, Response, UploadFile, WebSocket, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import func, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer, selectinload
+from typing import List, Optional, Union
+from datetime import datetime
+from itertools import groupby
+import base64
+import json
 
 import models
 import schemas
 import auth
 import collaboration
-from database import engine, SessionLocal, Base
+import schema_diff
+import bulk
+import sql_import
+import outbox
+import digest
+import request_metrics
+import history
+import fast_json
+import search
+import layout
+import spatial
+from graph import Edge, diagram_graph
+from collab_hub import hub
+from ddl import (
+    generate_sql_ddl, generate_ordered_ddl, generate_table_ddl, generate_json_schema, generate_table_json_schema
+)
+from export_cache import cache as export_cache, export_etag, etag_matches
+from fingerprints import table_create_fingerprints
+from positions import record_positions, update_positions
+from revisions import bump_revision, bump_revision_async
+from database import engine, async_engine, Base, DB_CREATE_ALL, get_db, get_async_db, pool_report
+
+# Rows fetched per round trip when streaming an export
+EXPORT_STREAM_CHUNK = 1000
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Registered before the engines first connect
+search.install(engine)
+if async_engine is not None:
+    search.install(async_engine.sync_engine)
+
+# Migrations own the schema, see DB_CREATE_ALL
+if DB_CREATE_ALL:
+    Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Schema Designer API")
 
@@ -22,22 +58,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Latency, SQL statement count and DB time per route, served on /metrics
+app.add_middleware(request_metrics.RequestMetricsMiddleware)
+request_metrics.instrument(engine)
+if async_engine is not None:
+    request_metrics.instrument(async_engine.sync_engine)
+
+@app.on_event("startup")
+def start_background_workers():
+    digest.notifications.start()
+    history.compactor.start()
+    if outbox.OUTBOX_WORKER:
+        outbox.sender.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    # Remaining digests are flushed to the outbox before the sender stops
+    digest.notifications.stop()
+    outbox.sender.stop()
+    history.compactor.stop()
+    layout.shutdown()
 
 @app.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await auth.authenticate_user_async(db, form_data.username, form_data.password)
+    except auth.PasswordQueueTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,10 +107,10 @@ async def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username or email already exists
-    db_user_username = db.query(models.User).filter(models.User.username == user.username).first()
-    db_user_email = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user_username = await db.scalar(select(models.User).where(models.User.username == user.username))
+    db_user_email = await db.scalar(select(models.User).where(models.User.email == user.email))
     
     if db_user_username:
         raise HTTPException(status_code=400, detail="Username already registered")
@@ -61,7 +118,14 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = auth.get_password_hash(user.password)
+    try:
+        hashed_password = await auth.get_password_hash_async(user.password)
+    except auth.PasswordQueueTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
     db_user = models.User(
         username=user.username, 
         email=user.email, 
@@ -69,8 +133,8 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @app.get("/users/me", response_model=schemas.User)
@@ -78,111 +142,672 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_act
     return current_user
 
 @app.post("/diagrams/", response_model=schemas.Diagram)
-def create_diagram(
+async def create_diagram(
     diagram: schemas.DiagramCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     db_diagram = models.Diagram(**diagram.dict(), owner_id=current_user.id)
     db.add(db_diagram)
-    db.commit()
-    db.refresh(db_diagram)
-    return db_diagram
+    await db.flush()
+    db.add(history.initial_snapshot(db_diagram.id))
+    await db.commit()
+    return await load_diagram_graph(db, db_diagram.id)
 
-@app.get("/diagrams/", response_model=List[schemas.Diagram])
-def read_diagrams(
+@app.get(
+    "/diagrams/",
+    response_model=Union[List[schemas.DiagramSummary], List[schemas.Diagram]]
+)
+async def read_diagrams(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    view: schemas.DiagramViewEnum = schemas.DiagramViewEnum.FULL,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    diagrams = db.query(models.Diagram).filter(
-        (models.Diagram.owner_id == current_user.id) | 
-        (models.Diagram.is_public == True)
-    ).offset(skip).limit(limit).all()
-    return diagrams
+    """
+    List diagrams visible to the current user, most recently updated first.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    keys = (await db.execute(
+        visible_diagram_keys(current_user.id, 0 if after else skip, limit, after)
+    )).all()
+    headers = {"X-Next-Cursor": encode_cursor(*keys[-1])} if len(keys) == limit else None
+
+    ids = [key.id for key in keys]
+    if not ids:
+        return fast_json.json_response(request, [], headers)
+
+    # Rows come back as Core tuples and are written straight into the
+    # response shape; validating ORM objects through the response model
+    # cost more than the SQL on large diagrams
+    if view == schemas.DiagramViewEnum.SUMMARY:
+        # Correlated counts, no join of every column row against its table
+        table_count = select(func.count()).where(
+            models.Table.diagram_id == models.Diagram.id
+        ).scalar_subquery()
+        column_count = select(func.count()).select_from(models.Column).join(
+            models.Table, models.Column.table_id == models.Table.id
+        ).where(models.Table.diagram_id == models.Diagram.id).scalar_subquery()
+        rows = await db.execute(
+            select(*DIAGRAM_FIELDS, table_count, column_count).where(models.Diagram.id.in_(ids))
+        )
+        summaries = {
+            row.id: {**diagram_dict(row), "table_count": row[-2], "column_count": row[-1]}
+            for row in rows
+        }
+        return fast_json.json_response(request, [summaries[diagram_id] for diagram_id in ids], headers)
+
+    # The whole page in three queries, one per level
+    diagrams = {
+        row.id: {**diagram_dict(row), "tables": [], "collaborators": []}
+        for row in await db.execute(select(*DIAGRAM_FIELDS).where(models.Diagram.id.in_(ids)))
+    }
+    tables = {}
+    for row in await db.execute(
+        select(models.Table.id, models.Table.name, models.Table.x_position, models.Table.y_position,
+               models.Table.diagram_id)
+        .where(models.Table.diagram_id.in_(ids))
+        .order_by(models.Table.id)
+    ):
+        table = tables[row.id] = {
+            "name": row.name,
+            "x_position": row.x_position,
+            "y_position": row.y_position,
+            "id": row.id,
+            "diagram_id": row.diagram_id,
+            "columns": []
+        }
+        diagrams[row.diagram_id]["tables"].append(table)
+    for row in await db.execute(
+        select(models.Column.id, models.Column.name, models.Column.data_type, models.Column.is_primary_key,
+               models.Column.is_nullable, models.Column.table_id)
+        .join(models.Table, models.Column.table_id == models.Table.id)
+        .where(models.Table.diagram_id.in_(ids))
+        .order_by(models.Column.id)
+    ):
+        tables[row.table_id]["columns"].append({
+            "name": row.name,
+            "data_type": row.data_type,
+            "is_primary_key": row.is_primary_key,
+            "is_nullable": row.is_nullable,
+            "id": row.id,
+            "table_id": row.table_id
+        })
+    return fast_json.json_response(request, [diagrams[diagram_id] for diagram_id in ids], headers)
+
+@app.get("/search", response_model=List[schemas.SearchHit])
+async def search_names(
+    q: str,
+    kind: Optional[schemas.SearchKindEnum] = None,
+    skip: int = 0,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Diagrams, tables and columns visible to the current user whose name
+    matches q, best match first. Prefixes and small typos still match.
+    """
+    if not search.fts_query(q):
+        raise HTTPException(status_code=400, detail="Search needs a word of at least 3 characters")
+    if skip < 0 or not 1 <= limit <= search.SEARCH_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"skip must be >= 0 and limit between 1 and {search.SEARCH_MAX_LIMIT}"
+        )
+    kinds = (kind.value,) if kind else search.KINDS
+    return await search.search(db, current_user.id, q, kinds, skip, limit)
 
 @app.post("/diagrams/{diagram_id}/tables/", response_model=schemas.Table)
-def create_table_for_diagram(
+async def create_table_for_diagram(
     diagram_id: int, 
     table: schemas.TableCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    # Check if diagram exists and belongs to current user
-    diagram = db.query(models.Diagram).filter(
-        models.Diagram.id == diagram_id, 
-        models.Diagram.owner_id == current_user.id
-    ).first()
-    
-    if not diagram:
-        raise HTTPException(status_code=404, detail="Diagram not found")
+    await collaboration.require_permission_async(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+    diagram = await db.get(models.Diagram, diagram_id)
     
+    table_hash, column_hashes = table_create_fingerprints(table)
+
     # Create table
     db_table = models.Table(
         name=table.name, 
         diagram_id=diagram_id,
         x_position=table.x_position,
-        y_position=table.y_position
+        y_position=table.y_position,
+        fingerprint=table_hash
     )
     db.add(db_table)
-    db.commit()
-    db.refresh(db_table)
+    await db.flush()
     
+    log = history.OperationLog()
+    log.table_created(db_table.id, table.name, table.columns, table.x_position, table.y_position)
+
     # Create columns
-    for column_data in table.columns:
+    for column_data, column_hash in zip(table.columns, column_hashes):
         db_column = models.Column(
             name=column_data.name,
             data_type=column_data.data_type,
             is_primary_key=column_data.is_primary_key,
             is_nullable=column_data.is_nullable,
-            table_id=db_table.id
+            table_id=db_table.id,
+            fingerprint=column_hash
         )
         db.add(db_column)
+    # The session does not autoflush; a snapshot taken by history.record
+    # reads the columns back from the database
+    await db.flush()
     
-    db.commit()
-    db.refresh(db_table)
+    revision = await bump_revision_async(db, diagram_id)
+    await db.run_sync(history.record, diagram_id, revision, current_user.id, log)
+    await db.commit()
+
+    await collaboration.notify_collaborators_async(
+        db, diagram, current_user, {"table_added": 1, "column_added": len(table.columns)}
+    )
     
+    db_table = await db.scalar(
+        select(models.Table)
+        .options(selectinload(models.Table.columns))
+        .where(models.Table.id == db_table.id)
+        .execution_options(populate_existing=True)
+    )
+    hub.publish(diagram_id, {
+        "type": "table.created",
+        "user_id": current_user.id,
+        "table": schemas.Table.from_orm(db_table).dict()
+    })
     return db_table
 
+@app.get("/diagrams/{diagram_id}/tables", response_model=List[schemas.Table])
+async def read_tables(
+    request: Request,
+    diagram_id: int,
+    bbox: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Tables of a diagram with their columns, in id order. With
+    bbox=x0,y0,x1,y1 only the tables positioned inside that viewport,
+    so clients can load large diagrams as they pan and zoom.
+    """
+    await collaboration.require_permission_async(db, diagram_id, current_user.id)
+    if bbox is None:
+        where = models.Table.diagram_id == diagram_id
+    else:
+        try:
+            box = spatial.parse_box(bbox)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox must be four numbers: x0,y0,x1,y1")
+        where = await spatial.box_filter(db, diagram_id, box)
+        if where is None:
+            return fast_json.json_response(request, [])
+
+    # Core rows straight into the response shape, as in read_diagrams
+    tables = {}
+    for row in await db.execute(
+        select(models.Table.id, models.Table.name, models.Table.x_position, models.Table.y_position)
+        .where(where)
+        .order_by(models.Table.id)
+    ):
+        tables[row.id] = {
+            "name": row.name,
+            "x_position": row.x_position,
+            "y_position": row.y_position,
+            "id": row.id,
+            "diagram_id": diagram_id,
+            "columns": []
+        }
+    for row in await db.execute(
+        select(models.Column.id, models.Column.name, models.Column.data_type, models.Column.is_primary_key,
+               models.Column.is_nullable, models.Column.table_id)
+        .join(models.Table, models.Column.table_id == models.Table.id)
+        .where(where)
+        .order_by(models.Column.id)
+    ):
+        tables[row.table_id]["columns"].append({
+            "name": row.name,
+            "data_type": row.data_type,
+            "is_primary_key": row.is_primary_key,
+            "is_nullable": row.is_nullable,
+            "id": row.id,
+            "table_id": row.table_id
+        })
+    return fast_json.json_response(request, list(tables.values()))
+
+@app.post("/diagrams/{diagram_id}/tables:batch", response_model=schemas.TableBatchResult)
+def create_tables_batch(
+    diagram_id: int,
+    tables: List[schemas.TableCreate],
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Create many tables with their columns in a single transaction
+    """
+    collaboration.require_permission(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+    diagram = db.get(models.Diagram, diagram_id)
+
+    log = history.OperationLog()
+    table_ids, column_count = bulk.insert_tables(db, diagram_id, tables, log)
+
+    history.record(db, diagram_id, bump_revision(db, diagram_id), current_user.id, log)
+    db.commit()
+
+    collaboration.notify_collaborators(
+        db, diagram, current_user, {"table_added": len(table_ids), "column_added": column_count}
+    )
+    hub.publish(diagram_id, {"type": "tables.created", "user_id": current_user.id, "table_ids": table_ids})
+
+    return {"table_ids": table_ids, "column_count": column_count}
+
+@app.post("/diagrams/{diagram_id}/import", response_model=schemas.ImportResult)
+def import_diagram_sql(
+    diagram_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Import the tables of an uploaded .sql schema dump into a diagram
+    """
+    collaboration.require_permission(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+    diagram = db.get(models.Diagram, diagram_id)
+
+    # The upload is spooled to disk by Starlette and parsed incrementally
+    log = history.OperationLog()
+    table_count, column_count = sql_import.import_sql_dump(db, diagram_id, file.file, log)
+
+    history.record(db, diagram_id, bump_revision(db, diagram_id), current_user.id, log)
+    db.commit()
+
+    collaboration.notify_collaborators(
+        db, diagram, current_user, {"table_added": table_count, "column_added": column_count}
+    )
+    # Too many ids to list; clients reload the diagram
+    hub.publish(diagram_id, {"type": "tables.imported", "user_id": current_user.id, "table_count": table_count})
+
+    return {"table_count": table_count, "column_count": column_count}
+
+@app.patch("/diagrams/{diagram_id}/positions", response_model=schemas.PositionUpdateResult)
+async def update_table_positions(
+    diagram_id: int,
+    positions: List[schemas.TablePosition],
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Move many tables of a diagram in one statement. Tables of other
+    diagrams are ignored; the last entry wins for a repeated table.
+    """
+    await collaboration.require_permission_async(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+
+    latest = {position.table_id: (position.x, position.y) for position in positions}
+    updated = await update_positions(db, diagram_id, latest)
+    if updated:
+        await record_positions(db, diagram_id, current_user.id, latest)
+    await db.commit()
+    spatial.positions_changed(diagram_id)
+
+    diagram = await db.get(models.Diagram, diagram_id)
+    await collaboration.notify_moves_async(db, diagram, current_user, latest)
+    hub.positions_written(diagram_id, current_user.id, latest)
+    return {"updated": updated}
+
+@app.post("/diagrams/{diagram_id}/layout", response_model=schemas.LayoutResult)
+async def layout_diagram(
+    diagram_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Arrange every table of a diagram with a force-directed layout over its
+    relationships and save the positions in one bulk update
+    """
+    await collaboration.require_permission_async(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+    revision = await db.scalar(select(models.Diagram.revision).where(models.Diagram.id == diagram_id))
+    graph = await db.run_sync(diagram_graph, diagram_id, revision)
+
+    table_ids = list(graph.table_names)
+    index = {table_id: number for number, table_id in enumerate(table_ids)}
+    points = await layout.run_layout(
+        len(table_ids),
+        [index[edge.source_table] for edge in graph.edges],
+        [index[edge.target_table] for edge in graph.edges],
+        seed=diagram_id
+    )
+
+    latest = dict(zip(table_ids, points))
+    updated = await update_positions(db, diagram_id, latest)
+    if updated:
+        await record_positions(db, diagram_id, current_user.id, latest)
+    await db.commit()
+    spatial.positions_changed(diagram_id)
+
+    diagram = await db.get(models.Diagram, diagram_id)
+    await collaboration.notify_moves_async(db, diagram, current_user, latest)
+    hub.positions_written(diagram_id, current_user.id, latest)
+    return {
+        "updated": updated,
+        "width": max((x for x, _ in points), default=0) + int(layout.LAYOUT_SPACING),
+        "height": max((y for _, y in points), default=0) + int(layout.LAYOUT_SPACING)
+    }
+
+@app.post("/diagrams/{diagram_id}/relationships", response_model=schemas.Relationship)
+async def create_relationship(
+    diagram_id: int,
+    relationship: schemas.RelationshipCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Add a foreign key from source_column_id to the target_column_id it
+    references; both columns must belong to the diagram
+    """
+    await collaboration.require_permission_async(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+    diagram = await db.get(models.Diagram, diagram_id)
+
+    if relationship.source_column_id == relationship.target_column_id:
+        raise HTTPException(status_code=400, detail="A column cannot reference itself")
+    columns = {
+        row.id: row for row in (await db.execute(
+            select(models.Column.id, models.Column.table_id, models.Column.name)
+            .join(models.Table, models.Table.id == models.Column.table_id)
+            .where(
+                models.Column.id.in_([relationship.source_column_id, relationship.target_column_id]),
+                models.Table.diagram_id == diagram_id
+            )
+        )).all()
+    }
+    if len(columns) != 2:
+        raise HTTPException(status_code=404, detail="Column not found in this diagram")
+    if await db.scalar(select(models.Relationship.id).where(
+        models.Relationship.source_column_id == relationship.source_column_id,
+        models.Relationship.target_column_id == relationship.target_column_id
+    )):
+        raise HTTPException(status_code=409, detail="Relationship already exists")
+
+    db_relationship = models.Relationship(
+        diagram_id=diagram_id,
+        source_column_id=relationship.source_column_id,
+        target_column_id=relationship.target_column_id,
+        cardinality=models.Cardinality(relationship.cardinality.value)
+    )
+    db.add(db_relationship)
+    await db.flush()
+
+    source, target = columns[relationship.source_column_id], columns[relationship.target_column_id]
+    log = history.OperationLog()
+    log.relationship_created(Edge(
+        db_relationship.id, source.table_id, source.name, target.table_id, target.name, db_relationship.cardinality
+    ))
+    revision = await bump_revision_async(db, diagram_id)
+    await db.run_sync(history.record, diagram_id, revision, current_user.id, log)
+    await db.commit()
+
+    await collaboration.notify_collaborators_async(db, diagram, current_user, {"relationship_added": 1})
+    hub.publish(diagram_id, {
+        "type": "relationship.created",
+        "user_id": current_user.id,
+        "relationship": schemas.Relationship.from_orm(db_relationship).dict()
+    })
+    return db_relationship
+
+@app.get("/diagrams/{diagram_id}/relationships", response_model=List[schemas.Relationship])
+async def read_relationships(
+    diagram_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    await collaboration.require_permission_async(db, diagram_id, current_user.id)
+    relationships = await db.scalars(
+        select(models.Relationship)
+        .where(models.Relationship.diagram_id == diagram_id)
+        .order_by(models.Relationship.id)
+    )
+    return relationships.all()
+
+@app.delete("/diagrams/{diagram_id}/relationships/{relationship_id}")
+async def delete_relationship(
+    diagram_id: int,
+    relationship_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    await collaboration.require_permission_async(db, diagram_id, current_user.id, models.PermissionLevel.EDIT)
+    diagram = await db.get(models.Diagram, diagram_id)
+
+    found = (await db.execute(
+        select(models.Relationship, models.Column.table_id)
+        .join(models.Column, models.Column.id == models.Relationship.source_column_id)
+        .where(models.Relationship.id == relationship_id, models.Relationship.diagram_id == diagram_id)
+    )).first()
+    if found is None:
+        raise HTTPException(status_code=404, detail="Relationship not found")
+    await db.delete(found.Relationship)
+
+    log = history.OperationLog()
+    log.relationship_deleted(relationship_id, found.table_id)
+    revision = await bump_revision_async(db, diagram_id)
+    await db.run_sync(history.record, diagram_id, revision, current_user.id, log)
+    await db.commit()
+
+    await collaboration.notify_collaborators_async(db, diagram, current_user, {"relationship_removed": 1})
+    hub.publish(diagram_id, {
+        "type": "relationship.deleted", "user_id": current_user.id, "relationship_id": relationship_id
+    })
+    return {"message": "Relationship removed successfully"}
+
+@app.get("/diagrams/{diagram_id}/tables/{table_id}/dependencies", response_model=schemas.TableDependencies)
+def table_dependencies(
+    diagram_id: int,
+    table_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Tables one table references and is referenced by, directly and
+    transitively, answered from the diagram's in-memory graph
+    """
+    collaboration.require_permission(db, diagram_id, current_user.id)
+    revision = db.scalar(select(models.Diagram.revision).where(models.Diagram.id == diagram_id))
+    graph = diagram_graph(db, diagram_id, revision)
+    if table_id not in graph.table_names:
+        raise HTTPException(status_code=404, detail="Table not found")
+
+    return {
+        "table_id": table_id,
+        "references": graph.references(table_id),
+        "referenced_by": graph.referenced_by(table_id),
+        "depends_on": graph.reachable(table_id),
+        "in_cycle": graph.in_cycle(table_id)
+    }
+
 @app.get("/diagrams/{diagram_id}/export", response_model=schemas.DiagramExport)
 def export_diagram(
     diagram_id: int, 
+    stream: bool = False,
+    format: schemas.ExportFormatEnum = schemas.ExportFormatEnum.SQL,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    # Check if diagram exists and belongs to current user or is public
-    diagram = db.query(models.Diagram).filter(
-        models.Diagram.id == diagram_id,
-        ((models.Diagram.owner_id == current_user.id) | (models.Diagram.is_public == True))
+    collaboration.require_permission(db, diagram_id, current_user.id)
+    current = db.query(models.Diagram.revision, models.Diagram.name).filter(
+        models.Diagram.id == diagram_id
     ).first()
-    
-    if not diagram:
-        raise HTTPException(status_code=404, detail="Diagram not found")
-    
-    # Generate SQL DDL
-    sql_ddl = generate_sql_ddl(diagram)
-    
-    # Generate JSON schema
-    json_schema = generate_json_schema(diagram)
-    
+
+    etag = export_etag(diagram_id, current.revision, format.value if stream else None)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    if stream:
+        # Flat memory for any diagram size; bypasses the export cache
+        if format == schemas.ExportFormatEnum.NDJSON:
+            body = stream_json_schema(db, diagram_id, current.name)
+            media_type = "application/x-ndjson"
+        else:
+            body = stream_sql_ddl(db, diagram_id, diagram_graph(db, diagram_id, current.revision))
+            media_type = "text/plain; charset=utf-8"
+        return StreamingResponse(body, media_type=media_type, headers={"ETag": etag})
+
+    content = export_cache.get(diagram_id, current.revision)
+    if content is None:
+        diagram = db.query(models.Diagram).options(
+            selectinload(models.Diagram.tables).selectinload(models.Table.columns)
+        ).filter(models.Diagram.id == diagram_id).first()
+
+        # Generate SQL DDL, tables in dependency order
+        sql_ddl = generate_sql_ddl(diagram, diagram_graph(db, diagram_id, diagram.revision))
+        
+        # Generate JSON schema
+        json_schema = generate_json_schema(diagram)
+
+        # Serialized the same way FastAPI's JSONResponse would
+        content = json.dumps(
+            {"sql_ddl": sql_ddl, "json_schema": json_schema},
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+        # Key by the revision the graph was loaded at
+        etag = export_etag(diagram_id, diagram.revision)
+        export_cache.put(diagram_id, diagram.revision, content)
+
+    return Response(content=content, media_type="application/json", headers={"ETag": etag})
+
+@app.get("/diagrams/{diagram_id}/history", response_model=List[schemas.HistoryEntry])
+async def read_diagram_history(
+    diagram_id: int,
+    before: Optional[int] = None,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Recorded revisions of a diagram, newest first. Pass the last revision
+    back as `before` to get the next page.
+    """
+    await collaboration.require_permission_async(db, diagram_id, current_user.id)
+    query = select(models.DiagramOperation).where(models.DiagramOperation.diagram_id == diagram_id)
+    if before is not None:
+        query = query.where(models.DiagramOperation.revision < before)
+    # The payload stays in the database; listing only needs the metadata
+    entries = await db.scalars(
+        query.options(defer(models.DiagramOperation.payload))
+        .order_by(models.DiagramOperation.revision.desc())
+        .limit(limit)
+    )
+    return entries.all()
+
+@app.get("/diagrams/{diagram_id}/revisions/{revision}", response_model=schemas.DiagramRevision)
+def read_diagram_revision(
+    diagram_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    The tables, columns and table positions of a diagram as they were at
+    a past revision
+    """
+    collaboration.require_permission(db, diagram_id, current_user.id)
+    tables = history.load_revision(db, diagram_id, revision)
+    if tables is None:
+        raise HTTPException(status_code=404, detail="Revision not found in the diagram history")
+
+    return {
+        "diagram_id": diagram_id,
+        "revision": revision,
+        "tables": [
+            {
+                "id": table["id"],
+                "name": table["name"],
+                "x": table.get("x"),
+                "y": table.get("y"),
+                "columns": [
+                    {"name": name, "data_type": data_type, "is_primary_key": primary_key, "is_nullable": nullable}
+                    for name, data_type, primary_key, nullable in table["columns"]
+                ],
+                "foreign_keys": [
+                    {
+                        "relationship_id": relationship_id,
+                        "column": column,
+                        "target_table_id": target_table_id,
+                        "target_column": target_column,
+                        "cardinality": cardinality
+                    }
+                    for relationship_id, column, target_table_id, target_column, cardinality
+                    in table.get("foreign_keys", ())
+                ]
+            } for table in tables.values()
+        ]
+    }
+
+@app.get("/diagrams/{diagram_id}/migration", response_model=schemas.MigrationScript)
+def diagram_migration(
+    diagram_id: int,
+    base_id: Optional[int] = None,
+    base_revision: Optional[int] = None,
+    target_revision: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Generate the ALTER script that migrates diagram base_id to this
+    diagram, or this diagram from base_revision to target_revision (its
+    current revision by default)
+    """
+    if (base_id is None) == (base_revision is None):
+        raise HTTPException(status_code=400, detail="Pass either base_id or base_revision")
+    if base_id is not None and target_revision is not None:
+        raise HTTPException(status_code=400, detail="target_revision needs base_revision")
+
+    try:
+        if base_id is not None:
+            for visible_id in {diagram_id, base_id}:
+                collaboration.require_permission(db, visible_id, current_user.id)
+            statements, changed_tables = schema_diff.migration_statements(db, base_id, diagram_id)
+        else:
+            collaboration.require_permission(db, diagram_id, current_user.id)
+            if target_revision is None:
+                target_revision = db.scalar(select(models.Diagram.revision).where(models.Diagram.id == diagram_id))
+            migration = schema_diff.revision_migration_statements(db, diagram_id, base_revision, target_revision)
+            if migration is None:
+                raise HTTPException(status_code=404, detail="Revision not found in the diagram history")
+            statements, changed_tables = migration
+    except schema_diff.DuplicateTableName as error:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Tables are matched by name, but several are named {error.args[0]}"
+        )
+
     return {
-        "sql_ddl": sql_ddl,
-        "json_schema": json_schema
+        "base_id": diagram_id if base_id is None else base_id,
+        "target_id": diagram_id,
+        "base_revision": base_revision,
+        "target_revision": target_revision,
+        "sql": "\n".join(statements),
+        "changed_tables": changed_tables
     }
 
 @app.post("/diagrams/{diagram_id}/invite", response_model=dict)
-def invite_collaborator(
+async def invite_collaborator(
     diagram_id: int,
     invitation: schemas.InvitationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Invite a user to collaborate on a diagram
     """
     try:
-        result = collaboration.invite_user_to_diagram(
+        result = await collaboration.invite_user_to_diagram(
             db, 
             diagram_id, 
             current_user.id, 
@@ -193,17 +818,36 @@ def invite_collaborator(
     except HTTPException as e:
         raise e
 
+@app.post("/diagrams/{diagram_id}/invite:batch", response_model=schemas.InvitationBatchResult)
+async def invite_collaborators_batch(
+    diagram_id: int,
+    batch: schemas.InvitationBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Invite many emails at once: registered users become collaborators,
+    the others get an invitation email
+    """
+    return await collaboration.invite_users_to_diagram(
+        db,
+        diagram_id,
+        current_user.id,
+        batch.invited_emails,
+        batch.permission_level
+    )
+
 @app.get("/diagrams/{diagram_id}/collaborators", response_model=List[dict])
-def get_diagram_collaborators(
+async def get_diagram_collaborators(
     diagram_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Get all collaborators for a specific diagram
     """
     try:
-        collaborators = collaboration.get_diagram_collaborators(
+        collaborators = await collaboration.get_diagram_collaborators(
             db, 
             diagram_id, 
             current_user.id
@@ -213,17 +857,17 @@ def get_diagram_collaborators(
         raise e
 
 @app.delete("/diagrams/{diagram_id}/collaborators/{collaborator_id}")
-def remove_collaborator(
+async def remove_collaborator(
     diagram_id: int,
     collaborator_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Remove a collaborator from a diagram
     """
     try:
-        result = collaboration.remove_collaborator(
+        result = await collaboration.remove_collaborator(
             db, 
             diagram_id, 
             current_user.id, 
@@ -234,18 +878,18 @@ def remove_collaborator(
         raise e
 
 @app.put("/diagrams/{diagram_id}/collaborators/{collaborator_id}/permission")
-def update_collaborator_permission(
+async def update_collaborator_permission(
     diagram_id: int,
     collaborator_id: int,
     new_permission: schemas.PermissionLevelEnum,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Update a collaborator's permission level
     """
     try:
-        result = collaboration.update_collaborator_permission(
+        result = await collaboration.update_collaborator_permission(
             db, 
             diagram_id, 
             current_user.id, 
@@ -257,34 +901,42 @@ def update_collaborator_permission(
         raise e
 
 @app.get("/invitations", response_model=List[schemas.Invitation])
-def get_user_invitations(
-    db: Session = Depends(get_db),
+async def get_user_invitations(
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Get all pending invitations for the current user
     """
-    invitations = db.query(models.DiagramInvitation).filter(
+    invitations = await db.scalars(select(models.DiagramInvitation).where(
         models.DiagramInvitation.invited_email == current_user.email,
         models.DiagramInvitation.status == models.InvitationStatus.PENDING
-    ).all()
+    ))
     
-    return invitations
+    return invitations.all()
+
+@app.websocket("/ws/diagrams/{diagram_id}")
+async def diagram_room(websocket: WebSocket, diagram_id: int, token: str):
+    """
+    Live collaboration room of a diagram; browsers cannot set headers on a
+    WebSocket, so the bearer token comes as a query parameter
+    """
+    await hub.serve(websocket, diagram_id, token)
 
 @app.post("/invitations/{invitation_id}/accept")
-def accept_invitation(
+async def accept_invitation(
     invitation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """
     Accept a diagram collaboration invitation
     """
-    invitation = db.query(models.DiagramInvitation).filter(
+    invitation = await db.scalar(select(models.DiagramInvitation).where(
         models.DiagramInvitation.id == invitation_id,
         models.DiagramInvitation.invited_email == current_user.email,
         models.DiagramInvitation.status == models.InvitationStatus.PENDING
-    ).first()
+    ))
     
     if not invitation:
         raise HTTPException(status_code=404, detail="Invitation not found")
@@ -300,66 +952,189 @@ def accept_invitation(
     invitation.status = models.InvitationStatus.ACCEPTED
     
     db.add(collaboration_entry)
-    db.commit()
+    await db.commit()
     
     return {"message": "Invitation accepted"}
 
-def generate_sql_ddl(diagram):
-    """Generate SQL DDL for a diagram"""
-    ddl = []
-    for table in diagram.tables:
-        table_ddl = f"CREATE TABLE {table.name} (\n"
-        columns = []
-        primary_keys = []
-        
-        for column in table.columns:
-            column_def = f"    {column.name} {column.data_type}"
-            
-            if not column.is_nullable:
-                column_def += " NOT NULL"
-            
-            if column.is_primary_key:
-                primary_keys.append(column.name)
-            
-            columns.append(column_def)
-        
-        # Add columns to table definition
-        table_ddl += ",\n".join(columns)
-        
-        # Add primary key constraint if exists
-        if primary_keys:
-            table_ddl += f",\n    PRIMARY KEY ({', '.join(primary_keys)})"
-        
-        table_ddl += "\n);"
-        ddl.append(table_ddl)
-    
-    return "\n\n".join(ddl)
+# Diagram columns in schemas.Diagram field order
+DIAGRAM_FIELDS = (
+    models.Diagram.name,
+    models.Diagram.description,
+    models.Diagram.is_public,
+    models.Diagram.id,
+    models.Diagram.owner_id,
+    models.Diagram.revision,
+    models.Diagram.created_at,
+    models.Diagram.updated_at,
+)
 
-def generate_json_schema(diagram):
-    """Generate JSON schema representation of a diagram"""
-    schema = {
-        "name": diagram.name,
-        "tables": []
+def diagram_dict(row):
+    """The schemas.Diagram fields of a DIAGRAM_FIELDS row, as jsonable_encoder would give them"""
+    return {
+        "name": row.name,
+        "description": row.description,
+        "is_public": row.is_public,
+        "id": row.id,
+        "owner_id": row.owner_id,
+        "revision": row.revision,
+        "created_at": row.created_at.isoformat(),
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
     }
-    
-    for table in diagram.tables:
-        table_schema = {
-            "name": table.name,
-            "columns": []
-        }
-        
-        for column in table.columns:
-            column_schema = {
-                "name": column.name,
-                "type": column.data_type,
-                "nullable": column.is_nullable,
-                "primary_key": column.is_primary_key
-            }
-            table_schema["columns"].append(column_schema)
-        
-        schema["tables"].append(table_schema)
-    
-    return schema
+
+def encode_cursor(updated_at, diagram_id):
+    """Encode a diagram listing position as an opaque cursor"""
+    payload = json.dumps([updated_at.isoformat(), diagram_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        updated_at, diagram_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(diagram_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def visible_diagram_keys(user_id, skip, limit, after=None):
+    """
+    Query for the (updated_at, id) keys of diagrams visible to a user,
+    newest first.
+
+    Owned and public diagrams each seek their own index on (updated_at, id),
+    diagrams shared with the user are found through their collaborations,
+    and the branches are merged, so a page costs the same however deep it is.
+    """
+    key = (models.Diagram.updated_at, models.Diagram.id)
+    shared = select(models.DiagramCollaboration.diagram_id).where(models.DiagramCollaboration.user_id == user_id)
+    branches = [
+        models.Diagram.owner_id == user_id,
+        (models.Diagram.is_public == True) & (models.Diagram.owner_id != user_id),
+        # Shared with the user and not already listed by the rules above
+        models.Diagram.id.in_(shared) & models.Diagram.is_public.isnot(True) & (models.Diagram.owner_id != user_id),
+    ]
+
+    pages = []
+    for predicate in branches:
+        branch = select(*key).where(predicate)
+        if after:
+            branch = branch.where(tuple_(*key) < tuple_(*after, types=[c.type for c in key]))
+        branch = branch.order_by(key[0].desc(), key[1].desc()).limit(skip + limit)
+        pages.append(select(branch.subquery()))
+
+    merged = union_all(*pages).subquery()
+    return (
+        select(merged)
+        .order_by(merged.c.updated_at.desc(), merged.c.id.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+
+async def load_diagram_graph(db, diagram_id):
+    """A diagram with its tables and columns loaded, re-read from the database"""
+    return await db.scalar(
+        select(models.Diagram)
+        .options(selectinload(models.Diagram.tables).selectinload(models.Table.columns))
+        .where(models.Diagram.id == diagram_id)
+        .execution_options(populate_existing=True)
+    )
+
+def iter_diagram_tables(db, diagram_id):
+    """
+    Yield (table_name, columns) for every table of a diagram, reading the
+    joined rows through a server-side cursor EXPORT_STREAM_CHUNK at a time
+    """
+    rows = db.execute(
+        select(
+            models.Table.id.label("table_id"),
+            models.Table.name.label("table_name"),
+            models.Column.id.label("column_id"),
+            models.Column.name,
+            models.Column.data_type,
+            models.Column.is_primary_key,
+            models.Column.is_nullable
+        )
+        .outerjoin(models.Column, models.Column.table_id == models.Table.id)
+        .where(models.Table.diagram_id == diagram_id)
+        .order_by(models.Table.id, models.Column.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_STREAM_CHUNK)
+    )
+    for _, table_rows in groupby(rows, key=lambda row: row.table_id):
+        table_rows = list(table_rows)
+        columns = [row for row in table_rows if row.column_id is not None]
+        yield table_rows[0].table_name, columns
+
+def iter_tables_in_order(db, graph, table_ids):
+    """
+    Yield (table_id, table_name, columns) in the order of table_ids, reading
+    the columns of EXPORT_STREAM_CHUNK tables per query
+    """
+    for start in range(0, len(table_ids), EXPORT_STREAM_CHUNK):
+        chunk = table_ids[start:start + EXPORT_STREAM_CHUNK]
+        rows = db.execute(
+            select(
+                models.Column.table_id,
+                models.Column.name,
+                models.Column.data_type,
+                models.Column.is_primary_key,
+                models.Column.is_nullable
+            )
+            .where(models.Column.table_id.in_(chunk))
+            .order_by(models.Column.table_id, models.Column.id)
+        )
+        columns = {table_id: list(table_rows) for table_id, table_rows in groupby(rows, key=lambda row: row.table_id)}
+        for table_id in chunk:
+            yield table_id, graph.table_names[table_id], columns.get(table_id, [])
+
+def stream_sql_ddl(db, diagram_id, graph):
+    """Stream the same text as generate_sql_ddl one table at a time"""
+    if graph.edges:
+        order, _ = graph.creation_order()
+        statements = generate_ordered_ddl(graph, iter_tables_in_order(db, graph, order))
+    else:
+        statements = (
+            generate_table_ddl(table_name, columns) for table_name, columns in iter_diagram_tables(db, diagram_id)
+        )
+    for index, statement in enumerate(statements):
+        yield ("\n\n" if index else "") + statement
+
+def stream_json_schema(db, diagram_id, diagram_name):
+    """
+    Stream the JSON schema as NDJSON: a header line with the diagram name,
+    then one line per table
+    """
+    yield json.dumps({"name": diagram_name}, ensure_ascii=False) + "\n"
+    for table_name, columns in iter_diagram_tables(db, diagram_id):
+        yield json.dumps(generate_table_json_schema(table_name, columns), ensure_ascii=False) + "\n"
+
+@app.get("/internal/principal-cache", dependencies=[Depends(auth.require_ops_token)])
+def principal_cache_stats():
+    """
+    Hit and miss counters of the authenticated principal cache
+    """
+    return auth.principal_cache.stats()
+
+@app.get("/internal/permission-cache", dependencies=[Depends(auth.require_ops_token)])
+def permission_cache_stats():
+    """
+    Hit and miss counters of the diagram permission cache
+    """
+    return collaboration.permission_cache.stats()
+
+@app.get("/internal/db-pool", dependencies=[Depends(auth.require_ops_token)])
+def db_pool_stats():
+    """
+    Checked-out and overflow connections and checkout wait times per engine
+    """
+    return pool_report()
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(auth.require_ops_token)])
+def prometheus_metrics():
+    """
+    Request and connection pool metrics in the Prometheus text format
+    """
+    return PlainTextResponse(
+        request_metrics.render_prometheus(pool_report()),
+        media_type="text/plain; version=0.0.4"
+    )
 
 @app.get("/")
 def read_root():
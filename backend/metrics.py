@@ -0,0 +1,100 @@
+import bisect
+import threading
+
+# Upper bounds in milliseconds, Prometheus style; the last bucket is +Inf
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """{"buckets": {upper bound: cumulative count}, "count", "sum"}"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": running, "sum": round(total, 6)}
+
+def _label_text(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class HistogramFamily:
+    """Histograms of one metric, one per combination of label values"""
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self._children.items()):
+            snapshot = child.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                labels = _label_text(self.labelnames, values, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {snapshot['sum']}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+class CounterFamily:
+    """Monotonic counters of one metric, one per combination of label values"""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in values)
+        return lines
+
+def render_gauge(name: str, help_text: str, samples):
+    """Exposition lines for a gauge from (labels dict, value) samples"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_label_text(labels.keys(), labels.values())} {value}")
+    return lines
@@ -0,0 +1,47 @@
+"""Keyset pagination indexes for diagram listing
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Listing seeks on (updated_at, id), so it must never be NULL
+    op.execute("UPDATE diagrams SET updated_at = created_at WHERE updated_at IS NULL")
+    with op.batch_alter_table("diagrams") as batch:
+        batch.alter_column("updated_at", server_default=sa.func.now())
+
+    # Build without locking writes on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_diagrams_owner_updated_id",
+            "diagrams",
+            ["owner_id", "updated_at", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_diagrams_public_updated_id",
+            "diagrams",
+            ["updated_at", "id"],
+            # The predicate models.Diagram declares, so autogenerate sees no drift
+            postgresql_where=sa.column("is_public").is_(True),
+            sqlite_where=sa.column("is_public").is_(True),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_diagrams_public_updated_id", "diagrams", postgresql_concurrently=True)
+        op.drop_index("ix_diagrams_owner_updated_id", "diagrams", postgresql_concurrently=True)
+    with op.batch_alter_table("diagrams") as batch:
+        batch.alter_column("updated_at", server_default=None)
@@ -0,0 +1,26 @@
+"""Diagram revision counter
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "diagrams",
+        sa.Column("revision", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("diagrams") as batch:
+        batch.drop_column("revision")
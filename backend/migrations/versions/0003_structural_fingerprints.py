@@ -0,0 +1,115 @@
+"""Structural fingerprints for tables and columns
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+import hashlib
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Frozen copies of the app's constants and fingerprints.py as of this
+# revision, so later changes to the app never change what it writes
+
+# Tables per backfill round; their ids go into an IN list, so stay below
+# SQLite's bound parameter limit
+BACKFILL_CHUNK = 500
+
+
+def _digest(*parts):
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def column_fingerprint(name, data_type, is_primary_key, is_nullable):
+    return _digest(
+        name or "",
+        data_type or "",
+        "1" if is_primary_key else "0",
+        "1" if is_nullable else "0",
+    )
+
+
+def table_fingerprint(name, column_fingerprints):
+    return _digest(name or "", *sorted(column_fingerprints))
+
+
+def upgrade():
+    op.add_column("tables", sa.Column("fingerprint", sa.String(32), nullable=True))
+    op.add_column("columns", sa.Column("fingerprint", sa.String(32), nullable=True))
+    op.create_index("ix_columns_table_id", "columns", ["table_id"])
+    op.create_index(
+        "ix_tables_diagram_name_fingerprint", "tables", ["diagram_id", "name", "fingerprint"]
+    )
+
+    bind = op.get_bind()
+    tables = sa.table("tables", sa.column("id"), sa.column("name"), sa.column("fingerprint"))
+    columns = sa.table(
+        "columns",
+        sa.column("id"),
+        sa.column("table_id"),
+        sa.column("name"),
+        sa.column("data_type"),
+        sa.column("is_primary_key"),
+        sa.column("is_nullable"),
+        sa.column("fingerprint"),
+    )
+
+    last_id = 0
+    while True:
+        chunk = bind.execute(
+            sa.select(tables.c.id, tables.c.name)
+            .where(tables.c.id > last_id)
+            .order_by(tables.c.id)
+            .limit(BACKFILL_CHUNK)
+        ).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        column_hashes = defaultdict(list)
+        column_updates = []
+        for row in bind.execute(
+            sa.select(columns).where(columns.c.table_id.in_([table.id for table in chunk]))
+        ):
+            column_hash = column_fingerprint(
+                row.name, row.data_type, row.is_primary_key, row.is_nullable
+            )
+            column_hashes[row.table_id].append(column_hash)
+            column_updates.append({"column_id": row.id, "column_hash": column_hash})
+
+        if column_updates:
+            bind.execute(
+                columns.update()
+                .where(columns.c.id == sa.bindparam("column_id"))
+                .values(fingerprint=sa.bindparam("column_hash")),
+                column_updates,
+            )
+        bind.execute(
+            tables.update()
+            .where(tables.c.id == sa.bindparam("table_id"))
+            .values(fingerprint=sa.bindparam("table_hash")),
+            [
+                {
+                    "table_id": table.id,
+                    "table_hash": table_fingerprint(table.name, column_hashes[table.id]),
+                }
+                for table in chunk
+            ],
+        )
+
+
+def downgrade():
+    op.drop_index("ix_tables_diagram_name_fingerprint", "tables")
+    op.drop_index("ix_columns_table_id", "columns")
+    with op.batch_alter_table("columns") as batch:
+        batch.drop_column("fingerprint")
+    with op.batch_alter_table("tables") as batch:
+        batch.drop_column("fingerprint")
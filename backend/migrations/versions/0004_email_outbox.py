@@ -0,0 +1,52 @@
+"""Email outbox
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "email_outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("to_email", sa.String(), nullable=False),
+        sa.Column("subject", sa.String(), nullable=False),
+        sa.Column("body", sa.Text(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("PENDING", "SENT", "FAILED", name="outboxstatus"),
+            nullable=False,
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column(
+            "next_attempt_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_email_outbox_id", "email_outbox", ["id"])
+    op.create_index(
+        "ix_email_outbox_status_next_attempt",
+        "email_outbox",
+        ["status", "next_attempt_at"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_email_outbox_status_next_attempt", table_name="email_outbox")
+    op.drop_index("ix_email_outbox_id", table_name="email_outbox")
+    op.drop_table("email_outbox")
+    sa.Enum(name="outboxstatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,31 @@
+"""Collaboration lookup by user
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Build without locking writes on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_diagram_collaborations_user_diagram",
+            "diagram_collaborations",
+            ["user_id", "diagram_id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_diagram_collaborations_user_diagram", "diagram_collaborations", postgresql_concurrently=True
+        )
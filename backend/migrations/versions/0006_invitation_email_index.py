@@ -0,0 +1,33 @@
+"""Pending invitation lookup by email
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Composite rather than partial on status = 'PENDING': the queries bind
+    # status as a parameter, which SQLite and generic PostgreSQL plans
+    # cannot match against a partial index predicate
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_diagram_invitations_email_status",
+            "diagram_invitations",
+            ["invited_email", "status"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_diagram_invitations_email_status", "diagram_invitations", postgresql_concurrently=True
+        )
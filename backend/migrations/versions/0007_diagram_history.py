@@ -0,0 +1,48 @@
+"""Diagram operation log and snapshots
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "diagram_operations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("diagram_id", sa.Integer(), sa.ForeignKey("diagrams.id"), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("operation_count", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index(
+        "ix_diagram_operations_diagram_revision", "diagram_operations", ["diagram_id", "revision"], unique=True
+    )
+    op.create_table(
+        "diagram_snapshots",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("diagram_id", sa.Integer(), sa.ForeignKey("diagrams.id"), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index(
+        "ix_diagram_snapshots_diagram_revision", "diagram_snapshots", ["diagram_id", "revision"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_diagram_snapshots_diagram_revision", table_name="diagram_snapshots")
+    op.drop_table("diagram_snapshots")
+    op.drop_index("ix_diagram_operations_diagram_revision", table_name="diagram_operations")
+    op.drop_table("diagram_operations")
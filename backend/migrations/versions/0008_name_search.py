@@ -0,0 +1,67 @@
+"""Name search indexes: pg_trgm on PostgreSQL, FTS5 on SQLite
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+SEARCHED = ["diagrams", "tables", "columns"]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # Build without locking writes on large tables
+        with op.get_context().autocommit_block():
+            for table in SEARCHED:
+                op.create_index(
+                    f"ix_{table}_name_trgm", table, ["name"],
+                    postgresql_using="gin",
+                    postgresql_ops={"name": "gin_trgm_ops"},
+                    postgresql_concurrently=True,
+                )
+        return
+
+    # External content FTS5 indexes with the trigram tokenizer, kept in
+    # step by triggers; the same statements search.py runs on create_all
+    for table in SEARCHED:
+        fts = f"{table}_fts"
+        op.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5("
+            f"name, content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER {fts}_update AFTER UPDATE OF name ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+            f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END"
+        )
+        # Index the rows that already exist
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for table in SEARCHED:
+                op.drop_index(f"ix_{table}_name_trgm", table, postgresql_concurrently=True)
+        return
+
+    for table in SEARCHED:
+        for trigger in ("insert", "delete", "update"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+        op.execute(f"DROP TABLE IF EXISTS {table}_fts")
@@ -0,0 +1,41 @@
+"""Foreign key relationships between columns
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "relationships",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("diagram_id", sa.Integer(), sa.ForeignKey("diagrams.id"), nullable=False),
+        sa.Column("source_column_id", sa.Integer(), sa.ForeignKey("columns.id"), nullable=False),
+        sa.Column("target_column_id", sa.Integer(), sa.ForeignKey("columns.id"), nullable=False),
+        sa.Column(
+            "cardinality", sa.Enum("ONE_TO_ONE", "MANY_TO_ONE", name="cardinality"), nullable=False
+        ),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_relationships_diagram_id", "relationships", ["diagram_id"])
+    op.create_index(
+        "ix_relationships_source_target", "relationships", ["source_column_id", "target_column_id"], unique=True
+    )
+    op.create_index("ix_relationships_target_column_id", "relationships", ["target_column_id"])
+
+
+def downgrade():
+    op.drop_index("ix_relationships_target_column_id", table_name="relationships")
+    op.drop_index("ix_relationships_source_target", table_name="relationships")
+    op.drop_index("ix_relationships_diagram_id", table_name="relationships")
+    op.drop_table("relationships")
+    sa.Enum(name="cardinality").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,36 @@
+"""GiST index on table positions for viewport queries (PostgreSQL only)
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite answers viewport queries from an in-process grid, see spatial.py
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    # Build without locking writes on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tables_diagram_position", "tables",
+            ["diagram_id", sa.text("point(x_position, y_position)")],
+            postgresql_using="gist",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tables_diagram_position", "tables", postgresql_concurrently=True)
@@ -1,9 +1,36 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Enum
+from sqlalchemy import DDL, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Enum, Index, LargeBinary, event
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 import enum
 
+# SQLite stores CURRENT_TIMESTAMP without fractional seconds; bind values in
+# the same format so keyset comparisons against stored values line up
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite"
+)
+
+# Trigram operator classes for the name search indexes below
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+# Integer equality inside GiST, for the diagram + position index of tables
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+
+def trigram_index(index_name, column):
+    """GIN trigram index for search.py, PostgreSQL only; SQLite searches through FTS5"""
+    return Index(
+        index_name, column, postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+    ).ddl_if(dialect="postgresql")
+
 class PermissionLevel(enum.Enum):
     VIEW = "view"
     EDIT = "edit"
@@ -14,6 +41,16 @@ class InvitationStatus(enum.Enum):
     ACCEPTED = "accepted"
     REJECTED = "rejected"
 
+class Cardinality(enum.Enum):
+    # Source rows per target row
+    ONE_TO_ONE = "one_to_one"
+    MANY_TO_ONE = "many_to_one"
+
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -35,13 +72,26 @@ class Diagram(Base):
     description = Column(Text, nullable=True)
     is_public = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    # Incremented by every table, column or position write
+    revision = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
 
     owner = relationship("User", back_populates="diagrams")
     tables = relationship("Table", back_populates="diagram")
     collaborations = relationship("DiagramCollaboration", back_populates="diagram")
 
+    # Keyset pagination seeks on (updated_at, id) within each visibility rule
+    __table_args__ = (
+        Index("ix_diagrams_owner_updated_id", owner_id, updated_at, id),
+        Index(
+            "ix_diagrams_public_updated_id", updated_at, id,
+            postgresql_where=is_public.is_(True),
+            sqlite_where=is_public.is_(True)
+        ),
+        trigram_index("ix_diagrams_name_trgm", name),
+    )
+
 class Table(Base):
     __tablename__ = "tables"
 
@@ -50,21 +100,21 @@ class Table(Base):
     diagram_id = Column(Integer, ForeignKey("diagrams.id"))
     x_position = Column(Integer)
     y_position = Column(Integer)
+    # Hash of the name and column fingerprints, see fingerprints.py
+    fingerprint = Column(String(32))
 
     diagram = relationship("Diagram", back_populates="tables")
     columns = relationship("Column", back_populates="table")
 
-class Column(Base):
-    __tablename__ = "columns"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    data_type = Column(String)
-    is_primary_key = Column(Boolean, default=False)
-    is_nullable = Column(Boolean, default=True)
-    table_id = Column(Integer, ForeignKey("tables.id"))
-
-    table = relationship("Table", back_populates="columns")
+    __table_args__ = (
+        Index("ix_tables_diagram_name_fingerprint", diagram_id, name, fingerprint),
+        trigram_index("ix_tables_name_trgm", name),
+        # Viewport queries in spatial.py; SQLite uses an in-process grid instead
+        Index(
+            "ix_tables_diagram_position", diagram_id, func.point(x_position, y_position),
+            postgresql_using="gist"
+        ).ddl_if(dialect="postgresql"),
+    )
 
 class DiagramCollaboration(Base):
     __tablename__ = "diagram_collaborations"
@@ -78,6 +128,11 @@ class DiagramCollaboration(Base):
     diagram = relationship("Diagram", back_populates="collaborations")
     user = relationship("User", back_populates="collaborations")
 
+    # Permission checks and the shared-with-me listing look up by user
+    __table_args__ = (
+        Index("ix_diagram_collaborations_user_diagram", user_id, diagram_id),
+    )
+
 class DiagramInvitation(Base):
     __tablename__ = "diagram_invitations"
 
@@ -92,3 +147,97 @@ class DiagramInvitation(Base):
 
     diagram = relationship("Diagram")
     inviter = relationship("User", foreign_keys=[inviter_id])
+
+    # An invitation inbox reads the pending invitations of one email
+    __table_args__ = (
+        Index("ix_diagram_invitations_email_status", invited_email, status),
+    )
+
+class EmailOutbox(Base):
+    """Emails waiting for the background sender, see outbox.py"""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(Enum(OutboxStatus), nullable=False, default=OutboxStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Not picked up before this time: retry backoff, or a sender's claim
+    next_attempt_at = Column(Timestamp, nullable=False, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", status, next_attempt_at),
+    )
+
+class DiagramOperation(Base):
+    """The table, column and position operations of one diagram revision, see history.py"""
+    __tablename__ = "diagram_operations"
+
+    id = Column(Integer, primary_key=True)
+    diagram_id = Column(Integer, ForeignKey("diagrams.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    operation_count = Column(Integer, nullable=False)
+    # zlib-compressed NDJSON, one operation per line
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(Timestamp, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_diagram_operations_diagram_revision", diagram_id, revision, unique=True),
+    )
+
+class DiagramSnapshot(Base):
+    """Full schema and table positions of a diagram at one revision, see history.py"""
+    __tablename__ = "diagram_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    diagram_id = Column(Integer, ForeignKey("diagrams.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    # zlib-compressed NDJSON, one table per line
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(Timestamp, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_diagram_snapshots_diagram_revision", diagram_id, revision, unique=True),
+    )
+
+class Relationship(Base):
+    """A foreign key from a source column to the target column it references"""
+    __tablename__ = "relationships"
+
+    id = Column(Integer, primary_key=True)
+    diagram_id = Column(Integer, ForeignKey("diagrams.id"), nullable=False)
+    source_column_id = Column(Integer, ForeignKey("columns.id"), nullable=False)
+    target_column_id = Column(Integer, ForeignKey("columns.id"), nullable=False)
+    cardinality = Column(Enum(Cardinality), nullable=False, default=Cardinality.MANY_TO_ONE)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # The whole edge list of a diagram is read at once, see graph.py
+        Index("ix_relationships_diagram_id", diagram_id),
+        Index("ix_relationships_source_target", source_column_id, target_column_id, unique=True),
+        Index("ix_relationships_target_column_id", target_column_id),
+    )
+
+# Keep this model last: its class name shadows sqlalchemy.Column for the
+# rest of the module.
+class Column(Base):
+    __tablename__ = "columns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, index=True)
+    data_type = Column(String)
+    is_primary_key = Column(Boolean, default=False)
+    is_nullable = Column(Boolean, default=True)
+    table_id = Column(Integer, ForeignKey("tables.id"), index=True)
+    fingerprint = Column(String(32))
+
+    table = relationship("Table", back_populates="columns")
+
+    __table_args__ = (
+        trigram_index("ix_columns_name_trgm", name),
+    )
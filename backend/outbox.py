@@ -0,0 +1,198 @@
+import logging
+import os
+import smtplib
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select, update
+
+import models
+from database import SessionLocal
+from email_service import SMTPConnection
+
+logger = logging.getLogger(__name__)
+
+# Run the sender thread with the app; set OUTBOX_WORKER=0 to run it elsewhere
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "1").lower() not in ("0", "false", "no")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+# Seconds between polls while the outbox is empty
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+# Retry n waits OUTBOX_BACKOFF_BASE * 2**(n-1) seconds, at most OUTBOX_BACKOFF_MAX
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 30))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600))
+# A claimed batch that is not finished in time (the sender died) is picked up again
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", 300))
+
+# Rejections of one message; anything else means the connection is unusable
+_MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def backoff_delay(attempts: int) -> float:
+    """Seconds to wait before retrying a message that failed `attempts` times"""
+    return min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+
+def enqueue_email(db, to_email: str, subject: str, body: str):
+    """
+    Queue an email in the caller's transaction: it is sent only if that
+    transaction commits. Works with a Session or an AsyncSession.
+    """
+    db.add(models.EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        status=models.OutboxStatus.PENDING,
+        attempts=0
+    ))
+
+async def enqueue_emails(db, messages):
+    """
+    enqueue_email for many (to, subject, body) messages with one multi-row
+    INSERT. Takes an AsyncSession or its ThreadedSession stand-in.
+    """
+    await db.execute(insert(models.EmailOutbox.__table__), [
+        {
+            "to_email": to_email,
+            "subject": subject,
+            "body": body,
+            "status": models.OutboxStatus.PENDING,
+            "attempts": 0
+        } for to_email, subject, body in messages
+    ])
+
+class OutboxSender:
+    """
+    Delivers queued emails over one persistent SMTP connection. All state
+    lives in the email_outbox table, so a restarted sender continues where
+    the last one stopped, and several senders can share the table.
+    """
+
+    def __init__(self, session_factory=SessionLocal, connection_factory=SMTPConnection.from_env,
+                 batch_size=None, poll_interval=None, max_attempts=None):
+        self.session_factory = session_factory
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self.poll_interval = OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.max_attempts = max_attempts or OUTBOX_MAX_ATTEMPTS
+        self.connection = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def claim_batch(self):
+        """
+        Lease the next due messages to this sender by pushing their
+        next_attempt_at past the claim window
+        """
+        outbox = models.EmailOutbox
+        with self.session_factory() as db:
+            now = _now()
+            ids = db.scalars(
+                select(outbox.id)
+                .where(outbox.status == models.OutboxStatus.PENDING, outbox.next_attempt_at <= now)
+                .order_by(outbox.next_attempt_at, outbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not ids:
+                return []
+            db.execute(
+                update(outbox)
+                .where(outbox.id.in_(ids))
+                .values(next_attempt_at=now + timedelta(seconds=OUTBOX_CLAIM_SECONDS))
+            )
+            rows = db.execute(
+                select(outbox.id, outbox.to_email, outbox.subject, outbox.body, outbox.attempts)
+                .where(outbox.id.in_(ids))
+                .order_by(outbox.id)
+            ).all()
+            db.commit()
+        return rows
+
+    def run_once(self) -> int:
+        """Send one claimed batch. Returns how many messages were attempted."""
+        batch = self.claim_batch()
+        outbox = models.EmailOutbox
+        attempted = 0
+        with self.session_factory() as db:
+            for row in batch:
+                attempted += 1
+                if self.connection is None:
+                    self.connection = self.connection_factory()
+                try:
+                    self.connection.send(row.to_email, row.subject, row.body)
+                except Exception as error:
+                    broken = not isinstance(error, _MESSAGE_ERRORS)
+                    if broken:
+                        self.close()
+                    attempts = row.attempts + 1
+                    retry_at = _now() + timedelta(seconds=backoff_delay(attempts))
+                    values = {"attempts": attempts, "last_error": str(error)[:1000]}
+                    if attempts >= self.max_attempts:
+                        values["status"] = models.OutboxStatus.FAILED
+                    else:
+                        values["next_attempt_at"] = retry_at
+                    logger.warning("Outbox email %s failed (attempt %s): %s", row.id, attempts, error)
+                else:
+                    values = {
+                        "status": models.OutboxStatus.SENT,
+                        "attempts": row.attempts + 1,
+                        "sent_at": _now(),
+                        "last_error": None
+                    }
+                    broken = False
+
+                db.execute(update(outbox).where(outbox.id == row.id).values(**values))
+                # One commit per outcome: a crash resends at most one message
+                db.commit()
+
+                if broken:
+                    # The server is unreachable; hand the rest of the batch
+                    # back with the same delay instead of failing each one
+                    rest = [later.id for later in batch[attempted:]]
+                    if rest:
+                        db.execute(
+                            update(outbox).where(outbox.id.in_(rest)).values(next_attempt_at=retry_at)
+                        )
+                        db.commit()
+                    break
+        return attempted
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                attempted = self.run_once()
+            except Exception:
+                logger.exception("Outbox sender failed")
+                attempted = 0
+            if not attempted:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        self.close()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Check the outbox now instead of at the next poll"""
+        self._wake.set()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+sender = OutboxSender()
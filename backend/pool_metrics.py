@@ -0,0 +1,60 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+
+from metrics import Histogram
+
+class PoolMetrics:
+    """Checkout wait times and connection lifecycle counters for one engine's pool"""
+
+    def __init__(self):
+        self.checkout_wait_ms = Histogram()
+        self.counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0, "timeouts": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def attach(self, engine):
+        """Listen to the pool events of an engine (sync, or an AsyncEngine's sync_engine)"""
+        event.listen(engine, "connect", lambda *args: self.count("connects"))
+        event.listen(engine, "checkout", lambda *args: self.count("checkouts"))
+        event.listen(engine, "checkin", lambda *args: self.count("checkins"))
+        event.listen(engine, "invalidate", lambda *args: self.count("invalidations"))
+
+    def report(self, pool):
+        with self._lock:
+            counters = dict(self.counters)
+        report = {"pool": pool.__class__.__name__, **counters}
+        # Only queue pools have a fixed size and overflow
+        if hasattr(pool, "checkedout"):
+            report.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+            )
+        report["checkout_wait_ms"] = self.checkout_wait_ms.snapshot()
+        return report
+
+def timed_pool_class(base, metrics: PoolMetrics):
+    """
+    Subclass of a pool class that times every checkout, including waiting
+    for a free connection and pre-ping. Pool.recreate() keeps the class, so
+    the timing survives engine.dispose().
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return base.connect(self)
+        except exc.TimeoutError:
+            metrics.count("timeouts")
+            raise
+        finally:
+            metrics.checkout_wait_ms.observe((time.perf_counter() - started) * 1000)
+
+    return type(f"Timed{base.__name__}", (base,), {"connect": connect})
@@ -0,0 +1,60 @@
+from sqlalchemy import Integer, bindparam, column, update, values
+
+import history
+import models
+from revisions import bump_revision_async
+
+# Rows per UPDATE ... FROM (VALUES ...) statement; three bound parameters
+# each keeps a statement well below asyncpg's 32767 parameter limit
+VALUES_CHUNK = 5000
+
+_tables = models.Table.__table__
+
+# One row per parameter set, sent with executemany
+_ROW_UPDATE = (
+    update(_tables)
+    .where(_tables.c.id == bindparam("b_id"), _tables.c.diagram_id == bindparam("b_diagram_id"))
+    .values(x_position=bindparam("b_x"), y_position=bindparam("b_y"))
+)
+
+def values_update(diagram_id: int, rows):
+    """UPDATE tables ... FROM (VALUES (id, x, y), ...) for PostgreSQL"""
+    moved = values(
+        column("id", Integer), column("x", Integer), column("y", Integer), name="moved"
+    ).data(rows)
+    return (
+        update(_tables)
+        .where(_tables.c.id == moved.c.id, _tables.c.diagram_id == diagram_id)
+        .values(x_position=moved.c.x, y_position=moved.c.y)
+    )
+
+async def update_positions(db, diagram_id: int, positions) -> int:
+    """
+    Set x/y of many tables of one diagram in the caller's transaction.
+    positions maps table id to (x, y); ids of other diagrams are left alone.
+    Returns the number of tables updated.
+    """
+    rows = [(table_id, x, y) for table_id, (x, y) in positions.items()]
+    if not rows:
+        return 0
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        updated = 0
+        for start in range(0, len(rows), VALUES_CHUNK):
+            result = await db.execute(values_update(diagram_id, rows[start:start + VALUES_CHUNK]))
+            updated += result.rowcount
+        return updated
+    result = await db.execute(_ROW_UPDATE, [
+        {"b_id": table_id, "b_diagram_id": diagram_id, "b_x": x, "b_y": y} for table_id, x, y in rows
+    ])
+    return result.rowcount
+
+async def record_positions(db, diagram_id: int, user_id, positions):
+    """
+    Record a position write as one history operation in a new revision,
+    in the caller's transaction, so past revisions keep their layout
+    """
+    log = history.OperationLog()
+    log.tables_moved(positions)
+    revision = await bump_revision_async(db, diagram_id)
+    await db.run_sync(history.record, diagram_id, revision, user_id, log)
@@ -0,0 +1,184 @@
+import contextlib
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import Counter
+
+from sqlalchemy import event
+
+from metrics import CounterFamily, HistogramFamily, render_gauge
+
+logger = logging.getLogger(__name__)
+
+# Development and test aid: flag a request that runs the same statement
+# shape more than SQL_REPEAT_LIMIT times, usually an N+1 lazy load.
+# 0 disables; SQL_REPEAT_ACTION is "log" or "raise".
+SQL_REPEAT_LIMIT = int(os.getenv("SQL_REPEAT_LIMIT", 0))
+SQL_REPEAT_ACTION = os.getenv("SQL_REPEAT_ACTION", "log")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+request_duration = HistogramFamily(
+    "http_request_duration_seconds", "Request latency by route",
+    ("method", "route"), LATENCY_BUCKETS
+)
+request_statements = HistogramFamily(
+    "db_statements_per_request", "SQL statements executed per request",
+    ("method", "route"), STATEMENT_BUCKETS
+)
+request_db_time = HistogramFamily(
+    "db_time_per_request_seconds", "Time spent in SQL statements per request",
+    ("method", "route"), LATENCY_BUCKETS
+)
+requests_total = CounterFamily(
+    "http_requests_total", "Requests by route and status code", ("method", "route", "status")
+)
+repeated_statements = CounterFamily(
+    "db_repeated_statement_requests_total",
+    "Requests that ran one statement shape more than SQL_REPEAT_LIMIT times",
+    ("method", "route")
+)
+
+# Bind parameter lists such as IN (?, ?, ?) differ only in length
+_PARAMETER_LIST = re.compile(
+    r"\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*\)"
+)
+
+class RepeatedQueryError(RuntimeError):
+    """A request ran one statement shape more than SQL_REPEAT_LIMIT times"""
+
+class RequestStats:
+    """SQL activity of one request. Shared by every thread the request uses."""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.flagged = set()
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+def statement_shape(statement: str) -> str:
+    return _PARAMETER_LIST.sub("(?)", statement)
+
+@contextlib.contextmanager
+def track(label: str = ""):
+    """Collect SQL statistics for everything run in this context"""
+    stats = RequestStats(label)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    conn.info.setdefault("request_metrics_started", []).append(time.perf_counter())
+    stats.statements += 1
+
+    if not SQL_REPEAT_LIMIT:
+        return
+    shape = statement_shape(statement)
+    stats.shapes[shape] += 1
+    if stats.shapes[shape] > SQL_REPEAT_LIMIT and shape not in stats.flagged:
+        stats.flagged.add(shape)
+        message = (
+            f"{stats.label or 'Request'} ran the same statement more than "
+            f"{SQL_REPEAT_LIMIT} times: {shape[:200]}"
+        )
+        if SQL_REPEAT_ACTION == "raise":
+            conn.info["request_metrics_started"].pop()
+            raise RepeatedQueryError(message)
+        logger.warning(message)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("request_metrics_started")
+    if stats is None or not started:
+        return
+    stats.db_seconds += time.perf_counter() - started.pop()
+
+def instrument(engine):
+    """Count statements and DB time of an engine (or AsyncEngine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording latency, SQL statement count and DB time per
+    route. Runs until the last body chunk is sent, so streamed responses
+    are measured whole.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(route, "endpoint", None): route.path
+                for route in scope["app"].router.routes
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with track(f"{scope['method']} {scope['path']}") as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                method, route = scope["method"], self._route(scope)
+                request_duration.labels(method, route).observe(time.perf_counter() - started)
+                request_statements.labels(method, route).observe(stats.statements)
+                request_db_time.labels(method, route).observe(stats.db_seconds)
+                requests_total.inc(method, route, str(status_code))
+                if stats.flagged:
+                    repeated_statements.inc(method, route)
+
+def render_prometheus(pool_report=None) -> str:
+    """All request metrics, plus connection pool gauges, in the text exposition format"""
+    lines = []
+    for family in (requests_total, request_duration, request_statements, request_db_time, repeated_statements):
+        lines.extend(family.render())
+
+    if pool_report:
+        for field, help_text in (
+            ("checked_out", "Connections currently checked out"),
+            ("overflow", "Connections open beyond the pool size"),
+        ):
+            lines.extend(render_gauge(
+                f"db_pool_{field}", help_text,
+                [({"engine": name}, report[field]) for name, report in pool_report.items() if field in report]
+            ))
+        lines.append("# HELP db_pool_checkout_wait_milliseconds Time to check a connection out of the pool")
+        lines.append("# TYPE db_pool_checkout_wait_milliseconds histogram")
+        for name, report in pool_report.items():
+            wait = report["checkout_wait_ms"]
+            for bound, count in wait["buckets"].items():
+                lines.append(f'db_pool_checkout_wait_milliseconds_bucket{{engine="{name}",le="{bound}"}} {count}')
+            lines.append(f'db_pool_checkout_wait_milliseconds_sum{{engine="{name}"}} {wait["sum"]}')
+            lines.append(f'db_pool_checkout_wait_milliseconds_count{{engine="{name}"}} {wait["count"]}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,25 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import models
+
+def revision_bump(diagram_id: int):
+    """
+    UPDATE statement advancing a diagram's revision after a table, column
+    or position write, returning the new revision. The increment happens in SQL so
+    concurrent writers never reuse a revision number.
+    """
+    return (
+        update(models.Diagram)
+        .where(models.Diagram.id == diagram_id)
+        .values(revision=models.Diagram.revision + 1)
+        .returning(models.Diagram.revision)
+    )
+
+def bump_revision(db: Session, diagram_id: int) -> int:
+    """Run revision_bump in the caller's transaction"""
+    return db.execute(revision_bump(diagram_id)).scalar_one()
+
+async def bump_revision_async(db, diagram_id: int) -> int:
+    """bump_revision for an AsyncSession"""
+    return (await db.execute(revision_bump(diagram_id))).scalar_one()
@@ -0,0 +1,207 @@
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import history
+import models
+from bulk import ID_CHUNK
+from ddl import foreign_key_constraint, foreign_key_name, generate_table_ddl
+from graph import relationship_edges
+
+# A column as history stores it; no fingerprint, so _alter_table compares fields
+ColumnRow = namedtuple("ColumnRow", "name data_type is_primary_key is_nullable fingerprint")
+# One foreign key by table and column names, as diagrams are matched by name
+ForeignKey = namedtuple("ForeignKey", "table column target_table target_column")
+
+class DuplicateTableName(ValueError):
+    """Two tables of a compared schema share a name, so they cannot be matched"""
+
+def _by_name(pairs):
+    """{name: value} of (name, value) pairs; DuplicateTableName on a repeated name"""
+    by_name = {}
+    for name, value in pairs:
+        if name in by_name:
+            raise DuplicateTableName(name)
+        by_name[name] = value
+    return by_name
+
+def _table_hashes(db: Session, diagram_id: int):
+    """{table name: (table id, fingerprint)} read from the covering index"""
+    rows = db.execute(
+        select(models.Table.name, models.Table.id, models.Table.fingerprint)
+        .where(models.Table.diagram_id == diagram_id)
+    )
+    return _by_name((row.name, (row.id, row.fingerprint)) for row in rows)
+
+def _load_columns(db: Session, table_ids):
+    """{table id: [column rows]} for the given tables only"""
+    columns = defaultdict(list)
+    table_ids = list(table_ids)
+    for start in range(0, len(table_ids), ID_CHUNK):
+        rows = db.execute(
+            select(
+                models.Column.table_id,
+                models.Column.name,
+                models.Column.data_type,
+                models.Column.is_primary_key,
+                models.Column.is_nullable,
+                models.Column.fingerprint
+            )
+            .where(models.Column.table_id.in_(table_ids[start:start + ID_CHUNK]))
+            .order_by(models.Column.id)
+        )
+        for row in rows:
+            columns[row.table_id].append(row)
+    return columns
+
+def _foreign_keys(db: Session, diagram_id: int, names: dict):
+    """{ForeignKey} of a diagram; names maps its table ids to names"""
+    return {
+        ForeignKey(names[edge.source_table], edge.source_column, names[edge.target_table], edge.target_column)
+        for edge in db.execute(relationship_edges(diagram_id))
+    }
+
+def _alter_table(table_name, base_columns, target_columns):
+    """ALTER statements turning base_columns into target_columns"""
+    statements = []
+    base = {column.name: column for column in base_columns}
+    target = {column.name: column for column in target_columns}
+
+    base_keys = [column.name for column in base_columns if column.is_primary_key]
+    target_keys = [column.name for column in target_columns if column.is_primary_key]
+    if base_keys != target_keys and base_keys:
+        statements.append(f"ALTER TABLE {table_name} DROP CONSTRAINT {table_name}_pkey;")
+
+    for column in target_columns:
+        old = base.get(column.name)
+        if old is None:
+            not_null = "" if column.is_nullable else " NOT NULL"
+            statements.append(
+                f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.data_type}{not_null};"
+            )
+            continue
+        if old.fingerprint is not None and old.fingerprint == column.fingerprint:
+            continue
+        if old.data_type != column.data_type:
+            statements.append(
+                f"ALTER TABLE {table_name} ALTER COLUMN {column.name} TYPE {column.data_type};"
+            )
+        if old.is_nullable != column.is_nullable:
+            action = "DROP NOT NULL" if column.is_nullable else "SET NOT NULL"
+            statements.append(f"ALTER TABLE {table_name} ALTER COLUMN {column.name} {action};")
+
+    for column in base_columns:
+        if column.name not in target:
+            statements.append(f"ALTER TABLE {table_name} DROP COLUMN {column.name};")
+
+    if base_keys != target_keys and target_keys:
+        statements.append(f"ALTER TABLE {table_name} ADD PRIMARY KEY ({', '.join(target_keys)});")
+
+    return statements
+
+def _statements(created, changed, dropped, base_columns, target_columns, base_keys, target_keys):
+    """
+    Statements and touched table names for tables matched by name.
+    base_columns and target_columns give the columns of the created and
+    changed tables; base_keys and target_keys are sets of ForeignKey.
+    Foreign keys are dropped first and added last, so they never refer
+    to a table or column that does not exist yet or any more.
+    """
+    statements = []
+    touched = []
+    for key in sorted(base_keys - target_keys):
+        if key.table not in dropped:
+            statements.append(f"ALTER TABLE {key.table} DROP CONSTRAINT {foreign_key_name(key.table, key.column)};")
+    for name in created:
+        statements.append(generate_table_ddl(name, target_columns[name]))
+        touched.append(name)
+    for name in changed:
+        altered = _alter_table(name, base_columns[name], target_columns[name])
+        if altered:
+            statements.extend(altered)
+            touched.append(name)
+    for name in dropped:
+        statements.append(f"DROP TABLE {name};")
+        touched.append(name)
+    for key in sorted(target_keys - base_keys):
+        statements.append(
+            f"ALTER TABLE {key.table} ADD "
+            f"{foreign_key_constraint(key.table, key.column, key.target_table, key.target_column)};"
+        )
+
+    # Tables whose only change is a foreign key
+    seen = set(touched)
+    touched += sorted({key.table for key in base_keys ^ target_keys} - seen)
+    return statements, touched
+
+def migration_statements(db: Session, base_id: int, target_id: int):
+    """
+    SQL statements that migrate the schema of diagram base_id to that of
+    diagram target_id, plus the names of the tables they touch.
+
+    Tables are matched by name and compared by fingerprint first; columns
+    are only loaded for tables whose fingerprints differ. Foreign keys are
+    not part of the fingerprints and are compared on their own. Raises
+    DuplicateTableName when a diagram has two tables of the same name.
+    """
+    base = _table_hashes(db, base_id)
+    target = _table_hashes(db, target_id)
+
+    created = sorted(target.keys() - base.keys())
+    dropped = sorted(base.keys() - target.keys())
+    changed = sorted(
+        name for name in base.keys() & target.keys()
+        if base[name][1] is None or base[name][1] != target[name][1]
+    )
+
+    columns = _load_columns(
+        db,
+        [target[name][0] for name in created + changed] + [base[name][0] for name in changed]
+    )
+    return _statements(
+        created, changed, dropped,
+        {name: columns[base[name][0]] for name in changed},
+        {name: columns[target[name][0]] for name in created + changed},
+        _foreign_keys(db, base_id, {table_id: name for name, (table_id, _) in base.items()}),
+        _foreign_keys(db, target_id, {table_id: name for name, (table_id, _) in target.items()})
+    )
+
+def _revision_schema(tables: dict):
+    """({table name: [ColumnRow]}, {ForeignKey}) of a history.load_revision result"""
+    names = {table_id: table["name"] for table_id, table in tables.items()}
+    columns = _by_name(
+        (table["name"], [ColumnRow(*column, None) for column in table["columns"]])
+        for table in tables.values()
+    )
+    keys = {
+        ForeignKey(table["name"], column, names[target_table], target_column)
+        for table in tables.values()
+        for _, column, target_table, target_column, _ in table.get("foreign_keys", ())
+        if target_table in names
+    }
+    return columns, keys
+
+def revision_migration_statements(db: Session, diagram_id: int, base_revision: int, target_revision: int):
+    """
+    migration_statements between two revisions of one diagram, rebuilt
+    from its history. None when either revision is not in the history;
+    DuplicateTableName as in migration_statements.
+    """
+    base = history.load_revision(db, diagram_id, base_revision)
+    target = history.load_revision(db, diagram_id, target_revision)
+    if base is None or target is None:
+        return None
+    base_columns, base_keys = _revision_schema(base)
+    target_columns, target_keys = _revision_schema(target)
+
+    changed = sorted(
+        name for name in base_columns.keys() & target_columns.keys()
+        if base_columns[name] != target_columns[name]
+    )
+    return _statements(
+        sorted(target_columns.keys() - base_columns.keys()),
+        changed,
+        sorted(base_columns.keys() - target_columns.keys()),
+        base_columns, target_columns, base_keys, target_keys
+    )
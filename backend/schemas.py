@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, validator
 from typing import List, Optional
 from datetime import datetime
 from enum import Enum
@@ -57,6 +57,58 @@ class Table(TableBase):
     class Config:
         orm_mode = True
 
+class TableBatchResult(BaseModel):
+    table_ids: List[int]
+    column_count: int
+
+class TablePosition(BaseModel):
+    table_id: int
+    x: int
+    y: int
+
+class PositionUpdateResult(BaseModel):
+    updated: int
+
+class LayoutResult(BaseModel):
+    updated: int
+    # Canvas the laid out tables need, one table spacing past the last one
+    width: int
+    height: int
+
+class HistoryEntry(BaseModel):
+    revision: int
+    user_id: Optional[int]
+    operation_count: int
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+class RevisionForeignKey(BaseModel):
+    relationship_id: int
+    column: str
+    target_table_id: int
+    target_column: str
+    cardinality: str
+
+class RevisionTable(BaseModel):
+    id: int
+    name: str
+    # None for tables never placed, or recorded before positions were
+    x: Optional[int] = None
+    y: Optional[int] = None
+    columns: List[ColumnBase]
+    foreign_keys: List[RevisionForeignKey] = []
+
+class DiagramRevision(BaseModel):
+    diagram_id: int
+    revision: int
+    tables: List[RevisionTable]
+
+class ImportResult(BaseModel):
+    table_count: int
+    column_count: int
+
 class DiagramBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -82,13 +134,48 @@ class CollaboratorBase(BaseModel):
 class CollaboratorCreate(CollaboratorBase):
     pass
 
+def _enum_value(value):
+    # Model columns hold members of the enums in models.py
+    return value.value if isinstance(value, Enum) else value
+
 class Collaborator(CollaboratorBase):
     diagram_id: int
     joined_at: datetime
 
+    _permission_level = validator("permission_level", pre=True, allow_reuse=True)(_enum_value)
+
     class Config:
         orm_mode = True
 
+class CardinalityEnum(str, Enum):
+    ONE_TO_ONE = "one_to_one"
+    MANY_TO_ONE = "many_to_one"
+
+class RelationshipCreate(BaseModel):
+    # The referencing column and the column it references
+    source_column_id: int
+    target_column_id: int
+    cardinality: CardinalityEnum = CardinalityEnum.MANY_TO_ONE
+
+class Relationship(RelationshipCreate):
+    id: int
+    diagram_id: int
+
+    _cardinality = validator("cardinality", pre=True, allow_reuse=True)(_enum_value)
+
+    class Config:
+        orm_mode = True
+
+class TableDependencies(BaseModel):
+    table_id: int
+    # Tables this one has foreign keys to
+    references: List[int]
+    # Tables with foreign keys to this one
+    referenced_by: List[int]
+    # Everything it references directly or through other tables
+    depends_on: List[int]
+    in_cycle: bool
+
 class InvitationBase(BaseModel):
     diagram_id: int
     invited_email: EmailStr
@@ -97,6 +184,22 @@ class InvitationBase(BaseModel):
 class InvitationCreate(InvitationBase):
     pass
 
+class InvitationBatchCreate(BaseModel):
+    invited_emails: List[EmailStr] = Field(..., min_items=1, max_items=1000)
+    permission_level: PermissionLevelEnum = PermissionLevelEnum.VIEW
+
+class InvitationSent(BaseModel):
+    invited_email: EmailStr
+    invitation_id: int
+
+class InvitationBatchResult(BaseModel):
+    # Registered users, added as collaborators right away
+    added: List[EmailStr]
+    # Unregistered emails, invited by email
+    invited: List[InvitationSent]
+    # Already collaborators, already invited, or the owner
+    skipped: List[EmailStr]
+
 class Invitation(InvitationBase):
     id: int
     inviter_id: int
@@ -104,12 +207,15 @@ class Invitation(InvitationBase):
     created_at: datetime
     updated_at: Optional[datetime]
 
+    _enums = validator("permission_level", "status", pre=True, allow_reuse=True)(_enum_value)
+
     class Config:
         orm_mode = True
 
 class Diagram(DiagramBase):
     id: int
     owner_id: int
+    revision: int
     created_at: datetime
     updated_at: Optional[datetime]
     tables: List[Table] = []
@@ -118,6 +224,48 @@ class Diagram(DiagramBase):
     class Config:
         orm_mode = True
 
+class DiagramViewEnum(str, Enum):
+    FULL = "full"
+    SUMMARY = "summary"
+
+class SearchKindEnum(str, Enum):
+    DIAGRAM = "diagram"
+    TABLE = "table"
+    COLUMN = "column"
+
+class SearchHit(BaseModel):
+    kind: SearchKindEnum
+    id: int
+    name: str
+    score: float
+    diagram_id: int
+    diagram_name: str
+    # Set for tables and columns
+    table_id: Optional[int] = None
+    table_name: Optional[str] = None
+
+class DiagramSummary(DiagramBase):
+    id: int
+    owner_id: int
+    revision: int
+    created_at: datetime
+    updated_at: Optional[datetime]
+    table_count: int
+    column_count: int
+
+class MigrationScript(BaseModel):
+    base_id: int
+    target_id: int
+    # Set when two revisions of one diagram were compared
+    base_revision: Optional[int] = None
+    target_revision: Optional[int] = None
+    sql: str
+    changed_tables: List[str]
+
+class ExportFormatEnum(str, Enum):
+    SQL = "sql"
+    NDJSON = "ndjson"
+
 class DiagramExport(BaseModel):
     sql_ddl: str
     json_schema: dict
@@ -0,0 +1,161 @@
+import functools
+import os
+import re
+
+from sqlalchemy import DDL, Integer, String, cast, column, event, func, literal, null, select, table, union_all
+
+import models
+from collaboration import visible_to
+from database import Base
+
+# Lowest share of the query's trigrams a name must contain to match. On
+# PostgreSQL the index condition applies pg_trgm.word_similarity_threshold
+# (0.6 by default) first, so lower that setting too before lowering this.
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", 0.6))
+# Most results one page may ask for
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 100))
+
+# What can be found, in the order equal scores are listed
+KINDS = ("diagram", "table", "column")
+
+_ENTITIES = {"diagram": models.Diagram, "table": models.Table, "column": models.Column}
+
+# Alphanumeric runs, the words pg_trgm takes trigrams of
+_WORD = re.compile(r"[^\W_]+")
+
+def trigrams(text: str) -> frozenset:
+    """pg_trgm's trigrams: every lowercased word padded with two spaces in front and one behind"""
+    grams = set()
+    for word in _WORD.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+_query_trigrams = functools.lru_cache(maxsize=256)(trigrams)
+
+def score(query: str, name: str) -> float:
+    """
+    Share of the query's trigrams found in a name, close to pg_trgm's
+    word_similarity(query, name): prefixes and small typos still score high
+    """
+    wanted = _query_trigrams(query)
+    if not wanted or not name:
+        return 0.0
+    return len(wanted & trigrams(name)) / len(wanted)
+
+def fts_query(query: str) -> str:
+    """
+    FTS5 MATCH expression for rows sharing any unpadded trigram with the
+    query; score() then decides which of them are close enough
+    """
+    grams = {
+        word[i:i + 3]
+        for word in _WORD.findall(query.lower())
+        for i in range(len(word) - 2)
+    }
+    return " OR ".join(f'"{gram}"' for gram in sorted(grams))
+
+# SQLite has no pg_trgm: each searched table gets an external content FTS5
+# index with the trigram tokenizer, kept current by triggers so bulk Core
+# inserts are indexed too
+def _fts_statements(source: str):
+    fts = f"{source}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"name, content='{source}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF name ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    ]
+
+_FTS = {}
+for _kind, _entity in _ENTITIES.items():
+    _source = _entity.__tablename__
+    _FTS[_kind] = table(f"{_source}_fts", column("rowid", Integer), column("name", String))
+    for _statement in _fts_statements(_source):
+        event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+    # Dropped with their content table, or a re-created table would inherit stale entries
+    event.listen(
+        Base.metadata, "before_drop", DDL(f"DROP TABLE IF EXISTS {_source}_fts").execute_if(dialect="sqlite")
+    )
+
+def _register_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("search_score", 2, score, deterministic=True)
+
+def install(engine):
+    """
+    Make search_score() available on the SQLite connections of an engine
+    (or AsyncEngine.sync_engine). Call before the engine's first connect.
+    """
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _register_functions)
+
+def _branch(kind: str, dialect: str, query: str, user_id: int, limit: int):
+    """The best `limit` matches of one kind the user may see"""
+    entity = _ENTITIES[kind]
+    diagram, parent = models.Diagram, models.Table
+
+    if dialect == "postgresql":
+        # `query <% name` is what the GIN trigram index answers
+        similarity = func.word_similarity(query, entity.name)
+        matches = literal(query).op("<%")(entity.name)
+    else:
+        fts = _FTS[kind]
+        similarity = func.search_score(query, entity.name)
+        matches = entity.id.in_(select(fts.c.rowid).where(fts.c.name.op("MATCH")(fts_query(query))))
+    similarity_column = similarity.label("score")
+
+    if kind == "diagram":
+        source = select(
+            diagram.id.label("diagram_id"), diagram.name.label("diagram_name"),
+            # Typed, or PostgreSQL reads the NULLs as text and the union fails
+            cast(null(), Integer).label("table_id"), cast(null(), String).label("table_name")
+        )
+    else:
+        source = select(
+            diagram.id.label("diagram_id"), diagram.name.label("diagram_name"),
+            parent.id.label("table_id"), parent.name.label("table_name")
+        ).select_from(entity)
+        if kind == "column":
+            source = source.join(parent, parent.id == entity.table_id)
+        source = source.join(diagram, diagram.id == parent.diagram_id)
+
+    return (
+        source.add_columns(
+            literal(kind).label("kind"),
+            literal(KINDS.index(kind)).label("rank"),
+            entity.id.label("id"),
+            entity.name.label("name"),
+            similarity_column
+        )
+        .where(matches, similarity >= SEARCH_MIN_SCORE, visible_to(user_id))
+        .order_by(similarity_column.desc(), entity.id)
+        .limit(limit)
+    )
+
+def search_query(dialect: str, query: str, user_id: int, kinds=KINDS, skip: int = 0, limit: int = 20):
+    """
+    Ranked matches among diagram, table and column names visible to a user.
+    Each kind keeps only its best skip + limit matches before they are
+    merged, so the final sort stays small however many names match.
+    """
+    pages = [select(_branch(kind, dialect, query, user_id, skip + limit).subquery()) for kind in kinds]
+    merged = union_all(*pages).subquery()
+    return (
+        select(
+            merged.c.kind, merged.c.id, merged.c.name, merged.c.score,
+            merged.c.diagram_id, merged.c.diagram_name, merged.c.table_id, merged.c.table_name
+        )
+        .order_by(merged.c.score.desc(), merged.c.rank, merged.c.id)
+        .offset(skip)
+        .limit(limit)
+    )
+
+async def search(db, user_id: int, query: str, kinds=KINDS, skip: int = 0, limit: int = 20):
+    """search_query run on db, as a list of row mappings"""
+    dialect = db.get_bind().dialect.name
+    return (await db.execute(search_query(dialect, query, user_id, kinds, skip, limit))).mappings().all()
@@ -0,0 +1,124 @@
+import math
+import os
+import threading
+from collections import namedtuple
+
+from sqlalchemy import and_, func, select
+
+import models
+from ttl_cache import TTLCache
+
+# Width and height of a grid cell in canvas pixels; about one viewport
+# keeps a typical query to a handful of cells
+SPATIAL_CELL_SIZE = int(os.getenv("SPATIAL_CELL_SIZE", 1024))
+# Diagram grids kept in memory (SQLite only, PostgreSQL uses its GiST index)
+SPATIAL_CACHE_SIZE = int(os.getenv("SPATIAL_CACHE_SIZE", 64))
+SPATIAL_CACHE_TTL = float(os.getenv("SPATIAL_CACHE_TTL", 600))
+
+# Viewport in canvas pixels, corners included
+Box = namedtuple("Box", "x0 y0 x1 y1")
+
+def parse_box(value: str) -> Box:
+    """Box from "x0,y0,x1,y1" in any corner order; ValueError when malformed"""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError(value)
+    x0, y0, x1, y1 = parts
+    return Box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+def in_box(box: Box):
+    """
+    point <@ box predicate for PostgreSQL, on the same point expression as
+    the ix_tables_diagram_position GiST index
+    """
+    corners = func.box(func.point(box.x0, box.y0), func.point(box.x1, box.y1))
+    return func.point(models.Table.x_position, models.Table.y_position).op("<@")(corners)
+
+class PositionGrid:
+    """
+    Uniform grid over the table positions of one diagram. A query visits
+    the cells the box overlaps, or every occupied cell when there are
+    fewer of those, and checks each table in them exactly.
+    """
+
+    def __init__(self, rows, cell_size: int = None):
+        self.cell_size = cell_size or SPATIAL_CELL_SIZE
+        self.cells = {}
+        self.count = 0
+        for table_id, x, y in rows:
+            if x is None or y is None:
+                continue
+            self.cells.setdefault(self._cell(x, y), []).append((table_id, x, y))
+            self.count += 1
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def within(self, box: Box):
+        """Ids of the tables positioned inside box, ascending"""
+        low_x, low_y = self._cell(box.x0, box.y0)
+        high_x, high_y = self._cell(box.x1, box.y1)
+        if (high_x - low_x + 1) * (high_y - low_y + 1) > len(self.cells):
+            cells = self.cells.values()
+        else:
+            cells = filter(None, (
+                self.cells.get((cell_x, cell_y))
+                for cell_x in range(low_x, high_x + 1)
+                for cell_y in range(low_y, high_y + 1)
+            ))
+        return sorted(
+            table_id for entries in cells for table_id, x, y in entries
+            if box.x0 <= x <= box.x1 and box.y0 <= y <= box.y1
+        )
+
+grid_cache = TTLCache(max_entries=SPATIAL_CACHE_SIZE, ttl=SPATIAL_CACHE_TTL)
+
+# Diagram id -> count of committed position writes, so a grid built from
+# positions read before a write never replaces the fresh one
+_generations = {}
+_generations_lock = threading.Lock()
+
+def positions_changed(diagram_id: int):
+    """Call after committing position writes; the next query rebuilds the grid"""
+    with _generations_lock:
+        _generations[diagram_id] = _generations.get(diagram_id, 0) + 1
+    grid_cache.discard(diagram_id)
+
+async def diagram_grid(db, diagram_id: int) -> PositionGrid:
+    """
+    The grid of a diagram, built on the first query after its tables
+    were added or moved. Table changes bump the diagram revision and
+    position writes call positions_changed, both are part of the key.
+    """
+    generation = _generations.get(diagram_id, 0)
+    revision = await db.scalar(select(models.Diagram.revision).where(models.Diagram.id == diagram_id))
+    cached = grid_cache.get(diagram_id)
+    if cached is not None and cached[0] == (revision, generation):
+        return cached[1]
+    rows = await db.execute(
+        select(models.Table.id, models.Table.x_position, models.Table.y_position)
+        .where(models.Table.diagram_id == diagram_id)
+    )
+    grid = PositionGrid(rows)
+    with _generations_lock:
+        if _generations.get(diagram_id, 0) == generation:
+            grid_cache.put(diagram_id, ((revision, generation), grid))
+    return grid
+
+async def box_filter(db, diagram_id: int, box: Box):
+    """
+    WHERE clause for the tables of a diagram positioned inside box: the
+    GiST-indexed point predicate on PostgreSQL, the ids found in the
+    diagram's grid elsewhere. None when the grid finds no table.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return and_(models.Table.diagram_id == diagram_id, in_box(box))
+    grid = await diagram_grid(db, diagram_id)
+    ids = grid.within(box)
+    if not ids:
+        return None
+    # Zoomed all the way out: no id list, which could pass SQLite's bound parameter limit
+    if len(ids) == grid.count:
+        return and_(models.Table.diagram_id == diagram_id, models.Table.x_position.is_not(None),
+                    models.Table.y_position.is_not(None))
+    return models.Table.id.in_(ids)
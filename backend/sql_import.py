@@ -0,0 +1,358 @@
+import codecs
+import re
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import bulk
+import models
+
+# Bytes read from the upload per round
+READ_CHUNK = 1 << 20
+
+# Imported tables are placed on a grid, below the diagram's existing
+# tables, until they are laid out
+GRID_COLUMNS = 20
+GRID_SPACING = 300
+
+# Anything that changes how the rest of a statement must be scanned. Dollar
+# quotes cannot start inside an identifier such as a$b$.
+_SPECIAL = re.compile(r""";|'|"|--|/\*|(?<![\w$])\$(?:[A-Za-z_]\w*)?\$""")
+
+# Longest token _SPECIAL may need to see whole at a chunk boundary
+_LOOKBEHIND = 64
+
+_IDENTIFIER = r'(?:"(?:[^"]|"")*"|[\w$]+)'
+_QUALIFIED = rf"{_IDENTIFIER}(?:\s*\.\s*{_IDENTIFIER})*"
+
+_CREATE_TABLE = re.compile(
+    rf"""CREATE\s+(?:(?:GLOBAL|LOCAL)\s+)?(?:(?:TEMP|TEMPORARY|UNLOGGED)\s+)?TABLE\s+
+    (?:IF\s+NOT\s+EXISTS\s+)?({_QUALIFIED})\s*\(""",
+    re.IGNORECASE | re.VERBOSE
+)
+
+_ALTER_PRIMARY_KEY = re.compile(
+    rf"""ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?({_QUALIFIED})\s+
+    ADD\s+(?:CONSTRAINT\s+{_IDENTIFIER}\s+)?PRIMARY\s+KEY\s*\(([^)]*)\)""",
+    re.IGNORECASE | re.VERBOSE
+)
+
+_TOKEN = re.compile(r"""\s*("(?:[^"]|"")*"|'(?:[^']|'')*'|[\w$]+|.)""", re.DOTALL)
+
+# Only the characters that matter for nesting, skipping quoted text whole
+_STRUCTURE = re.compile(r"""[(),]|"(?:[^"]|"")*"|'(?:[^']|'')*'""")
+
+# Words that end a column's data type and start its constraints
+_COLUMN_CONSTRAINTS = {
+    "NOT", "NULL", "DEFAULT", "PRIMARY", "REFERENCES", "CONSTRAINT",
+    "UNIQUE", "CHECK", "COLLATE", "GENERATED"
+}
+
+# Words that start a table-level element instead of a column
+_TABLE_CONSTRAINTS = {"CONSTRAINT", "PRIMARY", "UNIQUE", "CHECK", "FOREIGN", "EXCLUDE", "LIKE"}
+
+# Matched against upper-cased text, which is much faster than IGNORECASE
+_CONSTRAINT_START = re.compile(r"\b(?:" + "|".join(sorted(_COLUMN_CONSTRAINTS)) + r")\b")
+_NESTED = re.compile(r"\([^()]*\)")
+_NOT_NULL = re.compile(r"\bNOT\s+NULL\b")
+_PRIMARY_KEY = re.compile(r"\bPRIMARY\s+KEY\b")
+
+# Parsed rows only feed bulk.insert_tables, so they skip pydantic entirely;
+# these carry the same attributes as schemas.TableCreate / ColumnCreate
+ParsedColumn = namedtuple("ParsedColumn", "name data_type is_primary_key is_nullable")
+ParsedTable = namedtuple("ParsedTable", "name x_position y_position columns")
+
+def read_text_chunks(stream, encoding: str = "utf-8") -> Iterator[str]:
+    """Decode a binary stream incrementally, READ_CHUNK bytes at a time"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        data = stream.read(READ_CHUNK)
+        if not data:
+            break
+        yield decoder.decode(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_statements(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Split SQL text into statements on top-level semicolons without holding
+    more than the current statement in memory. Comments are dropped;
+    quoted strings, quoted identifiers and dollar-quoted bodies are kept
+    intact.
+    """
+    parts = []
+    buffer = ""
+    start = 0
+    pos = 0
+    closer = None
+    in_comment = False
+
+    for chunk in chunks:
+        buffer = buffer[start:] + chunk
+        pos -= start
+        start = 0
+
+        while True:
+            if closer:
+                end = buffer.find(closer, pos)
+                if end < 0:
+                    pos = max(pos, len(buffer) - len(closer) + 1)
+                    break
+                pos = end + len(closer)
+                if in_comment:
+                    parts.append(" ")
+                    start = pos
+                closer = None
+                in_comment = False
+                continue
+
+            match = _SPECIAL.search(buffer, pos)
+            if not match:
+                pos = max(pos, len(buffer) - _LOOKBEHIND)
+                break
+
+            token = match.group()
+            if token == ";":
+                parts.append(buffer[start:match.start()])
+                statement = "".join(parts).strip()
+                if statement:
+                    yield statement
+                parts = []
+                start = pos = match.end()
+            elif token in ("--", "/*"):
+                parts.append(buffer[start:match.start()])
+                closer = "\n" if token == "--" else "*/"
+                in_comment = True
+                pos = match.end()
+            else:
+                closer = token
+                pos = match.end()
+
+    if not in_comment:
+        parts.append(buffer[start:])
+    statement = "".join(parts).strip()
+    if statement:
+        yield statement
+
+def _unquote(identifier: str) -> str:
+    identifier = identifier.strip()
+    if identifier.startswith('"') and identifier.endswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+def _qualified_name(qualified: str) -> Tuple[str, ...]:
+    """Every part of a possibly schema-qualified name, unquoted"""
+    return tuple(_unquote(part) for part in re.findall(_IDENTIFIER, qualified))
+
+def _column_list(text: str) -> List[str]:
+    return [_unquote(name) for name in re.findall(_IDENTIFIER, text)]
+
+def _closing_paren(text: str, open_index: int) -> int:
+    """Index of the parenthesis closing the one at open_index, or -1"""
+    depth = 0
+    for match in _STRUCTURE.finditer(text, open_index):
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            if depth == 0:
+                return match.start()
+    return -1
+
+def _split_elements(body: str) -> List[str]:
+    """Split a CREATE TABLE body on commas outside parentheses and quotes"""
+    elements = []
+    depth = 0
+    start = 0
+    for match in _STRUCTURE.finditer(body):
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif token == "," and depth == 0:
+            elements.append(body[start:match.start()])
+            start = match.end()
+    elements.append(body[start:])
+    return [element.strip() for element in elements if element.strip()]
+
+def _parse_column(element: str) -> Optional[ParsedColumn]:
+    if '"' in element or "'" in element:
+        return _parse_quoted_column(element)
+
+    # Without quotes, keywords can only appear as keywords
+    parts = element.split(None, 1)
+    if len(parts) < 2:
+        return None
+    name, rest = parts
+    match = _CONSTRAINT_START.search(rest.upper())
+    if not match:
+        data_type, constraints = rest, ""
+    else:
+        data_type, constraints = rest[:match.start()], rest[match.start():].upper()
+        while "(" in constraints:
+            stripped = _NESTED.sub(" ", constraints)
+            if stripped == constraints:
+                break
+            constraints = stripped
+
+    is_primary_key = _PRIMARY_KEY.search(constraints) is not None
+    return ParsedColumn(
+        name=name,
+        data_type=" ".join(data_type.split()),
+        is_primary_key=is_primary_key,
+        is_nullable=not is_primary_key and _NOT_NULL.search(constraints) is None
+    )
+
+def _parse_quoted_column(element: str) -> Optional[ParsedColumn]:
+    tokens = [(match.group(1), match.start(1)) for match in _TOKEN.finditer(element)]
+    if len(tokens) < 2:
+        return None
+
+    name = _unquote(tokens[0][0])
+    type_end = len(element)
+    depth = 0
+    words = []
+    for token, position in tokens[1:]:
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token.upper() in _COLUMN_CONSTRAINTS and type_end == len(element):
+            type_end = position
+        if type_end != len(element) and depth == 0:
+            words.append(token.upper())
+
+    data_type = " ".join(element[tokens[1][1]:type_end].split())
+    pairs = set(zip(words, words[1:]))
+    is_primary_key = ("PRIMARY", "KEY") in pairs
+    return ParsedColumn(
+        name=name,
+        data_type=data_type,
+        is_primary_key=is_primary_key,
+        is_nullable=not is_primary_key and ("NOT", "NULL") not in pairs
+    )
+
+def _parse_create_table(statement: str):
+    """(qualified name, table name, columns) of a CREATE TABLE, or None"""
+    match = _CREATE_TABLE.match(statement)
+    if not match:
+        return None
+    close = _closing_paren(statement, match.end() - 1)
+    if close < 0:
+        return None
+
+    columns = []
+    primary_keys = []
+    for element in _split_elements(statement[match.end():close]):
+        first = element.split(None, 1)[0].upper()
+        if first in _TABLE_CONSTRAINTS:
+            key = re.search(r"PRIMARY\s+KEY\s*\(([^)]*)\)", element, re.IGNORECASE)
+            if key:
+                primary_keys.extend(_column_list(key.group(1)))
+            continue
+        column = _parse_column(element)
+        if column:
+            columns.append(column)
+
+    if primary_keys:
+        columns = [
+            column._replace(is_primary_key=True, is_nullable=False)
+            if column.name in primary_keys else column
+            for column in columns
+        ]
+
+    qualified = _qualified_name(match.group(1))
+    return qualified, qualified[-1], columns
+
+def parse_create_table(statement: str) -> Optional[Tuple[str, List[ParsedColumn]]]:
+    """
+    Parse a CREATE TABLE statement into (table name, columns).
+    Returns None for any other statement.
+    """
+    parsed = _parse_create_table(statement)
+    return parsed and parsed[1:]
+
+def parse_primary_key(statement: str) -> Optional[Tuple[Tuple[str, ...], List[str]]]:
+    """
+    Parse ALTER TABLE ... ADD PRIMARY KEY (...) into (qualified table
+    name as a tuple of its parts, columns)
+    """
+    match = _ALTER_PRIMARY_KEY.match(statement)
+    if not match:
+        return None
+    return _qualified_name(match.group(1)), _column_list(match.group(2))
+
+def collect_primary_keys(stream) -> Dict[Tuple[str, ...], List[str]]:
+    """
+    First pass over a dump: primary keys declared with ALTER TABLE, which
+    pg_dump writes after every CREATE TABLE, keyed by qualified table
+    name so same-named tables in other schemas keep their own. Only these
+    statements are parsed and kept.
+    """
+    primary_keys = {}
+    for statement in iter_statements(read_text_chunks(stream)):
+        if statement[:5].upper() == "ALTER":
+            key = parse_primary_key(statement)
+            if key:
+                primary_keys[key[0]] = key[1]
+    return primary_keys
+
+def import_sql_dump(db: Session, diagram_id: int, stream, log=None) -> Tuple[int, int]:
+    """
+    Import the tables of a SQL schema dump into a diagram. The stream must
+    be seekable: a first pass collects ALTER TABLE primary keys, so that
+    tables inserted during the second pass are complete and their
+    fingerprints never need recomputing. Tables are inserted in chunks of
+    bulk.BATCH_CHUNK_ROWS columns or bulk.BATCH_CHUNK_TABLES tables as
+    they are parsed, and added to log when given. Does not commit.
+    Returns (tables imported, columns imported).
+    """
+    primary_keys = collect_primary_keys(stream)
+    stream.seek(0)
+
+    lowest = db.scalar(
+        select(func.max(models.Table.y_position)).where(models.Table.diagram_id == diagram_id)
+    )
+    top = 0 if lowest is None else lowest + GRID_SPACING
+
+    pending = []
+    pending_rows = 0
+    table_count = 0
+    column_count = 0
+
+    for statement in iter_statements(read_text_chunks(stream)):
+        parsed = _parse_create_table(statement)
+        if not parsed:
+            continue
+
+        qualified, name, columns = parsed
+        keys = primary_keys.get(qualified)
+        if keys:
+            columns = [
+                column._replace(is_primary_key=True, is_nullable=False)
+                if column.name in keys else column
+                for column in columns
+            ]
+        pending.append(ParsedTable(
+            name=name,
+            x_position=(table_count % GRID_COLUMNS) * GRID_SPACING,
+            y_position=top + (table_count // GRID_COLUMNS) * GRID_SPACING,
+            columns=columns
+        ))
+        table_count += 1
+        pending_rows += len(columns)
+
+        if pending_rows >= bulk.BATCH_CHUNK_ROWS or len(pending) >= bulk.BATCH_CHUNK_TABLES:
+            column_count += bulk.insert_tables(db, diagram_id, pending, log)[1]
+            pending = []
+            pending_rows = 0
+
+    if pending:
+        column_count += bulk.insert_tables(db, diagram_id, pending, log)[1]
+
+    return table_count, column_count
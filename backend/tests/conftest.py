@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+import pytest
+
+# Tes API memakai SQLite lokal, bukan PostgreSQL
+_db_dir = tempfile.mkdtemp(prefix="schemadesigner-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+# Tes menjalankan pengirim outbox secara eksplisit
+os.environ.setdefault("OUTBOX_WORKER", "0")
+# Gagalkan request yang mengulang statement yang sama (N+1)
+os.environ.setdefault("SQL_REPEAT_LIMIT", "20")
+os.environ.setdefault("SQL_REPEAT_ACTION", "raise")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import auth
+import collaboration
+import digest
+import graph
+import models
+import spatial
+from database import Base, SessionLocal, async_engine, engine
+from export_cache import cache as export_cache
+from main import app
+
+TEST_PASSWORD = "rahasia123"
+_password_hash = None
+
+
+@pytest.fixture(autouse=True)
+def reset_database():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    export_cache.clear()
+    auth.principal_cache.clear()
+    collaboration.permission_cache.clear()
+    graph.graph_cache.clear()
+    spatial.grid_cache.clear()
+    digest.notifications.take_due(force=True)
+    yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    """
+    Buat pengguna langsung di database dan kembalikan (user, header Authorization)
+    """
+    def _make_user(username="penguji", email=None):
+        global _password_hash
+        if _password_hash is None:
+            _password_hash = auth.get_password_hash(TEST_PASSWORD)
+
+        user = models.User(
+            username=username,
+            email=email or f"{username}@example.com",
+            hashed_password=_password_hash
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
+        token = auth.create_access_token(data={"sub": user.username})
+        return user, {"Authorization": f"Bearer {token}"}
+
+    return _make_user
+
+
+@pytest.fixture
+def ops_headers(monkeypatch):
+    """
+    Header Authorization untuk /metrics dan endpoint /internal
+    """
+    monkeypatch.setattr(auth, "OPS_TOKEN", "token-operator")
+    return {"Authorization": "Bearer token-operator"}
+
+
+@pytest.fixture
+def query_counter():
+    """
+    Hitung jumlah statement SQL yang dieksekusi selama tes
+    """
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Async routes run on their own engine
+    engines = [engine] + ([async_engine.sync_engine] if async_engine else [])
+    for target in engines:
+        event.listen(target, "before_cursor_execute", _record)
+    yield statements
+    for target in engines:
+        event.remove(target, "before_cursor_execute", _record)
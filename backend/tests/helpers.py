@@ -0,0 +1,39 @@
+import models
+
+
+def seed_diagram(db, owner, name="Diagram Tes", tables=3, columns=2, is_public=False):
+    diagram = models.Diagram(name=name, owner_id=owner.id, is_public=is_public)
+    db.add(diagram)
+    db.flush()
+    for t in range(tables):
+        table = models.Table(name=f"tabel_{t}", diagram_id=diagram.id, x_position=0, y_position=0)
+        db.add(table)
+        db.flush()
+        for c in range(columns):
+            db.add(models.Column(
+                name=f"kolom_{c}",
+                data_type="INTEGER",
+                is_primary_key=(c == 0),
+                is_nullable=(c != 0),
+                table_id=table.id
+            ))
+    db.commit()
+    return diagram
+
+
+def create_table(client, headers, diagram_id, name, columns):
+    response = client.post(
+        f"/diagrams/{diagram_id}/tables/",
+        json={"name": name, "columns": [{"name": column, "data_type": "INTEGER"} for column in columns]},
+        headers=headers
+    )
+    table = response.json()
+    return {"table": table["id"], **{column["name"]: column["id"] for column in table["columns"]}}
+
+
+def relate(client, headers, diagram_id, source, target):
+    return client.post(
+        f"/diagrams/{diagram_id}/relationships",
+        json={"source_column_id": source, "target_column_id": target},
+        headers=headers
+    )
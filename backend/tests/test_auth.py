@@ -0,0 +1,136 @@
+import auth
+
+
+def user_queries(statements):
+    return [s for s in statements if "FROM users" in s]
+
+
+def test_principal_cache_skips_user_query(client, make_user, query_counter, ops_headers):
+    """
+    Permintaan kedua dengan token yang sama tidak menjalankan query pengguna
+    """
+    _, headers = make_user()
+
+    first = client.get("/users/me", headers=headers)
+    query_counter.clear()
+    second = client.get("/users/me", headers=headers)
+
+    assert first.json() == second.json()
+    assert user_queries(query_counter) == []
+    stats = client.get("/internal/principal-cache", headers=ops_headers).json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert all("hashed_password" not in principal for _, principal in auth.principal_cache._entries.values())
+
+
+def test_principal_cache_invalidated_on_deactivation(client, db, make_user):
+    """
+    Menonaktifkan pengguna langsung berlaku walau principal ada di cache
+    """
+    user, headers = make_user()
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    user.is_active = False
+    db.commit()
+
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Inactive user"
+
+
+def test_principal_cache_invalidated_on_rename(client, db, make_user):
+    """
+    Mengganti username membuat token lama tidak berlaku lagi
+    """
+    user, headers = make_user()
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    user.username = "nama_baru"
+    db.commit()
+
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_principal_cache_expires():
+    """
+    Entri kedaluwarsa setelah TTL
+    """
+    now = [0.0]
+    cache = auth.TTLCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    cache.put(("a", 1), {"id": 1})
+
+    assert cache.get(("a", 1)) == {"id": 1}
+    now[0] = 11
+    assert cache.get(("a", 1)) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_login_for_access_token(client, make_user):
+    """
+    Tes login menghasilkan token yang bisa dipakai
+    """
+    from conftest import TEST_PASSWORD
+    user, _ = make_user()
+
+    response = client.post("/token", data={"username": user.username, "password": TEST_PASSWORD})
+    wrong = client.post("/token", data={"username": user.username, "password": "salah12345"})
+
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.json()["username"] == user.username
+    assert wrong.status_code == 401
+
+
+def test_login_rejected_when_password_queue_times_out(client, make_user, monkeypatch):
+    """
+    Login yang terlalu lama mengantre di pool bcrypt ditolak dengan 503
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from conftest import TEST_PASSWORD
+
+    user, _ = make_user()
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(auth, "password_executor", executor)
+    monkeypatch.setattr(auth, "PASSWORD_QUEUE_TIMEOUT", 0.01)
+    release = threading.Event()
+    executor.submit(release.wait)
+    threading.Timer(0.1, release.set).start()
+
+    response = client.post("/token", data={"username": user.username, "password": TEST_PASSWORD})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    executor.shutdown()
+
+
+def test_saturated_password_pool_rejects_within_timeout(monkeypatch):
+    """
+    Pool yang penuh menolak job baru dalam batas waktu, tanpa menunggu worker bebas
+    """
+    import asyncio
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pytest
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(auth, "password_executor", executor)
+    monkeypatch.setattr(auth, "PASSWORD_QUEUE_TIMEOUT", 0.05)
+    release = threading.Event()
+    executor.submit(release.wait)
+
+    started = time.monotonic()
+    with pytest.raises(auth.PasswordQueueTimeout):
+        asyncio.run(auth.get_password_hash_async("rahasia123"))
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 1
+    # Job yang ditolak dibatalkan, worker tidak menjalankannya setelah bebas
+    assert executor._work_queue.qsize() == 1
+    assert executor._work_queue.get_nowait().future.cancelled()
+    release.set()
+    executor.shutdown()
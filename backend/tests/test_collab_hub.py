@@ -0,0 +1,159 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import collab_hub
+import digest
+import history
+import models
+from collab_hub import hub
+from main import app
+from helpers import seed_diagram
+
+
+@pytest.fixture
+def live_client():
+    # Satu event loop untuk semua koneksi, seperti pada server sungguhan
+    with TestClient(app) as client:
+        yield client
+
+
+def token_of(headers):
+    return headers["Authorization"].split()[1]
+
+
+def wait_for(condition, timeout=5):
+    # Handler WebSocket terus berjalan di loop portal setelah klien menutup
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def share(db, diagram, user, level):
+    db.add(models.DiagramCollaboration(diagram_id=diagram.id, user_id=user.id, permission_level=level))
+    db.commit()
+
+
+def test_join_requires_permission(live_client, db, make_user):
+    """
+    Pengguna tanpa akses ke diagram privat ditolak saat bergabung
+    """
+    owner, _ = make_user()
+    _, other_headers = make_user("lainnya")
+    diagram = seed_diagram(db, owner, tables=0)
+
+    with pytest.raises(WebSocketDisconnect) as error:
+        with live_client.websocket_connect(f"/ws/diagrams/{diagram.id}?token={token_of(other_headers)}"):
+            pass
+    assert error.value.code == 1008
+
+    with pytest.raises(WebSocketDisconnect):
+        with live_client.websocket_connect(f"/ws/diagrams/{diagram.id}?token=bukan-token"):
+            pass
+
+
+def test_moves_are_relayed_and_coalesced(live_client, db, make_user, monkeypatch):
+    """
+    Gerakan diteruskan ke anggota ruang; posisi ditulis sekali saat ruang ditutup
+    """
+    monkeypatch.setattr(hub, "flush_interval", 60)
+    owner, owner_headers = make_user()
+    viewer, viewer_headers = make_user("pengamat")
+    diagram = seed_diagram(db, owner, tables=1, columns=1)
+    table = diagram.tables[0]
+    share(db, diagram, viewer, models.PermissionLevel.VIEW)
+    flushes = hub.stats["position_flushes"]
+    rows = hub.stats["position_rows"]
+
+    with live_client.websocket_connect(f"/ws/diagrams/{diagram.id}?token={token_of(owner_headers)}") as editor:
+        assert editor.receive_json()["permission"] == "admin"
+        with live_client.websocket_connect(f"/ws/diagrams/{diagram.id}?token={token_of(viewer_headers)}") as watcher:
+            assert watcher.receive_json() == {"type": "joined", "permission": "view", "members": 2}
+            assert editor.receive_json()["type"] == "presence"
+
+            for step in range(50):
+                editor.send_json({"type": "move", "table_id": table.id, "x": step, "y": step * 2})
+            moves = [watcher.receive_json() for _ in range(50)]
+            assert moves[-1] == {"type": "move", "user_id": owner.id, "table_id": table.id, "x": 49, "y": 98}
+
+            # Pengamat hanya boleh membaca
+            watcher.send_json({"type": "move", "table_id": table.id, "x": 0, "y": 0})
+            assert watcher.receive_json()["type"] == "error"
+
+    wait_for(lambda: hub.stats["position_flushes"] > flushes)
+    assert hub.stats["position_flushes"] == flushes + 1
+    assert hub.stats["position_rows"] == rows + 1
+    db.refresh(table)
+    assert (table.x_position, table.y_position) == (49, 98)
+    # Satu flush menjadi satu revisi riwayat atas nama penggeraknya
+    db.refresh(diagram)
+    moved = db.query(models.DiagramOperation).filter_by(diagram_id=diagram.id, revision=diagram.revision).one()
+    assert moved.user_id == owner.id
+    assert history.load_revision(db, diagram.id, diagram.revision)[table.id]["x"] == 49
+    # 50 gerakan satu tabel masuk digest pengamat sebagai satu perpindahan
+    wait_for(lambda: digest.notifications.pending_count() > 0)
+    assert digest.notifications.take_due(force=True) == [
+        ("pengamat@example.com", diagram.name, {"penguji": {"table_moved": 1}})
+    ]
+
+
+def test_rest_writes_are_broadcast(live_client, db, make_user):
+    """
+    Tabel yang dibuat lewat REST diumumkan ke ruang diagram
+    """
+    owner, headers = make_user()
+    editor, editor_headers = make_user("penyunting")
+    diagram = seed_diagram(db, owner, tables=0)
+    share(db, diagram, editor, models.PermissionLevel.EDIT)
+
+    with live_client.websocket_connect(f"/ws/diagrams/{diagram.id}?token={token_of(editor_headers)}") as socket:
+        assert socket.receive_json()["permission"] == "edit"
+        live_client.post(
+            f"/diagrams/{diagram.id}/tables/",
+            json={"name": "pesanan", "columns": [{"name": "id", "data_type": "INTEGER"}]},
+            headers=headers
+        )
+        message = socket.receive_json()
+        table_id = message["table"]["id"]
+        live_client.patch(
+            f"/diagrams/{diagram.id}/positions",
+            json=[{"table_id": table_id, "x": 40, "y": 50}],
+            headers=headers
+        )
+        moved = socket.receive_json()
+
+    assert message["type"] == "table.created"
+    assert message["table"]["name"] == "pesanan"
+    assert message["table"]["columns"][0]["name"] == "id"
+    assert moved == {
+        "type": "tables.moved", "user_id": owner.id, "positions": [{"table_id": table_id, "x": 40, "y": 50}]
+    }
+
+
+def test_slow_consumer_is_closed_with_1013(live_client, db, make_user, monkeypatch):
+    """
+    Klien yang tertinggal terlalu jauh diputus dengan kode 1013, walau pembacanya keluar lebih dulu
+    """
+    monkeypatch.setattr(collab_hub, "WS_CLIENT_QUEUE_SIZE", 2)
+    owner, headers = make_user()
+    diagram = seed_diagram(db, owner, tables=0)
+
+    with live_client.websocket_connect(f"/ws/diagrams/{diagram.id}?token={token_of(headers)}") as socket:
+        assert socket.receive_json()["type"] == "joined"
+
+        async def flood():
+            room = hub.rooms[diagram.id]
+            client, = room.clients
+            for number in range(5):
+                hub.broadcast(diagram.id, {"type": "op", "user_id": 0, "op": number})
+            # Pembaca keluar sebelum penulis sempat mengirim penanda tutup
+            await hub._leave(room, client)
+            return client.writer.cancelled()
+
+        assert live_client.portal.call(flood) is False
+        with pytest.raises(WebSocketDisconnect) as error:
+            socket.receive_json()
+    assert error.value.code == 1013
@@ -0,0 +1,233 @@
+import asyncio
+
+from sqlalchemy import select
+
+import collaboration
+import models
+from database import SessionLocal, ThreadedSession
+from helpers import seed_diagram
+
+
+def queued_emails(db):
+    return [row.to_email for row in db.query(models.EmailOutbox).order_by(models.EmailOutbox.id)]
+
+
+def test_invite_registered_user(client, db, make_user):
+    """
+    Mengundang pengguna terdaftar langsung menjadikannya kolaborator
+    """
+    owner, headers = make_user()
+    make_user("rekan")
+    diagram = seed_diagram(db, owner, tables=0)
+
+    response = client.post(
+        f"/diagrams/{diagram.id}/invite",
+        json={"diagram_id": diagram.id, "invited_email": "rekan@example.com", "permission_level": "edit"},
+        headers=headers
+    )
+
+    assert response.status_code == 200
+    assert queued_emails(db) == []
+    collaborators = client.get(f"/diagrams/{diagram.id}/collaborators", headers=headers).json()
+    assert [(c["username"], c["permission_level"]) for c in collaborators] == [("rekan", "edit")]
+
+
+def test_invitation_flow(client, db, make_user):
+    """
+    Undangan untuk email baru: email masuk outbox, lalu diterima setelah mendaftar
+    """
+    owner, headers = make_user()
+    diagram = seed_diagram(db, owner, tables=0)
+
+    response = client.post(
+        f"/diagrams/{diagram.id}/invite",
+        json={"diagram_id": diagram.id, "invited_email": "baru@example.com"},
+        headers=headers
+    )
+    invitation_id = response.json()["invitation_id"]
+    assert queued_emails(db) == ["baru@example.com"]
+
+    _, invited_headers = make_user("baru")
+    invitations = client.get("/invitations", headers=invited_headers).json()
+    assert [(i["id"], i["permission_level"], i["status"]) for i in invitations] == [
+        (invitation_id, "view", "pending")
+    ]
+
+    response = client.post(f"/invitations/{invitation_id}/accept", headers=invited_headers)
+
+    assert response.status_code == 200
+    assert client.get("/invitations", headers=invited_headers).json() == []
+    collaborators = client.get(f"/diagrams/{diagram.id}/collaborators", headers=headers).json()
+    assert [c["username"] for c in collaborators] == ["baru"]
+
+
+def test_update_and_remove_collaborator(client, db, make_user):
+    """
+    Pemilik dapat mengubah izin dan menghapus kolaborator
+    """
+    owner, headers = make_user()
+    rekan, _ = make_user("rekan")
+    diagram = seed_diagram(db, owner, tables=0)
+    db.add(models.DiagramCollaboration(diagram_id=diagram.id, user_id=rekan.id))
+    db.commit()
+
+    url = f"/diagrams/{diagram.id}/collaborators/{rekan.id}"
+    response = client.put(f"{url}/permission?new_permission=admin", headers=headers)
+    assert response.status_code == 200
+    collaborators = client.get(f"/diagrams/{diagram.id}/collaborators", headers=headers).json()
+    assert collaborators[0]["permission_level"] == "admin"
+
+    assert client.delete(url, headers=headers).status_code == 200
+    assert client.get(f"/diagrams/{diagram.id}/collaborators", headers=headers).json() == []
+    assert client.delete(url, headers=headers).status_code == 404
+
+
+def test_invite_requires_owner(client, db, make_user):
+    """
+    Hanya pemilik atau admin diagram yang boleh mengundang
+    """
+    owner, _ = make_user()
+    _, other_headers = make_user("lainnya")
+    diagram = seed_diagram(db, owner, tables=0)
+
+    response = client.post(
+        f"/diagrams/{diagram.id}/invite",
+        json={"diagram_id": diagram.id, "invited_email": "lainnya@example.com"},
+        headers=other_headers
+    )
+
+    assert response.status_code == 404
+    assert db.query(models.DiagramCollaboration).count() == 0
+
+
+def test_invite_batch(client, db, make_user, query_counter):
+    """
+    Undangan massal: pengguna terdaftar ditambahkan, email baru diundang, sisanya dilewati
+    """
+    owner, headers = make_user()
+    rekan, rekan_headers = make_user("rekan")
+    anggota, _ = make_user("anggota")
+    diagram = seed_diagram(db, owner, tables=0)
+    db.add(models.DiagramCollaboration(diagram_id=diagram.id, user_id=anggota.id))
+    db.commit()
+    client.post(
+        f"/diagrams/{diagram.id}/invite",
+        json={"diagram_id": diagram.id, "invited_email": "tertunda@example.com"},
+        headers=headers
+    )
+    new_emails = [f"baru{i}@example.com" for i in range(5)]
+    payload = {
+        "invited_emails": [
+            "rekan@example.com", "anggota@example.com", owner.email, "tertunda@example.com",
+            *new_emails, new_emails[0]
+        ],
+        "permission_level": "edit"
+    }
+
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=rekan_headers).status_code == 404
+
+    query_counter.clear()
+    response = client.post(f"/diagrams/{diagram.id}/invite:batch", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["added"] == ["rekan@example.com"]
+    assert [sent["invited_email"] for sent in body["invited"]] == new_emails
+    assert body["skipped"] == ["anggota@example.com", owner.email, "tertunda@example.com"]
+    # Satu INSERT per tabel, bukan per email
+    assert len([s for s in query_counter if s.startswith("INSERT")]) == 3
+    assert queued_emails(db) == ["tertunda@example.com", *new_emails]
+    level = db.scalar(select(models.DiagramCollaboration.permission_level).where(
+        models.DiagramCollaboration.user_id == rekan.id
+    ))
+    assert level == models.PermissionLevel.EDIT
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=rekan_headers).status_code == 200
+
+    _, invited_headers = make_user("baru0")
+    invitations = client.get("/invitations", headers=invited_headers).json()
+    assert [i["id"] for i in invitations] == [body["invited"][0]["invitation_id"]]
+
+
+def test_permissions_follow_collaboration_changes(client, db, make_user):
+    """
+    Izin dari cache ikut berubah saat izin kolaborator diubah atau dicabut
+    """
+    owner, headers = make_user()
+    rekan, rekan_headers = make_user("rekan")
+    diagram = seed_diagram(db, owner, tables=0)
+    db.add(models.DiagramCollaboration(diagram_id=diagram.id, user_id=rekan.id))
+    db.commit()
+    table = {"name": "tabel", "columns": []}
+
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=rekan_headers).status_code == 200
+    assert client.post(f"/diagrams/{diagram.id}/tables/", json=table, headers=rekan_headers).status_code == 403
+    hits = collaboration.permission_cache.hits
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=rekan_headers).status_code == 200
+    assert collaboration.permission_cache.hits == hits + 1
+
+    url = f"/diagrams/{diagram.id}/collaborators/{rekan.id}"
+    client.put(f"{url}/permission?new_permission=edit", headers=headers)
+    assert client.post(f"/diagrams/{diagram.id}/tables/", json=table, headers=rekan_headers).status_code == 200
+    # Editor boleh melihat kolaborator, tetapi tidak mengelolanya
+    assert client.get(f"/diagrams/{diagram.id}/collaborators", headers=rekan_headers).status_code == 200
+    assert client.delete(url, headers=rekan_headers).status_code == 403
+
+    client.delete(url, headers=headers)
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=rekan_headers).status_code == 404
+
+
+
+def test_missing_diagram_is_not_cached(client, db, make_user):
+    """
+    Diagram yang belum ada tidak disimpan di cache, jadi langsung terlihat setelah dibuat
+    """
+    owner, headers = make_user()
+    diagram_id = seed_diagram(db, owner, tables=0).id + 1
+
+    assert client.get(f"/diagrams/{diagram_id}/export", headers=headers).status_code == 404
+    assert collaboration.permission_cache.get((owner.id, diagram_id)) is None
+
+    # Entri basi dari sebelum diagram dibuat dibuang saat insert di-commit
+    collaboration.permission_cache.put((owner.id, diagram_id), collaboration._NO_ACCESS)
+    db.add(models.Diagram(id=diagram_id, name="baru", owner_id=owner.id))
+    db.commit()
+
+    assert client.get(f"/diagrams/{diagram_id}/export", headers=headers).status_code == 200
+
+def test_accepted_invitation_grants_access(client, db, make_user):
+    """
+    Setelah undangan diterima, diagram langsung terlihat dan muncul di daftar
+    """
+    owner, headers = make_user()
+    diagram = seed_diagram(db, owner, tables=0)
+    invitation_id = client.post(
+        f"/diagrams/{diagram.id}/invite",
+        json={"diagram_id": diagram.id, "invited_email": "baru@example.com"},
+        headers=headers
+    ).json()["invitation_id"]
+    _, invited_headers = make_user("baru")
+
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=invited_headers).status_code == 404
+    assert client.get("/diagrams/", headers=invited_headers).json() == []
+
+    client.post(f"/invitations/{invitation_id}/accept", headers=invited_headers)
+
+    assert client.get(f"/diagrams/{diagram.id}/export", headers=invited_headers).status_code == 200
+    listed = client.get("/diagrams/?view=summary", headers=invited_headers).json()
+    assert [d["id"] for d in listed] == [diagram.id]
+
+
+def test_threaded_session_matches_async_api(make_user):
+    """
+    Mode sinkron (DB_ASYNC=0) menjalankan API sesi async di threadpool
+    """
+    make_user()
+
+    async def lookup():
+        session = ThreadedSession(SessionLocal(expire_on_commit=False))
+        try:
+            return await session.scalar(select(models.User.username))
+        finally:
+            await session.close()
+
+    assert asyncio.run(lookup()) == "penguji"
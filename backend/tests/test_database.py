@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+
+import database
+from pool_metrics import PoolMetrics, timed_pool_class
+
+
+def test_engine_options_from_settings(monkeypatch):
+    """
+    Pengaturan pool dan statement_timeout diteruskan sesuai driver
+    """
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 20)
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 5000)
+
+    sync = database.engine_options("postgresql://u:p@localhost/db")
+    assert sync["pool_size"] == 20
+    assert sync["pool_pre_ping"] is True
+    assert sync["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+    async_options = database.engine_options("postgresql+asyncpg://u:p@localhost/db")
+    assert async_options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+
+    # aiosqlite memakai NullPool: tanpa ukuran pool dan tanpa statement_timeout
+    sqlite = database.engine_options("sqlite+aiosqlite:///tes.db")
+    assert "pool_size" not in sqlite
+    assert sqlite["connect_args"] == {}
+
+
+def test_db_pool_endpoint(client, make_user, ops_headers):
+    """
+    Statistik pool diisi dari event pool SQLAlchemy
+    """
+    _, headers = make_user()
+    client.get("/users/me", headers=headers)
+
+    response = client.get("/internal/db-pool", headers=ops_headers)
+
+    assert response.status_code == 200
+    sync = response.json()["sync"]
+    assert sync["checkouts"] > 0
+    assert {"size", "checked_out", "overflow"} <= sync.keys()
+    assert sync["checkout_wait_ms"]["count"] >= sync["checkouts"]
+    assert sync["checkout_wait_ms"]["buckets"]["+Inf"] == sync["checkout_wait_ms"]["count"]
+
+
+def test_pool_timeout_is_counted(tmp_path):
+    """
+    Checkout yang habis waktu tercatat sebagai timeout
+    """
+    metrics = PoolMetrics()
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=timed_pool_class(QueuePool, metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05
+    )
+    metrics.attach(engine)
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        report = metrics.report(engine.pool)
+
+    assert report["timeouts"] == 1
+    assert report["checked_out"] == 1
+    assert report["checkout_wait_ms"]["count"] == 2
+    engine.dispose()
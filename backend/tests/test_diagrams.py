@@ -0,0 +1,293 @@
+import gzip
+import json
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.dialects import postgresql
+
+import bulk
+import fast_json
+import models
+import schemas
+from positions import values_update
+from helpers import seed_diagram
+
+
+def test_read_diagrams_full_graph(client, db, make_user):
+    """
+    Tes daftar diagram lengkap dengan tabel dan kolom
+    """
+    user, headers = make_user()
+    seed_diagram(db, user, tables=2, columns=3)
+
+    response = client.get("/diagrams/", headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body) == 1
+    assert len(body[0]["tables"]) == 2
+    assert all(len(table["columns"]) == 3 for table in body[0]["tables"])
+
+
+def test_read_diagrams_query_count_is_constant(client, db, make_user, query_counter):
+    """
+    Jumlah query tidak boleh bertambah seiring jumlah diagram dan tabel
+    """
+    user, headers = make_user()
+    seed_diagram(db, user, tables=1, columns=1)
+    client.get("/diagrams/", headers=headers)
+
+    query_counter.clear()
+    client.get("/diagrams/", headers=headers)
+    baseline = len(query_counter)
+
+    for i in range(5):
+        seed_diagram(db, user, name=f"Diagram {i}", tables=4, columns=3)
+
+    query_counter.clear()
+    response = client.get("/diagrams/", headers=headers)
+
+    assert len(response.json()) == 6
+    assert len(query_counter) == baseline
+
+
+def test_read_diagrams_summary(client, db, make_user, query_counter):
+    """
+    Tes mode ringkasan: hanya metadata dan jumlah tabel/kolom
+    """
+    user, headers = make_user()
+    seed_diagram(db, user, tables=3, columns=4)
+    seed_diagram(db, user, name="Kosong", tables=0)
+
+    query_counter.clear()
+    response = client.get("/diagrams/?view=summary", headers=headers)
+
+    assert response.status_code == 200
+    counts = {d["name"]: (d["table_count"], d["column_count"]) for d in response.json()}
+    assert counts == {"Diagram Tes": (3, 12), "Kosong": (0, 0)}
+    assert "tables" not in response.json()[0]
+    # Pengguna, kunci halaman, lalu satu query terkelompok untuk ringkasan
+    assert len(query_counter) == 3
+
+
+def test_read_diagrams_cursor_pagination(client, db, make_user):
+    """
+    Tes paginasi kursor: stabil, tanpa duplikat, mencakup diagram publik
+    """
+    user, headers = make_user()
+    other, _ = make_user("lainnya")
+    expected = set()
+    for i in range(5):
+        expected.add(seed_diagram(db, user, name=f"Milik {i}", tables=0).id)
+    for i in range(3):
+        expected.add(seed_diagram(db, other, name=f"Publik {i}", tables=0, is_public=True).id)
+    seed_diagram(db, other, name="Privat", tables=0)
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/diagrams/?limit=3&view=summary" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        seen.extend(d["id"] for d in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen))
+    assert set(seen) == expected
+    # Dengan updated_at yang sama, urutan jatuh ke id menurun
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_read_diagrams_invalid_cursor(client, make_user):
+    """
+    Kursor yang rusak harus ditolak dengan 400
+    """
+    _, headers = make_user()
+
+    response = client.get("/diagrams/?cursor=bukan-kursor", headers=headers)
+
+    assert response.status_code == 400
+
+
+def test_create_tables_batch(client, db, make_user, monkeypatch, query_counter):
+    """
+    Tes pembuatan tabel massal dalam beberapa potongan
+    """
+    monkeypatch.setattr(bulk, "BATCH_CHUNK_ROWS", 4)
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=0)
+    payload = [
+        {
+            "name": f"tabel_{t}",
+            "x_position": t,
+            "columns": [{"name": f"kolom_{c}", "data_type": "TEXT"} for c in range(3)]
+        } for t in range(5)
+    ]
+
+    query_counter.clear()
+    response = client.post(f"/diagrams/{diagram.id}/tables:batch", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["column_count"] == 15
+    tables = db.query(models.Table).filter(models.Table.id.in_(body["table_ids"])).all()
+    names = {table.id: table.name for table in tables}
+    assert [names[table_id] for table_id in body["table_ids"]] == [f"tabel_{t}" for t in range(5)]
+    assert all(len(table.columns) == 3 for table in tables)
+    # Satu INSERT tabel dan satu INSERT kolom per potongan, bukan per baris
+    inserts = [s for s in query_counter if s.startswith(("INSERT INTO tables", "INSERT INTO columns"))]
+    assert len(inserts) == 10
+
+
+
+def test_create_tables_batch_caps_tables_per_chunk(client, db, make_user, monkeypatch, query_counter):
+    """
+    Tabel tanpa kolom tetap dipotong per BATCH_CHUNK_TABLES tabel
+    """
+    monkeypatch.setattr(bulk, "BATCH_CHUNK_TABLES", 2)
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=0)
+    payload = [{"name": f"tabel_{t}", "columns": []} for t in range(5)]
+
+    query_counter.clear()
+    response = client.post(f"/diagrams/{diagram.id}/tables:batch", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.json()["table_ids"]) == 5
+    inserts = [s for s in query_counter if s.startswith("INSERT INTO tables")]
+    assert len(inserts) == 3
+
+def test_create_tables_batch_requires_owner(client, db, make_user):
+    """
+    Hanya pemilik diagram yang boleh menambah tabel massal
+    """
+    owner, _ = make_user()
+    _, other_headers = make_user("lainnya")
+    diagram = seed_diagram(db, owner, tables=0)
+
+    response = client.post(
+        f"/diagrams/{diagram.id}/tables:batch",
+        json=[{"name": "tabel", "columns": []}],
+        headers=other_headers
+    )
+
+    assert response.status_code == 404
+
+
+def test_update_positions(client, db, make_user, query_counter):
+    """
+    Posisi banyak tabel diperbarui dengan satu UPDATE
+    """
+    owner, _ = make_user()
+    editor, editor_headers = make_user("penyunting")
+    diagram = seed_diagram(db, owner, tables=3)
+    other = seed_diagram(db, owner, name="Lain", tables=1)
+    db.add(models.DiagramCollaboration(
+        diagram_id=diagram.id, user_id=editor.id, permission_level=models.PermissionLevel.EDIT
+    ))
+    db.commit()
+    ids = [table.id for table in diagram.tables]
+    payload = [
+        {"table_id": ids[0], "x": 1, "y": 1},
+        {"table_id": ids[1], "x": 20, "y": 30},
+        {"table_id": ids[0], "x": 10, "y": 15},
+        # Tabel milik diagram lain diabaikan
+        {"table_id": other.tables[0].id, "x": 99, "y": 99},
+    ]
+
+    query_counter.clear()
+    response = client.patch(f"/diagrams/{diagram.id}/positions", json=payload, headers=editor_headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": 2}
+    assert len([s for s in query_counter if s.startswith("UPDATE tables")]) == 1
+    db.expire_all()
+    positions = {table.id: (table.x_position, table.y_position) for table in diagram.tables}
+    assert positions == {ids[0]: (10, 15), ids[1]: (20, 30), ids[2]: (0, 0)}
+    assert (other.tables[0].x_position, other.tables[0].y_position) == (0, 0)
+
+
+def test_update_positions_requires_edit(client, db, make_user):
+    """
+    Pengamat dan pengguna lain tidak boleh memindahkan tabel
+    """
+    owner, _ = make_user()
+    viewer, viewer_headers = make_user("pengamat")
+    _, other_headers = make_user("lainnya")
+    diagram = seed_diagram(db, owner, tables=1)
+    db.add(models.DiagramCollaboration(
+        diagram_id=diagram.id, user_id=viewer.id, permission_level=models.PermissionLevel.VIEW
+    ))
+    db.commit()
+    payload = [{"table_id": diagram.tables[0].id, "x": 5, "y": 5}]
+
+    assert client.patch(f"/diagrams/{diagram.id}/positions", json=payload, headers=viewer_headers).status_code == 403
+    assert client.patch(f"/diagrams/{diagram.id}/positions", json=payload, headers=other_headers).status_code == 404
+
+
+def test_positions_values_update_on_postgresql():
+    """
+    Di PostgreSQL pembaruan memakai UPDATE ... FROM (VALUES ...)
+    """
+    sql = str(values_update(7, [(1, 10, 20), (2, 30, 40)]).compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    ))
+
+    assert "FROM (VALUES (1, 10, 20), (2, 30, 40)) AS moved (id, x, y)" in sql
+    assert "tables.id = moved.id AND tables.diagram_id = 7" in sql
+
+
+def test_read_diagrams_matches_response_model_bytes(client, db, make_user):
+    """
+    Jalur JSON cepat menghasilkan byte yang sama dengan response_model Pydantic
+    """
+    user, headers = make_user()
+    seed_diagram(db, user, name="Diagram \"kutip\" \u00e9\u00e8 \U0001F600\n\t\x01 \u2028", tables=3, columns=3)
+    seed_diagram(db, user, name="Kosong", tables=0)
+    db.query(models.Diagram).filter_by(name="Kosong").update({"description": "Tanpa tabel", "is_public": True})
+    db.commit()
+
+    def expected(model, diagrams):
+        content = jsonable_encoder([
+            model.from_orm(diagram) if model.__config__.orm_mode
+            else model(**{field: getattr(diagram, field) for field in model.__fields__})
+            for diagram in diagrams
+        ])
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    diagrams = db.query(models.Diagram).order_by(models.Diagram.updated_at.desc(), models.Diagram.id.desc()).all()
+    response = client.get("/diagrams/", headers={**headers, "Accept-Encoding": "identity"})
+    assert response.content == expected(schemas.Diagram, diagrams)
+
+    for diagram in diagrams:
+        diagram.table_count = len(diagram.tables)
+        diagram.column_count = sum(len(table.columns) for table in diagram.tables)
+    response = client.get("/diagrams/?view=summary", headers={**headers, "Accept-Encoding": "identity"})
+    assert response.content == expected(schemas.DiagramSummary, diagrams)
+
+
+def test_read_diagrams_compression(client, db, make_user, monkeypatch):
+    """
+    Respons besar dikompresi brotli atau gzip sesuai Accept-Encoding
+    """
+    monkeypatch.setattr(fast_json, "JSON_COMPRESS_MIN_BYTES", 1024)
+    user, headers = make_user()
+    seed_diagram(db, user, tables=20, columns=5)
+    plain = client.get("/diagrams/", headers={**headers, "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert len(plain.content) > 1024
+
+    # httpx membuka gzip sendiri; isi mentah diperiksa lewat stream
+    with client.stream("GET", "/diagrams/", headers={**headers, "Accept-Encoding": "br;q=1, gzip;q=0.5"}) as response:
+        assert response.headers["Content-Encoding"] == "br"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert brotli.decompress(b"".join(response.iter_raw())) == plain.content
+    with client.stream("GET", "/diagrams/", headers={**headers, "Accept-Encoding": "gzip, br;q=0"}) as response:
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(b"".join(response.iter_raw())) == plain.content
+
+    monkeypatch.setattr(fast_json, "JSON_COMPRESS_MIN_BYTES", 10 ** 6)
+    small = client.get("/diagrams/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
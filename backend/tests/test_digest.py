@@ -0,0 +1,115 @@
+import digest
+import models
+from email_service import digest_message
+from helpers import seed_diagram
+
+
+def make_digest(**kwargs):
+    now = [0.0]
+    delivered = []
+    aggregator = digest.NotificationDigest(
+        clock=lambda: now[0], deliver=delivered.extend, **kwargs
+    )
+    return aggregator, now, delivered
+
+
+def test_digest_coalesces_events_per_window():
+    """
+    Banyak kejadian dalam satu jendela menjadi satu email ringkasan
+    """
+    aggregator, now, delivered = make_digest(window=60)
+    for _ in range(37):
+        aggregator.record("rekan@example.com", 1, "Gudang", "alice", "table_changed")
+    aggregator.record("rekan@example.com", 1, "Gudang", "alice", "column_added", 4)
+
+    assert aggregator.flush() == 0
+    now[0] = 61
+    assert aggregator.flush() == 1
+
+    (recipient, diagram_name, changes), = delivered
+    assert (recipient, diagram_name) == ("rekan@example.com", "Gudang")
+    subject, body = digest_message(diagram_name, changes)
+    assert "Gudang" in subject
+    assert "alice mengubah 37 tabel, menambahkan 4 kolom." in body
+
+
+def test_digest_memory_is_bounded():
+    """
+    Melebihi batas digest tertunda: yang tertua dikirim lebih awal
+    """
+    aggregator, _, delivered = make_digest(window=60, max_pending=2, max_actors=2)
+    for diagram_id in range(3):
+        aggregator.record("rekan@example.com", diagram_id, f"D{diagram_id}", "alice", "table_moved")
+    for actor in ("bob", "carol", "dave"):
+        aggregator.record("rekan@example.com", 2, "D2", actor, "table_moved")
+
+    assert aggregator.pending_count() == 3
+    assert aggregator.flush() == 1
+    assert delivered[0][1] == "D0"
+
+    aggregator.flush(force=True)
+    assert delivered[-1][2] == {"alice": {"table_moved": 1}, "bob": {"table_moved": 1}, None: {"table_moved": 2}}
+
+
+def test_moved_ids_are_bounded_across_digests():
+    """
+    Id tabel yang dipindahkan dibatasi untuk semua digest bersama; sisanya tetap dihitung
+    """
+    aggregator, _, delivered = make_digest(window=60, max_moved=50)
+    recipients = [f"rekan{number}@example.com" for number in range(4)]
+    aggregator.record_moves(recipients, 1, "Gudang", "alice", range(100))
+    aggregator.record_moves(recipients, 1, "Gudang", "alice", range(10))
+
+    assert aggregator.moved_count == 50
+    assert sum(len(ids) for pending in aggregator._pending.values() for ids in pending.moved.values()) == 50
+    aggregator.flush(force=True)
+    assert aggregator.moved_count == 0
+    assert [changes["alice"]["table_moved"] for _, _, changes in delivered] == [100, 110, 110, 110]
+
+
+def test_table_creation_feeds_collaborator_digest(client, db, make_user):
+    """
+    Menambah tabel dicatat ke digest kolaborator, lalu masuk outbox saat di-flush
+    """
+    owner, headers = make_user()
+    rekan, _ = make_user("rekan")
+    diagram = seed_diagram(db, owner, name="Gudang", tables=0)
+    db.add(models.DiagramCollaboration(diagram_id=diagram.id, user_id=rekan.id))
+    db.commit()
+
+    for t in range(3):
+        client.post(
+            f"/diagrams/{diagram.id}/tables/",
+            json={"name": f"tabel_{t}", "columns": [{"name": "id", "data_type": "INTEGER"}]},
+            headers=headers
+        )
+
+    assert digest.notifications.flush(force=True) == 1
+    email, = db.query(models.EmailOutbox).all()
+    assert email.to_email == "rekan@example.com"
+    assert "penguji menambahkan 3 tabel, menambahkan 3 kolom." in email.body
+
+
+def test_moves_reach_owner_once_per_table(client, db, make_user):
+    """
+    Pemilik diagram menerima digest perpindahan tabel oleh kolaborator; tabel yang digeser berkali-kali dihitung sekali
+    """
+    owner, _ = make_user()
+    rekan, rekan_headers = make_user("rekan")
+    diagram = seed_diagram(db, owner, name="Gudang", tables=2)
+    db.add(models.DiagramCollaboration(
+        diagram_id=diagram.id, user_id=rekan.id, permission_level=models.PermissionLevel.EDIT
+    ))
+    db.commit()
+    first = diagram.tables[0].id
+
+    for x in (10, 20, 30):
+        client.patch(
+            f"/diagrams/{diagram.id}/positions", json=[{"table_id": first, "x": x, "y": 0}], headers=rekan_headers
+        )
+    client.post(f"/diagrams/{diagram.id}/layout", headers=rekan_headers)
+
+    assert digest.notifications.flush(force=True) == 1
+    email, = db.query(models.EmailOutbox).all()
+    assert email.to_email == "penguji@example.com"
+    assert "rekan memindahkan 2 tabel." in email.body
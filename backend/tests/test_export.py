@@ -0,0 +1,147 @@
+import json
+
+import models
+
+from export_cache import ExportCache, etag_matches
+from helpers import seed_diagram
+
+
+def test_export_diagram(client, db, make_user):
+    """
+    Tes ekspor DDL dan skema JSON beserta ETag
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=1, columns=2)
+
+    response = client.get(f"/diagrams/{diagram.id}/export", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"]
+    body = response.json()
+    assert "CREATE TABLE tabel_0" in body["sql_ddl"]
+    assert "PRIMARY KEY (kolom_0)" in body["sql_ddl"]
+    assert body["json_schema"]["tables"][0]["columns"][1] == {
+        "name": "kolom_1", "type": "INTEGER", "nullable": True, "primary_key": False
+    }
+
+
+def test_export_not_modified(client, db, make_user, query_counter):
+    """
+    If-None-Match yang cocok menghasilkan 304 dengan satu query diagram
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user)
+    etag = client.get(f"/diagrams/{diagram.id}/export", headers=headers).headers["ETag"]
+
+    query_counter.clear()
+    response = client.get(
+        f"/diagrams/{diagram.id}/export",
+        headers={**headers, "If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    # Pengguna dari cache, hanya satu lookup revisi
+    assert len(query_counter) == 1
+
+
+def test_export_cache_hit_skips_graph_load(client, db, make_user, query_counter):
+    """
+    Ekspor kedua dilayani dari cache tanpa memuat tabel dan kolom
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user)
+    first = client.get(f"/diagrams/{diagram.id}/export", headers=headers)
+
+    query_counter.clear()
+    second = client.get(f"/diagrams/{diagram.id}/export", headers=headers)
+
+    assert second.content == first.content
+    assert len(query_counter) == 1
+
+
+def test_export_changes_after_table_write(client, db, make_user):
+    """
+    Menambah tabel menaikkan revisi dan membatalkan ETag lama
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=1)
+    etag = client.get(f"/diagrams/{diagram.id}/export", headers=headers).headers["ETag"]
+
+    client.post(
+        f"/diagrams/{diagram.id}/tables/",
+        json={"name": "baru", "columns": [{"name": "id", "data_type": "INTEGER"}]},
+        headers=headers
+    )
+    response = client.get(
+        f"/diagrams/{diagram.id}/export",
+        headers={**headers, "If-None-Match": etag}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()["json_schema"]["tables"]) == 2
+
+
+def test_export_cache_eviction_and_spill(tmp_path):
+    """
+    Entri yang tergusur dari memori dibaca kembali dari disk
+    """
+    cache = ExportCache(max_entries=2, spill_dir=str(tmp_path))
+    for diagram_id in range(3):
+        cache.put(diagram_id, 1, json.dumps({"id": diagram_id}).encode())
+
+    assert (0, 1) not in cache._entries
+    assert cache.get(0, 1) == b'{"id": 0}'
+    assert cache.get(0, 2) is None
+
+    cache.put(0, 2, b"baru")
+    assert cache.get(0, 1) is None
+
+
+def test_etag_matches():
+    """
+    Perbandingan If-None-Match termasuk daftar, wildcard dan ETag lemah
+    """
+    assert etag_matches('"a", "1-2-1"', '"1-2-1"')
+    assert etag_matches('W/"1-2-1"', '"1-2-1"')
+    assert etag_matches("*", '"1-2-1"')
+    assert not etag_matches('"1-1-1"', '"1-2-1"')
+    assert not etag_matches(None, '"1-2-1"')
+
+
+def test_export_stream_sql_matches_full_export(client, db, make_user, monkeypatch):
+    """
+    Ekspor SQL bertahap sama persis dengan DDL ekspor biasa
+    """
+    import main
+    monkeypatch.setattr(main, "EXPORT_STREAM_CHUNK", 2)
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=4, columns=3)
+    db.add(models.Table(name="tanpa_kolom", diagram_id=diagram.id))
+    db.commit()
+
+    full = client.get(f"/diagrams/{diagram.id}/export", headers=headers).json()
+    streamed = client.get(f"/diagrams/{diagram.id}/export?stream=1", headers=headers)
+
+    assert streamed.status_code == 200
+    assert streamed.headers["content-type"].startswith("text/plain")
+    assert streamed.text == full["sql_ddl"]
+
+
+def test_export_stream_ndjson(client, db, make_user):
+    """
+    Ekspor NDJSON: baris judul lalu satu baris per tabel
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=3, columns=2)
+
+    full = client.get(f"/diagrams/{diagram.id}/export", headers=headers)
+    streamed = client.get(f"/diagrams/{diagram.id}/export?stream=1&format=ndjson", headers=headers)
+
+    schema = full.json()["json_schema"]
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert lines[0] == {"name": schema["name"]}
+    assert lines[1:] == schema["tables"]
+    # Representasi berbeda, ETag berbeda
+    assert streamed.headers["ETag"] != full.headers["ETag"]
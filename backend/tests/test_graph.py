@@ -0,0 +1,87 @@
+import models
+from graph import Edge, SchemaGraph
+from helpers import create_table, relate
+
+
+def edge(edge_id, source, target):
+    return Edge(edge_id, source, "ref", target, "id", models.Cardinality.MANY_TO_ONE)
+
+
+def test_schema_graph_queries():
+    """
+    Tetangga, keterjangkauan, siklus, dan urutan pembuatan tabel dari indeks adjacency
+    """
+    # 1 -> 2 -> 3 -> 2 (siklus), 4 -> 4 (referensi diri), 5 -> 1
+    graph = SchemaGraph(
+        {1: "a", 2: "b", 3: "c", 4: "d", 5: "e"},
+        [edge(1, 1, 2), edge(2, 2, 3), edge(3, 3, 2), edge(4, 4, 4), edge(5, 5, 1)]
+    )
+
+    assert graph.references(1) == [2]
+    assert graph.referenced_by(2) == [1, 3]
+    assert graph.reachable(5) == [1, 2, 3]
+    assert graph.reachable(2) == [2, 3]
+    assert graph.cycles() == [[2, 3], [4]]
+    assert not graph.in_cycle(1)
+
+    order, deferred = graph.creation_order()
+    assert order == [2, 3, 1, 4, 5]
+    # Hanya b -> c yang menutup siklus; referensi diri tetap di CREATE TABLE
+    assert deferred == {2}
+
+
+def test_export_orders_tables_and_defers_cycles(client, make_user):
+    """
+    Ekspor DDL mengurutkan tabel menurut dependensi dan memecah siklus dengan ALTER TABLE
+    """
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Relasi"}, headers=headers).json()["id"]
+    orders = create_table(client, headers, diagram_id, "orders", ["id", "customer_id"])
+    customers = create_table(client, headers, diagram_id, "customers", ["id", "last_order_id"])
+
+    assert relate(client, headers, diagram_id, orders["customer_id"], customers["id"]).status_code == 200
+    ddl = client.get(f"/diagrams/{diagram_id}/export", headers=headers).json()["sql_ddl"]
+    assert ddl.index("CREATE TABLE customers") < ddl.index("CREATE TABLE orders")
+    assert "CONSTRAINT fk_orders_customer_id FOREIGN KEY (customer_id) REFERENCES customers (id)" in ddl
+
+    cycle = relate(client, headers, diagram_id, customers["last_order_id"], orders["id"])
+    assert cycle.status_code == 200
+    ddl = client.get(f"/diagrams/{diagram_id}/export", headers=headers).json()["sql_ddl"]
+    assert ddl.endswith(
+        "ALTER TABLE orders ADD CONSTRAINT fk_orders_customer_id "
+        "FOREIGN KEY (customer_id) REFERENCES customers (id);"
+    )
+    streamed = client.get(f"/diagrams/{diagram_id}/export", params={"stream": True}, headers=headers)
+    assert streamed.text == ddl
+
+    dependencies = client.get(
+        f"/diagrams/{diagram_id}/tables/{orders['table']}/dependencies",
+        headers=headers
+    ).json()
+    assert dependencies["in_cycle"] is True
+    assert dependencies["depends_on"] == sorted([orders["table"], customers["table"]])
+
+    # Relasi tercatat di riwayat dan dapat dihapus lagi
+    revision = client.get(f"/diagrams/{diagram_id}/revisions/5", headers=headers).json()
+    assert [len(table["foreign_keys"]) for table in revision["tables"]] == [1, 1]
+    response = client.delete(f"/diagrams/{diagram_id}/relationships/{cycle.json()['id']}", headers=headers)
+    assert response.status_code == 200
+    assert "ALTER TABLE" not in client.get(f"/diagrams/{diagram_id}/export", headers=headers).json()["sql_ddl"]
+    revision = client.get(f"/diagrams/{diagram_id}/revisions/6", headers=headers).json()
+    assert [len(table["foreign_keys"]) for table in revision["tables"]] == [1, 0]
+
+
+def test_relationship_columns_must_belong_to_diagram(client, make_user):
+    """
+    Relasi ke kolom diagram lain ditolak, begitu juga relasi ganda
+    """
+    _, headers = make_user()
+    first = client.post("/diagrams/", json={"name": "Satu"}, headers=headers).json()["id"]
+    second = client.post("/diagrams/", json={"name": "Dua"}, headers=headers).json()["id"]
+    local = create_table(client, headers, first, "a", ["id", "b_id"])
+    remote = create_table(client, headers, second, "b", ["id"])
+
+    assert relate(client, headers, first, local["b_id"], remote["id"]).status_code == 404
+    assert relate(client, headers, first, local["b_id"], local["id"]).status_code == 200
+    assert relate(client, headers, first, local["b_id"], local["id"]).status_code == 409
+    assert relate(client, headers, first, local["id"], local["id"]).status_code == 400
@@ -0,0 +1,170 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import history
+import models
+from helpers import seed_diagram
+
+
+def create_table(client, headers, diagram_id, name, columns=("id",)):
+    return client.post(
+        f"/diagrams/{diagram_id}/tables/",
+        json={"name": name, "columns": [{"name": column, "data_type": "INTEGER"} for column in columns]},
+        headers=headers
+    )
+
+
+def table_names(client, headers, diagram_id, revision):
+    response = client.get(f"/diagrams/{diagram_id}/revisions/{revision}", headers=headers)
+    if response.status_code != 200:
+        return response.status_code
+    return [table["name"] for table in response.json()["tables"]]
+
+
+def test_revisions_are_rebuilt_from_snapshots(client, db, make_user, monkeypatch):
+    """
+    Setiap revisi dapat dimuat ulang dari snapshot terdekat ditambah log operasi
+    """
+    monkeypatch.setattr(history, "HISTORY_SNAPSHOT_OPS", 3)
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Riwayat"}, headers=headers).json()["id"]
+
+    for name in ["a", "b", "c", "d", "e"]:
+        create_table(client, headers, diagram_id, name, columns=("id", "nama"))
+    client.post(
+        f"/diagrams/{diagram_id}/tables:batch",
+        json=[{"name": "f", "columns": []}, {"name": "g", "columns": []}],
+        headers=headers
+    )
+    client.post(
+        f"/diagrams/{diagram_id}/import",
+        files={"file": ("skema.sql", io.BytesIO(b"CREATE TABLE h (id INT);"), "application/sql")},
+        headers=headers
+    )
+
+    assert table_names(client, headers, diagram_id, 1) == []
+    assert table_names(client, headers, diagram_id, 3) == ["a", "b"]
+    assert table_names(client, headers, diagram_id, 5) == ["a", "b", "c", "d"]
+    assert table_names(client, headers, diagram_id, 7) == ["a", "b", "c", "d", "e", "f", "g"]
+    assert table_names(client, headers, diagram_id, 8) == ["a", "b", "c", "d", "e", "f", "g", "h"]
+    assert table_names(client, headers, diagram_id, 9) == 404
+
+    revision = client.get(f"/diagrams/{diagram_id}/revisions/2", headers=headers).json()
+    assert revision["tables"][0]["columns"] == [
+        {"name": "id", "data_type": "INTEGER", "is_primary_key": False, "is_nullable": True},
+        {"name": "nama", "data_type": "INTEGER", "is_primary_key": False, "is_nullable": True},
+    ]
+    # Snapshot ditulis setelah 3 operasi terkumpul
+    snapshots = db.query(models.DiagramSnapshot.revision).filter_by(diagram_id=diagram_id).order_by("revision")
+    assert [row.revision for row in snapshots] == [1, 4, 7]
+
+    entries = client.get(f"/diagrams/{diagram_id}/history?limit=3", headers=headers).json()
+    assert [(e["revision"], e["operation_count"]) for e in entries] == [(8, 1), (7, 2), (6, 1)]
+    entries = client.get(f"/diagrams/{diagram_id}/history?before=7", headers=headers).json()
+    assert [e["revision"] for e in entries] == [6, 5, 4, 3, 2]
+
+
+def test_history_of_diagram_created_before_logging(client, db, make_user):
+    """
+    Diagram lama mendapat snapshot dasar pada penulisan pertama
+    """
+    owner, headers = make_user()
+    diagram = seed_diagram(db, owner, tables=2)
+    _, other_headers = make_user("lainnya")
+
+    create_table(client, headers, diagram.id, "baru")
+
+    assert table_names(client, headers, diagram.id, 1) == 404
+    assert table_names(client, headers, diagram.id, 2) == ["tabel_0", "tabel_1", "baru"]
+    assert table_names(client, other_headers, diagram.id, 2) == 404
+
+
+def test_snapshot_of_single_table_keeps_columns(client, db, make_user, monkeypatch):
+    """
+    Snapshot yang ditulis saat membuat satu tabel ikut menyimpan kolomnya
+    """
+    monkeypatch.setattr(history, "HISTORY_SNAPSHOT_OPS", 1)
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Riwayat"}, headers=headers).json()["id"]
+    create_table(client, headers, diagram_id, "a", columns=("id", "nama"))
+    create_table(client, headers, diagram_id, "b")
+
+    snapshot = db.query(models.DiagramSnapshot).filter_by(diagram_id=diagram_id, revision=2).one()
+    assert [[column[0] for column in table["columns"]] for table in history.decode(snapshot.payload)] == [
+        ["id", "nama"]
+    ]
+    revision = client.get(f"/diagrams/{diagram_id}/revisions/3", headers=headers).json()
+    assert [[column["name"] for column in table["columns"]] for table in revision["tables"]] == [
+        ["id", "nama"], ["id"]
+    ]
+
+
+
+def test_position_writes_are_recorded(client, db, make_user, monkeypatch):
+    """
+    Pemindahan tabel tercatat sebagai satu operasi per permintaan, jadi tata letak revisi lama bisa dimuat
+    """
+    monkeypatch.setattr(history, "HISTORY_SNAPSHOT_OPS", 2)
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Posisi"}, headers=headers).json()["id"]
+    ids = [
+        client.post(
+            f"/diagrams/{diagram_id}/tables/",
+            json={"name": name, "x_position": x, "y_position": 0, "columns": []},
+            headers=headers
+        ).json()["id"]
+        for name, x in [("a", 10), ("b", 20)]
+    ]
+    url = f"/diagrams/{diagram_id}/positions"
+    moves = [{"table_id": ids[0], "x": 100, "y": 100}, {"table_id": ids[0], "x": 5, "y": 6}]
+    client.patch(url, json=moves, headers=headers)
+    client.patch(url, json=[{"table_id": ids[1], "x": 7, "y": 8}], headers=headers)
+
+    def positions(revision):
+        body = client.get(f"/diagrams/{diagram_id}/revisions/{revision}", headers=headers).json()
+        return [(table["x"], table["y"]) for table in body["tables"]]
+
+    assert positions(3) == [(10, 0), (20, 0)]
+    assert positions(4) == [(5, 6), (20, 0)]
+    assert positions(5) == [(5, 6), (7, 8)]
+    operations = db.query(models.DiagramOperation).filter_by(diagram_id=diagram_id, revision=4).one()
+    assert operations.operation_count == 1
+    assert history.decode(operations.payload) == [{"op": "tables.move", "positions": [[ids[0], 5, 6]]}]
+
+def test_compaction_keeps_newest_old_snapshot(client, db, make_user, monkeypatch):
+    """
+    Pemadatan menghapus riwayat sebelum snapshot lama terbaru
+    """
+    monkeypatch.setattr(history, "HISTORY_SNAPSHOT_OPS", 2)
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Riwayat"}, headers=headers).json()["id"]
+    for name in ["a", "b", "c", "d", "e"]:
+        create_table(client, headers, diagram_id, name)
+    # Snapshot revisi 1 dan 3 sudah lama, revisi 5 masih baru
+    old = datetime.now(timezone.utc) - timedelta(days=100)
+    db.query(models.DiagramSnapshot).filter(models.DiagramSnapshot.revision <= 3).update({"created_at": old})
+    db.commit()
+
+    removed = history.HistoryCompactor(retention_days=90).run_once()
+
+    assert removed == 3
+    assert table_names(client, headers, diagram_id, 2) == 404
+    assert table_names(client, headers, diagram_id, 3) == ["a", "b"]
+    assert table_names(client, headers, diagram_id, 6) == ["a", "b", "c", "d", "e"]
+
+
+def test_operation_payload_is_compressed():
+    """
+    Log operasi disimpan sebagai NDJSON terkompresi
+    """
+    log = history.OperationLog()
+    columns = [models.Column(name=f"kolom_{c}", data_type="TEXT", is_primary_key=False, is_nullable=True)
+               for c in range(20)]
+    for table_id in range(100):
+        log.table_created(table_id, f"tabel_{table_id}", columns)
+    payload = log.payload()
+
+    operations = history.decode(payload)
+    assert log.count == len(operations) == 100
+    assert operations[0]["columns"][0] == ["kolom_0", "TEXT", False, True]
+    assert len(payload) < len(b"".join(history._line(operation) for operation in operations)) / 10
@@ -0,0 +1,56 @@
+import math
+
+import layout
+import models
+from helpers import create_table, relate
+
+
+def test_force_layout_is_deterministic_and_spread_out():
+    """
+    Tata letak sama untuk seed yang sama, tabel berelasi berdekatan dan tidak saling tumpang tindih
+    """
+    # Rantai 0 -> 1 -> ... -> 29 ditambah satu cabang
+    sources = list(range(1, 30)) + [29]
+    targets = list(range(0, 29)) + [5]
+
+    points = layout.force_layout(30, sources, targets, iterations=30, spacing=300, seed=7)
+    assert points == layout.force_layout(30, sources, targets, iterations=30, spacing=300, seed=7)
+    assert min(x for x, _ in points) == 40 and min(y for _, y in points) == 40
+
+    distances = [math.dist(points[a], points[b]) for a, b in zip(sources, targets)]
+    assert sorted(distances)[len(distances) // 2] < 3 * 300
+    assert min(
+        math.dist(points[a], points[b]) for a in range(30) for b in range(a)
+    ) > 100
+    assert layout.force_layout(0, [], []) == []
+
+
+def test_layout_route_writes_positions(client, db, make_user):
+    """
+    POST /layout menyimpan posisi semua tabel dalam satu revisi baru di riwayat
+    """
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Tata Letak"}, headers=headers).json()["id"]
+    orders = create_table(client, headers, diagram_id, "orders", ["id", "customer_id"])
+    customers = create_table(client, headers, diagram_id, "customers", ["id"])
+    create_table(client, headers, diagram_id, "logs", ["id"])
+    relate(client, headers, diagram_id, orders["customer_id"], customers["id"])
+    revision = db.get(models.Diagram, diagram_id).revision
+
+    response = client.post(f"/diagrams/{diagram_id}/layout", headers=headers)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["updated"] == 3
+
+    db.expire_all()
+    tables = db.query(models.Table).filter_by(diagram_id=diagram_id).all()
+    assert len({(table.x_position, table.y_position) for table in tables}) == 3
+    assert all(table.x_position < result["width"] and table.y_position < result["height"] for table in tables)
+    assert db.get(models.Diagram, diagram_id).revision == revision + 1
+    after = client.get(f"/diagrams/{diagram_id}/revisions/{revision + 1}", headers=headers).json()
+    assert {t["id"]: (t["x"], t["y"]) for t in after["tables"]} == {
+        table.id: (table.x_position, table.y_position) for table in tables
+    }
+
+    _, stranger = make_user("lain")
+    assert client.post(f"/diagrams/{diagram_id}/layout", headers=stranger).status_code == 404
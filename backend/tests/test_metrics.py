@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import select
+
+import auth
+import models
+import request_metrics
+from helpers import seed_diagram
+
+
+def test_metrics_endpoint_reports_routes(client, db, make_user, ops_headers):
+    """
+    /metrics memuat latensi, jumlah statement SQL, dan waktu DB per rute
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user)
+    client.get("/diagrams/", headers=headers)
+    client.get(f"/diagrams/{diagram.id}/export", headers=headers)
+
+    response = client.get("/metrics", headers=ops_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/diagrams/",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/diagrams/{diagram_id}/export",le="+Inf"}' in body
+    assert 'db_statements_per_request_count{method="GET",route="/diagrams/"}' in body
+    assert 'db_pool_checkout_wait_milliseconds_count{engine="sync"}' in body
+
+
+def test_operator_endpoints_reject_users(client, make_user, monkeypatch):
+    """
+    /metrics dan endpoint /internal menolak token pengguna biasa, dan mati tanpa OPS_TOKEN
+    """
+    _, headers = make_user()
+    paths = ["/metrics", "/internal/db-pool", "/internal/principal-cache", "/internal/permission-cache"]
+
+    monkeypatch.setattr(auth, "OPS_TOKEN", None)
+    assert [client.get(path, headers=headers).status_code for path in paths] == [403] * 4
+    monkeypatch.setattr(auth, "OPS_TOKEN", "token-operator")
+    assert [client.get(path, headers=headers).status_code for path in paths] == [403] * 4
+    assert [client.get(path).status_code for path in paths] == [403] * 4
+    assert client.get("/internal/db-pool", headers={"Authorization": "Bearer token-operator"}).status_code == 200
+
+
+def test_statement_shape_ignores_parameter_list_length():
+    """
+    Daftar parameter IN dengan panjang berbeda dianggap bentuk yang sama
+    """
+    shape = request_metrics.statement_shape
+    assert shape("SELECT * FROM t WHERE id IN (?, ?, ?)") == shape("SELECT * FROM t WHERE id IN (?)")
+    assert shape("SELECT * FROM t WHERE id IN (%(id_1_1)s, %(id_1_2)s)") == "SELECT * FROM t WHERE id IN (?)"
+
+
+def test_repeated_statement_detector(db, make_user, monkeypatch):
+    """
+    Mode deteksi N+1 menolak statement yang sama lebih dari batas
+    """
+    user, _ = make_user()
+    monkeypatch.setattr(request_metrics, "SQL_REPEAT_LIMIT", 2)
+    monkeypatch.setattr(request_metrics, "SQL_REPEAT_ACTION", "raise")
+
+    with request_metrics.track("tes") as stats:
+        for _ in range(2):
+            db.scalar(select(models.User).where(models.User.id == user.id))
+        with pytest.raises(request_metrics.RepeatedQueryError):
+            db.scalar(select(models.User).where(models.User.id == user.id))
+
+    assert stats.statements == 3
+
+
+def test_read_diagrams_has_no_repeated_statements(client, db, make_user, monkeypatch):
+    """
+    Daftar diagram lengkap tidak memicu detektor N+1 walau banyak tabel
+    """
+    user, headers = make_user()
+    for i in range(5):
+        seed_diagram(db, user, name=f"Diagram {i}", tables=5, columns=3)
+    monkeypatch.setattr(request_metrics, "SQL_REPEAT_LIMIT", 1)
+    monkeypatch.setattr(request_metrics, "SQL_REPEAT_ACTION", "raise")
+
+    response = client.get("/diagrams/", headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.json()) == 5
@@ -0,0 +1,170 @@
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import models
+import outbox
+from email_service import SMTPConnection
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.sessions = 0
+        self.messages = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content.decode()))
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_port():
+    return free_port()
+
+
+@pytest.fixture
+def smtp_server(smtp_port):
+    """
+    Server SMTP lokal pengganti (aiosmtpd) yang merekam pesan masuk
+    """
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=smtp_port)
+    controller.start()
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def sender(smtp_port):
+    outbox_sender = outbox.OutboxSender(
+        connection_factory=lambda: SMTPConnection(
+            "127.0.0.1", smtp_port, starttls=False, sender="noreply@example.com", timeout=5
+        ),
+        batch_size=10,
+        max_attempts=3
+    )
+    yield outbox_sender
+    outbox_sender.close()
+
+
+def enqueue(db, count):
+    for i in range(count):
+        outbox.enqueue_email(db, f"penerima{i}@example.com", f"Subjek {i}", f"Isi {i}")
+    db.commit()
+
+
+def rows(db):
+    db.expire_all()
+    return db.query(models.EmailOutbox).order_by(models.EmailOutbox.id).all()
+
+
+def test_sender_batches_over_one_connection(db, smtp_server, sender):
+    """
+    Satu koneksi SMTP dipakai untuk seluruh batch
+    """
+    enqueue(db, 5)
+
+    assert sender.run_once() == 5
+    assert sender.run_once() == 0
+
+    assert smtp_server.sessions == 1
+    assert [rcpt for rcpt, _ in smtp_server.messages] == [[f"penerima{i}@example.com"] for i in range(5)]
+    assert all(row.status == models.OutboxStatus.SENT and row.sent_at for row in rows(db))
+
+
+def test_invitation_email_delivered_from_outbox(client, db, make_user, smtp_server, sender):
+    """
+    Undangan hanya menulis ke outbox; pengirim latar belakang mengirimkannya
+    """
+    from helpers import seed_diagram
+
+    owner, headers = make_user()
+    diagram = seed_diagram(db, owner, name="Gudang", tables=0)
+    client.post(
+        f"/diagrams/{diagram.id}/invite",
+        json={"diagram_id": diagram.id, "invited_email": "baru@example.com"},
+        headers=headers
+    )
+    assert smtp_server.messages == []
+
+    sender.run_once()
+
+    (recipients, content), = smtp_server.messages
+    assert recipients == ["baru@example.com"]
+    assert "Gudang" in content
+
+
+def test_sender_retries_with_backoff(db, smtp_port, sender):
+    """
+    Server tidak tersedia: pesan dijadwalkan ulang, lalu terkirim setelah pulih
+    """
+    enqueue(db, 3)
+
+    assert sender.run_once() == 1
+    first, *rest = rows(db)
+    assert first.attempts == 1 and first.last_error
+    # Sisa batch dikembalikan tanpa menambah percobaan
+    assert [row.attempts for row in rest] == [0, 0]
+    assert all(row.next_attempt_at > datetime.utcnow() for row in rows(db))
+    assert sender.run_once() == 0
+
+    db.query(models.EmailOutbox).update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=smtp_port)
+    controller.start()
+    try:
+        assert sender.run_once() == 3
+    finally:
+        controller.stop()
+
+    assert len(handler.messages) == 3
+    assert [row.attempts for row in rows(db)] == [2, 1, 1]
+
+
+def test_sender_gives_up_after_max_attempts(db, sender):
+    """
+    Setelah batas percobaan, pesan ditandai gagal dan tidak diambil lagi
+    """
+    enqueue(db, 1)
+
+    for _ in range(sender.max_attempts):
+        assert sender.run_once() == 1
+        db.query(models.EmailOutbox).update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+
+    assert rows(db)[0].status == models.OutboxStatus.FAILED
+    assert sender.run_once() == 0
+
+
+def test_sender_resumes_abandoned_claim(db, smtp_server, sender):
+    """
+    Batch yang diklaim pengirim yang mati diambil lagi setelah klaim habis
+    """
+    enqueue(db, 2)
+    assert len(sender.claim_batch()) == 2
+    assert sender.run_once() == 0
+
+    # Klaim kedaluwarsa
+    db.query(models.EmailOutbox).update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    restarted = outbox.OutboxSender(connection_factory=sender.connection_factory)
+    try:
+        assert restarted.run_once() == 2
+    finally:
+        restarted.close()
+
+    assert len(smtp_server.messages) == 2
@@ -0,0 +1,175 @@
+from helpers import seed_diagram
+
+
+def create_tables(client, headers, diagram_id, tables):
+    response = client.post(f"/diagrams/{diagram_id}/tables:batch", json=tables, headers=headers)
+    assert response.status_code == 200
+
+
+def column(name, data_type="INTEGER", primary_key=False, nullable=True):
+    return {
+        "name": name,
+        "data_type": data_type,
+        "is_primary_key": primary_key,
+        "is_nullable": nullable
+    }
+
+
+def test_migration_script_between_diagrams(client, db, make_user):
+    """
+    Tes skrip ALTER antara dua diagram
+    """
+    user, headers = make_user()
+    base = seed_diagram(db, user, name="Lama", tables=0)
+    target = seed_diagram(db, user, name="Baru", tables=0)
+    create_tables(client, headers, base.id, [
+        {"name": "sama", "columns": [column("id", primary_key=True, nullable=False)]},
+        {"name": "pengguna", "columns": [
+            column("id", primary_key=True, nullable=False),
+            column("nama", "TEXT"),
+            column("usia", "INTEGER"),
+        ]},
+        {"name": "usang", "columns": [column("id")]},
+    ])
+    create_tables(client, headers, target.id, [
+        {"name": "sama", "columns": [column("id", primary_key=True, nullable=False)]},
+        {"name": "pengguna", "columns": [
+            column("id", primary_key=True, nullable=False),
+            column("nama", "VARCHAR(100)", nullable=False),
+            column("email", "TEXT"),
+        ]},
+        {"name": "pesanan", "columns": [column("id", primary_key=True, nullable=False)]},
+    ])
+
+    response = client.get(f"/diagrams/{target.id}/migration?base_id={base.id}", headers=headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["changed_tables"] == ["pesanan", "pengguna", "usang"]
+    assert body["sql"].splitlines()[:4] == [
+        "CREATE TABLE pesanan (",
+        "    id INTEGER NOT NULL,",
+        "    PRIMARY KEY (id)",
+        ");",
+    ]
+    assert "ALTER TABLE pengguna ALTER COLUMN nama TYPE VARCHAR(100);" in body["sql"]
+    assert "ALTER TABLE pengguna ALTER COLUMN nama SET NOT NULL;" in body["sql"]
+    assert "ALTER TABLE pengguna ADD COLUMN email TEXT;" in body["sql"]
+    assert "ALTER TABLE pengguna DROP COLUMN usia;" in body["sql"]
+    assert "DROP TABLE usang;" in body["sql"]
+    assert "sama" not in body["sql"]
+
+
+def test_migration_script_skips_unchanged_tables(client, db, make_user, query_counter):
+    """
+    Kolom hanya dimuat untuk tabel yang sidik jarinya berbeda
+    """
+    user, headers = make_user()
+    base = seed_diagram(db, user, name="Lama", tables=0)
+    target = seed_diagram(db, user, name="Baru", tables=0)
+    tables = [{"name": f"tabel_{t}", "columns": [column("id")]} for t in range(20)]
+    create_tables(client, headers, base.id, tables)
+    create_tables(client, headers, target.id, tables)
+
+    query_counter.clear()
+    response = client.get(f"/diagrams/{target.id}/migration?base_id={base.id}", headers=headers)
+
+    assert response.json()["sql"] == ""
+    assert not any("FROM columns" in statement for statement in query_counter)
+
+
+def test_migration_script_requires_access(client, db, make_user):
+    """
+    Diagram privat milik orang lain tidak boleh dibandingkan
+    """
+    user, headers = make_user()
+    other, _ = make_user("lainnya")
+    mine = seed_diagram(db, user, tables=0)
+    private = seed_diagram(db, other, tables=0)
+
+    response = client.get(f"/diagrams/{mine.id}/migration?base_id={private.id}", headers=headers)
+
+    assert response.status_code == 404
+
+
+def relate(client, headers, diagram_id, source_table, target_table):
+    # Kolom kedua tabel sumber merujuk kolom pertama tabel tujuan
+    tables = {table["name"]: table for table in client.get(f"/diagrams/{diagram_id}/tables", headers=headers).json()}
+    response = client.post(
+        f"/diagrams/{diagram_id}/relationships",
+        json={
+            "source_column_id": tables[source_table]["columns"][1]["id"],
+            "target_column_id": tables[target_table]["columns"][0]["id"]
+        },
+        headers=headers
+    )
+    assert response.status_code == 200
+
+
+SCHEMA = [
+    {"name": "pelanggan", "columns": [column("id", primary_key=True, nullable=False)]},
+    {"name": "pesanan", "columns": [column("id", primary_key=True, nullable=False), column("pelanggan_id")]},
+]
+FOREIGN_KEY = (
+    "ALTER TABLE pesanan ADD CONSTRAINT fk_pesanan_pelanggan_id "
+    "FOREIGN KEY (pelanggan_id) REFERENCES pelanggan (id);"
+)
+
+
+def test_migration_script_includes_foreign_keys(client, db, make_user):
+    """
+    Relasi baru atau yang dihapus menghasilkan ADD/DROP CONSTRAINT walau kolomnya sama
+    """
+    user, headers = make_user()
+    base = seed_diagram(db, user, name="Lama", tables=0)
+    target = seed_diagram(db, user, name="Baru", tables=0)
+    create_tables(client, headers, base.id, SCHEMA)
+    create_tables(client, headers, target.id, SCHEMA)
+    relate(client, headers, target.id, "pesanan", "pelanggan")
+
+    body = client.get(f"/diagrams/{target.id}/migration?base_id={base.id}", headers=headers).json()
+    assert (body["sql"], body["changed_tables"]) == (FOREIGN_KEY, ["pesanan"])
+    body = client.get(f"/diagrams/{base.id}/migration?base_id={target.id}", headers=headers).json()
+    assert body["sql"] == "ALTER TABLE pesanan DROP CONSTRAINT fk_pesanan_pelanggan_id;"
+
+
+def test_migration_script_between_revisions(client, db, make_user):
+    """
+    Skrip migrasi antara dua revisi diagram yang sama, dibangun dari riwayat
+    """
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=0)
+    create_tables(client, headers, diagram.id, SCHEMA[:1])
+    create_tables(client, headers, diagram.id, SCHEMA[1:])
+    relate(client, headers, diagram.id, "pesanan", "pelanggan")
+
+    # Diagram tanpa riwayat sebelumnya mendapat snapshot dasar di revisi 2
+    url = f"/diagrams/{diagram.id}/migration"
+    body = client.get(url, params={"base_revision": 2}, headers=headers).json()
+    assert (body["base_revision"], body["target_revision"]) == (2, 4)
+    assert body["changed_tables"] == ["pesanan"]
+    assert body["sql"].startswith("CREATE TABLE pesanan (")
+    assert body["sql"].endswith(FOREIGN_KEY)
+
+    body = client.get(url, params={"base_revision": 4, "target_revision": 2}, headers=headers).json()
+    # Constraint ikut terhapus bersama tabelnya
+    assert body["sql"] == "DROP TABLE pesanan;"
+    assert client.get(url, params={"base_revision": 1}, headers=headers).status_code == 404
+    assert client.get(url, headers=headers).status_code == 400
+
+
+def test_migration_script_rejects_duplicate_table_names(client, db, make_user):
+    """
+    Dua tabel bernama sama tidak bisa dicocokkan, jadi ditolak dengan 409
+    """
+    user, headers = make_user()
+    base = seed_diagram(db, user, name="Lama", tables=0)
+    target = seed_diagram(db, user, name="Baru", tables=0)
+    create_tables(client, headers, base.id, SCHEMA[:1])
+    create_tables(client, headers, target.id, SCHEMA[:1] + SCHEMA[:1])
+
+    url = f"/diagrams/{target.id}/migration"
+    response = client.get(url, params={"base_id": base.id}, headers=headers)
+    assert response.status_code == 409
+    assert "pelanggan" in response.json()["detail"]
+    assert client.get(url, params={"base_revision": 2}, headers=headers).status_code == 409
@@ -0,0 +1,97 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+import models
+import search
+
+
+def add_table(db, diagram, name, columns):
+    table = models.Table(name=name, diagram_id=diagram.id, x_position=0, y_position=0)
+    db.add(table)
+    db.flush()
+    db.add_all([models.Column(name=column, data_type="INTEGER", table_id=table.id) for column in columns])
+    db.commit()
+    return table
+
+
+def hits(client, headers, q, **params):
+    response = client.get("/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [(hit["kind"], hit["name"], hit["diagram_name"]) for hit in response.json()]
+
+
+def test_search_is_fuzzy_ranked_and_permission_filtered(client, db, make_user):
+    """
+    Pencarian toleran terhadap prefiks dan salah ketik, diurutkan menurut skor,
+    dan hanya menampilkan diagram yang boleh dilihat pengguna
+    """
+    user, headers = make_user()
+    other, _ = make_user("lain")
+
+    own = models.Diagram(name="Penjualan", owner_id=user.id)
+    private = models.Diagram(name="Rahasia", owner_id=other.id)
+    public = models.Diagram(name="Publik", owner_id=other.id, is_public=True)
+    shared = models.Diagram(name="Dibagikan", owner_id=other.id)
+    db.add_all([own, private, public, shared])
+    db.flush()
+    db.add(models.DiagramCollaboration(
+        diagram_id=shared.id, user_id=other.id, permission_level=models.PermissionLevel.VIEW
+    ))
+    db.add(models.DiagramCollaboration(
+        diagram_id=shared.id, user_id=user.id, permission_level=models.PermissionLevel.VIEW
+    ))
+    db.commit()
+    add_table(db, own, "customers", ["customer_id", "nama"])
+    add_table(db, private, "customer_secret", ["customer_id"])
+    add_table(db, public, "orders", ["customer_id", "total"])
+    add_table(db, shared, "invoices", ["customer_ref"])
+
+    # Salah ketik masih ditemukan; kata utuh "customer" mendapat skor lebih tinggi
+    assert hits(client, headers, "custmer") == [
+        ("column", "customer_id", "Penjualan"),
+        ("column", "customer_id", "Publik"),
+        ("column", "customer_ref", "Dibagikan"),
+        ("table", "customers", "Penjualan"),
+    ]
+    # Prefiks, dibatasi per jenis dan dipaginasi
+    assert hits(client, headers, "cust", kind="column", skip=1, limit=1) == [
+        ("column", "customer_id", "Publik"),
+    ]
+    assert hits(client, headers, "penjual") == [("diagram", "Penjualan", "Penjualan")]
+    assert hits(client, headers, "rahasia") == []
+    assert hits(client, headers, "secret") == []
+
+    response = client.get("/search", params={"q": "id"}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_search_index_follows_writes(client, db, make_user):
+    """
+    Indeks FTS5 di SQLite ikut berubah saat nama diubah atau baris dihapus
+    """
+    user, headers = make_user()
+    diagram = models.Diagram(name="Gudang", owner_id=user.id)
+    db.add(diagram)
+    db.commit()
+    table = add_table(db, diagram, "products", ["sku"])
+
+    table.name = "inventory"
+    db.commit()
+    assert hits(client, headers, "products") == []
+    assert hits(client, headers, "inventory") == [("table", "inventory", "Gudang")]
+
+    db.query(models.Column).filter_by(table_id=table.id).delete()
+    db.commit()
+    assert hits(client, headers, "sku") == []
+
+
+def test_postgresql_search_uses_trigram_operator():
+    """
+    Di PostgreSQL pencarian memakai operator <% yang dilayani indeks GIN pg_trgm
+    """
+    sql = str(search.search_query("postgresql", "customer", 1).compile(dialect=postgresql.dialect()))
+
+    assert "<%" in sql and "word_similarity" in sql
+    assert "MATCH" not in sql
+    index = next(i for i in models.Column.__table__.indexes if i.name == "ix_columns_name_trgm")
+    assert "USING gin (name gin_trgm_ops)" in str(CreateIndex(index).compile(dialect=postgresql.dialect()))
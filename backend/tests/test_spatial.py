@@ -0,0 +1,74 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+import models
+import spatial
+
+
+def view(client, headers, diagram_id, bbox):
+    response = client.get(f"/diagrams/{diagram_id}/tables", params={"bbox": bbox}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [table["name"] for table in response.json()]
+
+
+def test_position_grid_matches_exact_filter():
+    """
+    Grid mengembalikan tabel yang sama dengan pemeriksaan langsung, termasuk koordinat negatif dan tepi kotak
+    """
+    rows = [(number, (number * 37) % 5000 - 1000, (number * 91) % 4000 - 500) for number in range(1, 400)]
+    grid = spatial.PositionGrid(rows + [(400, None, None)], cell_size=256)
+
+    for box in [spatial.Box(0, 0, 700, 900), spatial.Box(-1000, -500, -1000, -500), spatial.Box(-1e9, -1e9, 1e9, 1e9)]:
+        assert grid.within(box) == [
+            table_id for table_id, x, y in rows if box.x0 <= x <= box.x1 and box.y0 <= y <= box.y1
+        ]
+    assert spatial.parse_box("10,20,0,5") == spatial.Box(0, 5, 10, 20)
+
+
+def test_tables_in_viewport_follow_moves(client, make_user):
+    """
+    GET /tables?bbox= hanya mengembalikan tabel di dalam viewport beserta kolomnya, dan mengikuti perpindahan tabel
+    """
+    _, headers = make_user()
+    diagram_id = client.post("/diagrams/", json={"name": "Peta"}, headers=headers).json()["id"]
+    ids = {}
+    for name, x, y in [("a", 0, 0), ("b", 500, 300), ("c", 5000, 5000)]:
+        ids[name] = client.post(
+            f"/diagrams/{diagram_id}/tables/",
+            json={"name": name, "x_position": x, "y_position": y, "columns": [{"name": "id", "data_type": "INTEGER"}]},
+            headers=headers
+        ).json()["id"]
+
+    response = client.get(f"/diagrams/{diagram_id}/tables", params={"bbox": "0,0,1000,1000"}, headers=headers)
+    assert [table["name"] for table in response.json()] == ["a", "b"]
+    assert [column["name"] for column in response.json()[0]["columns"]] == ["id"]
+    assert view(client, headers, diagram_id, "4000,4000,6000,6000") == ["c"]
+    assert view(client, headers, diagram_id, "-10,-10,-1,-1") == []
+    assert [table["name"] for table in client.get(f"/diagrams/{diagram_id}/tables", headers=headers).json()] == [
+        "a", "b", "c"
+    ]
+
+    # Perpindahan lewat PATCH /positions langsung terlihat di kueri berikutnya
+    client.patch(
+        f"/diagrams/{diagram_id}/positions", json=[{"table_id": ids["c"], "x": 100, "y": 100}], headers=headers
+    )
+    assert view(client, headers, diagram_id, "0,0,1000,1000") == ["a", "b", "c"]
+    assert view(client, headers, diagram_id, "4000,4000,6000,6000") == []
+
+    assert client.get(
+        f"/diagrams/{diagram_id}/tables", params={"bbox": "0,0,10"}, headers=headers
+    ).status_code == 400
+    _, stranger = make_user("lain")
+    assert client.get(f"/diagrams/{diagram_id}/tables", headers=stranger).status_code == 404
+
+
+def test_postgresql_viewport_uses_gist_index():
+    """
+    Di PostgreSQL kueri viewport memakai operator <@ yang dilayani indeks GiST posisi tabel
+    """
+    index = next(i for i in models.Table.__table__.indexes if i.name == "ix_tables_diagram_position")
+    assert "USING gist (diagram_id, point(x_position, y_position))" in str(
+        CreateIndex(index).compile(dialect=postgresql.dialect())
+    )
+    sql = str(spatial.in_box(spatial.Box(0, 0, 10, 10)).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("point(tables.x_position, tables.y_position) <@ box(")
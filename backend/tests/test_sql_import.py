@@ -0,0 +1,140 @@
+import io
+
+import bulk
+import models
+import sql_import
+from fingerprints import column_fingerprint, table_fingerprint
+from helpers import seed_diagram
+
+PG_DUMP = """--
+-- PostgreSQL database dump
+--
+SET statement_timeout = 0;
+SELECT pg_catalog.set_config('search_path', '', false);
+
+CREATE FUNCTION public.touch() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$ BEGIN NEW.updated := now(); RETURN NEW; END; $$;
+
+CREATE TABLE public.pelanggan (
+    id integer NOT NULL,
+    "Nama Lengkap" character varying(255) DEFAULT 'not null; bukan' NOT NULL,
+    saldo numeric(10, 2) DEFAULT 0.0, -- komentar; sebaris
+    dibuat timestamp with time zone,
+    CONSTRAINT saldo_positif CHECK ((saldo >= (0)::numeric))
+);
+
+CREATE TABLE IF NOT EXISTS public.pesanan (
+    id bigint PRIMARY KEY,
+    pelanggan_id integer REFERENCES public.pelanggan(id)
+);
+
+ALTER TABLE ONLY public.pelanggan
+    ADD CONSTRAINT pelanggan_pkey PRIMARY KEY (id);
+"""
+
+
+def test_iter_statements_across_chunk_boundaries():
+    """
+    Pemisahan statement tidak bergantung pada ukuran potongan input
+    """
+    whole = list(sql_import.iter_statements([PG_DUMP]))
+    for size in (1, 2, 5, 64):
+        chunks = [PG_DUMP[i:i + size] for i in range(0, len(PG_DUMP), size)]
+        assert list(sql_import.iter_statements(chunks)) == whole
+    assert len(whole) == 6
+
+
+def test_parse_create_table():
+    """
+    Tes parsing CREATE TABLE termasuk tipe berparameter dan nama berkutip
+    """
+    name, columns = sql_import.parse_create_table(
+        'CREATE TABLE public."Akun" (id int, "Nama" varchar(20) NOT NULL, '
+        'nilai numeric(10, 2) DEFAULT \'NOT NULL\', PRIMARY KEY (id))'
+    )
+
+    assert name == "Akun"
+    assert [(c.name, c.data_type, c.is_primary_key, c.is_nullable) for c in columns] == [
+        ("id", "int", True, False),
+        ("Nama", "varchar(20)", False, False),
+        ("nilai", "numeric(10, 2)", False, True),
+    ]
+
+
+def test_import_sql_dump(client, db, make_user, monkeypatch):
+    """
+    Tes impor file .sql ke diagram
+    """
+    monkeypatch.setattr(bulk, "BATCH_CHUNK_ROWS", 2)
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=0)
+
+    response = client.post(
+        f"/diagrams/{diagram.id}/import",
+        files={"file": ("skema.sql", io.BytesIO(PG_DUMP.encode()), "application/sql")},
+        headers=headers
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"table_count": 2, "column_count": 6}
+
+    export = client.get(f"/diagrams/{diagram.id}/export", headers=headers).json()
+    assert export["sql_ddl"] == "\n".join([
+        "CREATE TABLE pelanggan (",
+        "    id integer NOT NULL,",
+        "    Nama Lengkap character varying(255) NOT NULL,",
+        "    saldo numeric(10, 2),",
+        "    dibuat timestamp with time zone,",
+        "    PRIMARY KEY (id)",
+        ");",
+        "",
+        "CREATE TABLE pesanan (",
+        "    id bigint NOT NULL,",
+        "    pelanggan_id integer,",
+        "    PRIMARY KEY (id)",
+        ");",
+    ])
+    # Sidik jari sudah mencakup PRIMARY KEY dari ALTER TABLE
+    table = db.query(models.Table).filter(models.Table.name == "pelanggan").one()
+    column_hashes = [
+        column_fingerprint(c.name, c.data_type, c.is_primary_key, c.is_nullable)
+        for c in table.columns
+    ]
+    assert [c.fingerprint for c in table.columns] == column_hashes
+    assert table.fingerprint == table_fingerprint(table.name, column_hashes)
+
+
+def test_import_keys_primary_keys_by_schema(client, db, make_user, monkeypatch, query_counter):
+    """
+    PRIMARY KEY dari ALTER TABLE hanya berlaku untuk tabel di skema yang sama,
+    tabel baru diletakkan di bawah tabel yang sudah ada, dan impor dipotong per jumlah tabel
+    """
+    monkeypatch.setattr(bulk, "BATCH_CHUNK_TABLES", 1)
+    user, headers = make_user()
+    diagram = seed_diagram(db, user, tables=1)
+    db.query(models.Table).filter(models.Table.diagram_id == diagram.id).update({"y_position": 500})
+    db.commit()
+    dump = "\n".join([
+        "CREATE TABLE a.akun (id integer NOT NULL);",
+        'CREATE TABLE "b".akun (id integer NOT NULL);',
+        "ALTER TABLE ONLY a.akun ADD CONSTRAINT akun_pkey PRIMARY KEY (id);",
+    ])
+
+    query_counter.clear()
+    response = client.post(
+        f"/diagrams/{diagram.id}/import",
+        files={"file": ("skema.sql", io.BytesIO(dump.encode()), "application/sql")},
+        headers=headers
+    )
+
+    assert response.status_code == 200
+    assert len([s for s in query_counter if s.startswith("INSERT INTO tables")]) == 2
+    imported = db.query(models.Table).filter(
+        models.Table.diagram_id == diagram.id, models.Table.name == "akun"
+    ).order_by(models.Table.id).all()
+    assert [t.columns[0].is_primary_key for t in imported] == [True, False]
+    assert [(t.x_position, t.y_position) for t in imported] == [
+        (0, 500 + sql_import.GRID_SPACING),
+        (sql_import.GRID_SPACING, 500 + sql_import.GRID_SPACING),
+    ]